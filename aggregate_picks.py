@@ -1,45 +1,34 @@
 import pandas as pd
-import joblib
 import os
 import numpy as np
 from datetime import datetime, timedelta
-from config import get_supabase_client
+from storage import get_storage
+from feature_pipeline import build_features
+from model_bundle import BUNDLE_PATH, ModelBundle
+from pick_rules import DEFAULT_SPREAD, DEFAULT_TOTAL, fill_lines, spread_picks, total_picks
 
 # ==========================================
 # 設定：只預測未來 1 天 (配合 CI/CD 每日執行)
 # ==========================================
-PREDICT_DAYS = 1 
+# 需要回補多天時可用環境變數 PREDICT_DAYS 調整 (整批一次預測)
+PREDICT_DAYS = int(os.getenv("PREDICT_DAYS", "1"))
 
 # 🕵️‍♂️ 上帝模式
 CHEAT_MODE = os.getenv("CHEAT_MODE", "false").lower() == "true"
 
-print(f"📂 正在載入 V8.0 AI 模型... (Cheat Mode: {CHEAT_MODE})")
-try:
-    model_win = joblib.load('model_win.pkl')
-    model_spread = joblib.load('model_spread.pkl')
-    model_total = joblib.load('model_total.pkl')
-    features_spread = joblib.load('features_spread.pkl')
-    features_total = joblib.load('features_total.pkl')
-    
-    # 嘗試載入窗口設定，確保與訓練時一致
-    try:
-        ROLLING_WINDOWS = joblib.load('rolling_config.pkl')
-        print(f"   ⚙️ 載入動態窗口設定: {ROLLING_WINDOWS}")
-    except:
-        ROLLING_WINDOWS = [5, 10, 30] # 預設值
-        print(f"   ⚠️ 未找到 rolling_config.pkl，使用預設窗口: {ROLLING_WINDOWS}")
-
-except Exception as e:
-    print(f"❌ 模型載入失敗: {e}")
-    exit()
+_bundle = None
 
-# 基礎欄位 (Raw Stats) - 對應訓練時的 BASE_STATS_COLS
-BASE_STATS_COLS = [
-    'fieldGoalsPercentage', 'threePointersPercentage', 'freeThrowsPercentage',
-    'reboundsTotal', 'assists', 'steals', 'blocks', 'turnovers', 
-    'plusMinusPoints', 'pointsInThePaint', 'teamScore', 
-    'eFG_Percentage', 'TS_Percentage', 'RestDays'
-]
+def get_bundle():
+    """
+    延遲載入模型包：第一次需要時才讀 manifest (並驗證 schema)，
+    各模型的 Booster 也只在 bundle.model(...) 被呼叫時才載入。
+    """
+    global _bundle
+    if _bundle is None:
+        print(f"📂 正在載入 V8.0 AI 模型包: {BUNDLE_PATH} (Cheat Mode: {CHEAT_MODE})")
+        _bundle = ModelBundle.load(BUNDLE_PATH)
+        print(f"   ⚙️ 載入動態窗口設定: {_bundle.windows}")
+    return _bundle
 
 # ==========================================
 # 🧠 AI 洞察生成核心 (Insight Generator)
@@ -105,125 +94,55 @@ def generate_insight(rec_code, opp_code, is_home_pick, features_df):
     return full_text
 
 def get_latest_stats():
-    print("🔄 [V8.0] 從 CSV 讀取並計算多重窗口統計...")
+    print("🔄 [V8.0] 讀取每隊最新多重窗口統計...")
     try:
-        # 1. 讀取 CSV
-        req_cols = [
-            'teamId', 'gameDateTimeEst', 'win', 'teamScore', 
-            'fieldGoalsMade', 'fieldGoalsAttempted', 'threePointersMade', 
-            'freeThrowsAttempted',
-            'fieldGoalsPercentage', 'threePointersPercentage', 'freeThrowsPercentage',
-            'reboundsTotal', 'assists', 'steals', 'blocks', 'turnovers', 
-            'plusMinusPoints', 'pointsInThePaint'
-        ]
-        
-        # 使用 lambda 避免欄位不存在報錯
-        df = pd.read_csv('data/TeamStatistics.csv', usecols=lambda c: c in req_cols, low_memory=False)
-        
-        # 2. 日期處理
-        df['gameDateTimeEst'] = df['gameDateTimeEst'].astype(str).str.slice(0, 10)
-        df['gameDateTimeEst'] = pd.to_datetime(df['gameDateTimeEst'], utc=True, errors='coerce')
-        if df['gameDateTimeEst'].isnull().any():
-            df = df.dropna(subset=['gameDateTimeEst'])
-
-        # 3. 排序
-        df = df.sort_values(['teamId', 'gameDateTimeEst'])
-        
-        # 4. 特徵工程 (與 Train 保持一致)
-        df['threePointersMade'] = df['threePointersMade'].fillna(0)
-        df['fieldGoalsAttempted'] = df['fieldGoalsAttempted'].replace(0, np.nan)
-        
-        df['eFG_Percentage'] = (df['fieldGoalsMade'] + 0.5 * df['threePointersMade']) / df['fieldGoalsAttempted']
-        df['TS_Percentage'] = df['teamScore'] / (2 * (df['fieldGoalsAttempted'] + 0.44 * df['freeThrowsAttempted']))
-        df['eFG_Percentage'] = df['eFG_Percentage'].fillna(0)
-        df['TS_Percentage'] = df['TS_Percentage'].fillna(0)
-
-        df['prev_game_date'] = df.groupby('teamId')['gameDateTimeEst'].shift(1)
-        df['RestDays'] = (df['gameDateTimeEst'] - df['prev_game_date']).dt.days
-        df['RestDays'] = df['RestDays'].fillna(3).clip(upper=7)
-        
-        # 數值化勝負 (重要：先移除空值再轉換，避免報錯)
-        if df['win'].isnull().any():
-            df = df.dropna(subset=['win'])
-        df['win_numeric'] = df['win'].astype(int)
-        
-        # 5. 多重滾動平均計算 (的核心變動)
-        cols_to_roll = [c for c in BASE_STATS_COLS if c in df.columns and c != 'RestDays']
-        cols_to_roll.append('RestDays')
-
-        rolled_dfs = []
-        for w in ROLLING_WINDOWS:
-            # 統計數據平均
-            r_stats = df.groupby('teamId', group_keys=False)[cols_to_roll].apply(
-                lambda x: x.rolling(w, min_periods=1).mean()
-            )
-            r_stats.columns = [f'rolling_{w}_{c}' for c in r_stats.columns]
-            
-            # 勝率平均
-            r_win = df.groupby('teamId', group_keys=False)['win_numeric'].apply(
-                lambda x: x.rolling(w, min_periods=1).mean()
-            )
-            r_stats[f'rolling_{w}_win_rate'] = r_win
-            
-            rolled_dfs.append(r_stats)
-            
-        df = pd.concat([df] + rolled_dfs, axis=1)
-        
-        # 取出每支球隊的「最後一筆」數據
-        last = df.groupby('teamId').tail(1)
-        
-        # 只保留 rolling_ 開頭的欄位
-        keep_cols = [c for c in df.columns if 'rolling_' in c]
-        
-        result = {}
-        for _, r in last.iterrows():
-            result[int(r['teamId'])] = {c: r[c] for c in keep_cols}
-            
-        return result
+        # 共用特徵管線 (serving 模式)：只讀取每隊最後 max(windows) 場
+        # 回傳以 teamId 為 index 的緊湊矩陣 (一隊一列)
+        return build_features('serving', get_bundle().windows)
         
     except Exception as e:
         print(f"❌ 讀取 TeamStatistics 失敗: {e}")
-        return {}
+        return None
 
-def prepare_features(h_id, a_id, stats):
-    if h_id not in stats or a_id not in stats: return None, None, None
-    h, a = stats[h_id], stats[a_id]
-    
-    row = {'is_home': 1}
-    
-    # 自動計算所有 available 的 diff 和 sum
-    for key in h.keys():
-        if key in a:
-            row[f"diff_{key}"] = h[key] - a[key]
-            row[f"sum_{key}"] = h[key] + a[key]
-        
-    df = pd.DataFrame([row])
+def prepare_features(h_ids, a_ids, stats):
+    """
+    一次組出多場比賽的特徵矩陣 (每場一列)。
+    回傳：Spread特徵, Total特徵, 原始Diff (皆與 h_ids 順序相同)
+    """
+    h = stats.loc[h_ids].to_numpy()
+    a = stats.loc[a_ids].to_numpy()
     
-    # 補齊特徵欄位 (Alignment)
-    for c in features_spread: 
-        if c not in df.columns: df[c] = 0
-    for c in features_total: 
-        if c not in df.columns: df[c] = 0
+    # 自動計算所有 available 的 diff 和 sum (整批矩陣運算)
+    df = pd.concat([
+        pd.DataFrame({'is_home': np.ones(len(h_ids), dtype=np.int64)}),
+        pd.DataFrame(h - a, columns='diff_' + stats.columns),
+        pd.DataFrame(h + a, columns='sum_' + stats.columns),
+    ], axis=1)
     
-    # 回傳：Spread特徵, Total特徵, 原始Diff
-    return df[features_spread], df[features_total], df
+    # 補齊特徵欄位 (Alignment)，缺少的欄位補 0
+    bundle = get_bundle()
+    X_spr = df.reindex(columns=bundle.features('spread'), fill_value=0)
+    X_tot = df.reindex(columns=bundle.features('total'), fill_value=0)
+    return X_spr, X_tot, df
 
 def run():
-    supabase = get_supabase_client()
+    try:
+        get_bundle()
+    except Exception as e:
+        print(f"❌ 模型載入失敗: {e}")
+        exit()
+
+    storage = get_storage()
     stats = get_latest_stats()
-    if not stats: return
+    if stats is None or stats.empty: return
 
     now = datetime.utcnow()
     end_date = now + timedelta(days=PREDICT_DAYS)
     
     print(f"📅 抓取賽程範圍: {now.strftime('%Y-%m-%d')} 至 {end_date.strftime('%Y-%m-%d')}")
 
-    matches = supabase.table("matches")\
-        .select("*, home_team:teams!matches_home_team_id_fkey(code, nba_team_id), away_team:teams!matches_away_team_id_fkey(code, nba_team_id)")\
-        .gte("date", now.isoformat())\
-        .lt("date", end_date.isoformat())\
-        .order('date')\
-        .execute().data
+    matches = storage.list_matches(date_from=now.isoformat(), date_before=end_date.isoformat(),
+                                   with_teams=True, order='date')
 
     if not matches:
         print("📭 無比賽。")
@@ -232,10 +151,12 @@ def run():
     print(f"🤖 準備掃描 {len(matches)} 場比賽...")
     picks = []
     
+    # 1. 篩選可預測的比賽
+    finished_statuses = ['STATUS_FINAL', 'STATUS_FINISHED', 'Final', 'STATUS_IN_PROGRESS']
+    eligible, h_ids, a_ids = [], [], []
     for m in matches:
         try:
             # 狀態檢查
-            finished_statuses = ['STATUS_FINAL', 'STATUS_FINISHED', 'Final', 'STATUS_IN_PROGRESS']
             is_finished = m.get('status') in finished_statuses
             
             if is_finished and not CHEAT_MODE:
@@ -243,37 +164,55 @@ def run():
 
             h_id = int(m['home_team']['nba_team_id'])
             a_id = int(m['away_team']['nba_team_id'])
+            if h_id not in stats.index or a_id not in stats.index: continue
             
-            X_spr, X_tot, raw_df = prepare_features(h_id, a_id, stats)
-            if X_spr is None: continue
+            eligible.append(m)
+            h_ids.append(h_id)
+            a_ids.append(a_id)
+        except Exception as e:
+            print(f"⚠️ Error {m['id']}: {e}")
 
-            # AI 預測
-            pred_margin = float(model_spread.predict(X_spr)[0]) 
-            pred_total = float(model_total.predict(X_tot)[0])
+    if not eligible:
+        print("✅ 無需更新 (沒有未開賽的比賽)。")
+        return
+
+    # 2. 整批預測：所有比賽一次組成矩陣，每個模型只呼叫一次 predict
+    X_spr, X_tot, raw_df = prepare_features(h_ids, a_ids, stats)
+    # 只載入需要的兩個模型 (勝負模型不會被載入)
+    pred_margins = get_bundle().model('spread').predict(X_spr)
+    pred_totals = get_bundle().model('total').predict(X_tot)
+    print(f"   ⚡ 已批次預測 {len(eligible)} 場比賽")
+    
+    # 3. 整批套用選邊 / 信心規則 (與 replay 回放共用 pick_rules)
+    spreads, totals = fill_lines([m.get('vegas_spread') for m in eligible], [m.get('vegas_total') for m in eligible])
+    rec_is_home, confs = spread_picks(pred_margins, spreads)
+    ou_picks, ou_confs = total_picks(pred_totals, totals)
+    
+    # 4. 逐場組出寫入資料
+    for i, m in enumerate(eligible):
+        try:
+            pred_margin = float(pred_margins[i])
 
-            # 莊家盤口
+            # 莊家盤口 (原始值，寫回 line_info / ou_line)
             vegas_spread = m.get('vegas_spread')
             vegas_total = m.get('vegas_total')
             
-            if vegas_spread is None: vegas_spread = 0.0
-            if vegas_total is None: vegas_total = 225.0
+            if vegas_spread is None: vegas_spread = DEFAULT_SPREAD
+            if vegas_total is None: vegas_total = DEFAULT_TOTAL
 
             # 邏輯核心
-            cutoff = vegas_spread * -1
-            if pred_margin > cutoff: 
+            if rec_is_home[i]: 
                 rec_id = m['home_team_id']
                 rec_code = m['home_team']['code']
                 opp_code = m['away_team']['code']
-                diff = abs(pred_margin - cutoff)
             else:
                 rec_id = m['away_team_id']
                 rec_code = m['away_team']['code']
                 opp_code = m['home_team']['code']
-                diff = abs(pred_margin - cutoff)
 
-            conf = min(50 + int(diff * 4), 95)
-            ou_pick = "OVER" if pred_total > vegas_total else "UNDER"
-            ou_conf = min(50 + int(abs(pred_total - vegas_total) * 3), 90)
+            conf = int(confs[i])
+            ou_pick = str(ou_picks[i])
+            ou_conf = int(ou_confs[i])
 
             is_rec_home = (rec_id == m['home_team_id'])
             my_proj_margin = pred_margin if is_rec_home else -pred_margin 
@@ -288,7 +227,7 @@ def run():
                 rec_code, 
                 opp_code,
                 is_rec_home,
-                raw_df
+                raw_df.iloc[[i]]
             )
 
             picks.append({
@@ -312,14 +251,14 @@ def run():
     if picks:
         match_ids = [p['match_id'] for p in picks]
         try:
-            existing = supabase.table("aggregated_picks").select("id, match_id").in_("match_id", match_ids).execute().data
+            existing = storage.picks_for_matches(match_ids)
             existing_map = {item['match_id']: item['id'] for item in existing}
             
             for p in picks:
                 if p['match_id'] in existing_map:
                     p['id'] = existing_map[p['match_id']]
             
-            supabase.table("aggregated_picks").upsert(picks).execute()
+            storage.upsert_picks(picks)
             print(f"✅ 完成！已更新 {len(picks)} 筆未開賽預測。")
         except Exception as e:
             print(f"❌ 寫入失敗: {e}")
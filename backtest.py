@@ -0,0 +1,209 @@
+import os
+import time
+import shutil
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from sklearn.metrics import accuracy_score, mean_absolute_error
+from train_model import (
+    load_and_clean_data, prepare_training_data, TRAIN_FEATURES_SPREAD, TRAIN_FEATURES_TOTAL,
+    BEST_PARAMS_WIN, BEST_PARAMS_SPREAD, BEST_PARAMS_TOTAL,
+)
+from train_scheduler import seed_for, shared_dir
+from feature_matrix import get_matrix, clear_matrices, fit_booster
+from grade_picks import grade_spread, grade_total
+from pick_rules import spread_picks, total_picks
+
+# ==========================================
+# Walk-Forward 回測 (逐季滑動)
+# 以前 N 季訓練、下一季測試，依序往後滑動。
+# 滾動特徵本身就是 shift 過的 (只用賽前資料)，所以整份特徵只從快取讀一次，
+# 每個 fold 只是不同的列切片，不需要重算。
+# ==========================================
+TRAIN_SEASONS = int(os.environ.get("BACKTEST_TRAIN_SEASONS", 3))   # 訓練窗口 (季數)
+N_SEEDS = int(os.environ.get("BACKTEST_SEEDS", 1))                 # 每個 fold 的種子數 (正式模型為 5)
+N_WORKERS = int(os.environ.get("BACKTEST_WORKERS", os.cpu_count() or 1))
+# 歷史盤口 (選填)：gameId, vegas_spread (主隊讓分), vegas_total；有才計算 ATS / 大小分命中率
+LINES_CSV = os.environ.get("BACKTEST_LINES", "data/historical_lines.csv")
+OUTPUT_CSV = os.environ.get("BACKTEST_OUTPUT", "data/backtest_folds.csv")
+
+# worker 以 spawn 啟動：回測需要的欄位在主程序寫成一份 float64 矩陣 (memmap)，
+# 各 worker 在 initializer 唯讀開啟，不經 pickle 複製
+_data = None        # 2D memmap (列 = 比賽，欄 = _columns)
+_columns = None     # 欄名 -> 欄位索引
+_features = None    # {'spread': [...], 'total': [...]}
+
+
+def season_of(dates):
+    """NBA 球季：10 月開季，8 月以後算新球季 (2023-10 ~ 2024-06 -> 2023)。"""
+    dates = pd.to_datetime(dates)
+    return np.where(dates.dt.month >= 8, dates.dt.year, dates.dt.year - 1)
+
+
+def load_lines(path=LINES_CSV):
+    if not path or not os.path.exists(path):
+        print(f"   ℹ️ 找不到歷史盤口 ({path})，只計算準確率 / MAE")
+        return None
+    lines = pd.read_csv(path, usecols=['gameId', 'vegas_spread', 'vegas_total'])
+    print(f"   📒 載入歷史盤口 {len(lines)} 場: {path}")
+    return lines.drop_duplicates('gameId')
+
+
+def build_folds(seasons, train_seasons=TRAIN_SEASONS):
+    """[(測試季, [訓練季...]), ...]"""
+    unique = sorted(set(seasons))
+    return [(s, unique[i - train_seasons:i]) for i, s in enumerate(unique) if i >= train_seasons]
+
+
+def hit_rate(outcomes):
+    """命中率 = WIN / (WIN + LOSS)，PUSH 不計。"""
+    outcomes = np.asarray(outcomes)
+    decided = np.sum(outcomes != 'PUSH')
+    return float(np.sum(outcomes == 'WIN') / decided) if decided else np.nan
+
+
+def _init_worker(path, columns, features):
+    global _data, _columns, _features
+    _data = np.load(path, mmap_mode='r')
+    _columns = {name: i for i, name in enumerate(columns)}
+    _features = features
+
+
+def _col(rows, name):
+    return np.asarray(_data[rows, _columns[name]])
+
+
+def _fit_predict(feature_set, params, kind, train, test, y_col, n_threads):
+    """多個種子平均 (同正式集成)；矩陣在同一 fold 內跨目標共用。train / test 為列索引。"""
+    idx = [_columns[f] for f in _features[feature_set]]
+    dtrain = get_matrix(feature_set, 'train', lambda: _data[np.ix_(train, idx)], feature_names=_features[feature_set])
+    dtest = get_matrix(feature_set, 'test', lambda: _data[np.ix_(test, idx)], ref=dtrain,
+                       feature_names=_features[feature_set])
+    label = _col(train, y_col)
+    preds = [
+        fit_booster(dict(params, random_state=seed_for(i), n_jobs=n_threads), kind, dtrain, label).predict(dtest)
+        for i in range(N_SEEDS)
+    ]
+    return np.mean(preds, axis=0)
+
+
+def run_fold(fold, n_threads=1):
+    test_season, train_seasons = fold
+    start = time.perf_counter()
+    clear_matrices()  # 同一個 worker 可能跑多個 fold，矩陣不可沿用
+
+    season = _data[:, _columns['season']]
+    train = np.flatnonzero(np.isin(season, train_seasons))
+    test = np.flatnonzero(season == test_season)
+    target_win, target_margin, target_total = (_col(test, c) for c in ('target_win', 'target_margin', 'target_total'))
+
+    p_win = _fit_predict('spread', BEST_PARAMS_WIN, 'classifier', train, test, 'target_win', n_threads)
+    p_margin = _fit_predict('spread', BEST_PARAMS_SPREAD, 'regressor', train, test, 'target_margin', n_threads)
+    p_total = _fit_predict('total', BEST_PARAMS_TOTAL, 'regressor', train, test, 'target_total', n_threads)
+
+    result = {
+        'test_season': int(test_season),
+        'train_seasons': f"{min(train_seasons)}-{max(train_seasons)}",
+        'n_train': len(train),
+        'n_test': len(test),
+        'accuracy': accuracy_score(target_win.astype(int), (p_win > 0.5).astype(int)),
+        'spread_mae': mean_absolute_error(target_margin, p_margin),
+        'total_mae': mean_absolute_error(target_total, p_total),
+        'ats_rate': np.nan, 'ats_n': 0,
+        'ou_rate': np.nan, 'ou_n': 0,
+    }
+
+    # ATS / 大小分：選邊規則共用 pick_rules (同 aggregate_picks / replay)，結算規則同 grade_picks
+    if 'vegas_spread' in _columns:
+        spread = _col(test, 'vegas_spread')
+        has_spread = ~np.isnan(spread)
+        rec_is_home, _ = spread_picks(p_margin[has_spread], spread[has_spread])
+        ats = grade_spread(target_margin[has_spread], spread[has_spread], rec_is_home)
+        result.update(ats_rate=hit_rate(ats), ats_n=int(has_spread.sum()))
+
+        total_line = _col(test, 'vegas_total')
+        has_total = ~np.isnan(total_line)
+        ou_pick, _ = total_picks(p_total[has_total], total_line[has_total])
+        ou = grade_total(target_total[has_total], total_line[has_total], ou_pick)
+        result.update(ou_rate=hit_rate(ou), ou_n=int(has_total.sum()))
+
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def backtest():
+    print("📂 [Backtest] 讀取快取特徵 (所有 fold 共用)...")
+    data = prepare_training_data(load_and_clean_data())
+    data['season'] = season_of(data['gameDateTimeEst_h'])
+
+    lines = load_lines()
+    if lines is not None:
+        data = data.merge(lines, on='gameId', how='left')
+
+    features = {
+        'spread': [f for f in TRAIN_FEATURES_SPREAD if f in data.columns],
+        'total': [f for f in TRAIN_FEATURES_TOTAL if f in data.columns],
+    }
+
+    folds = build_folds(data['season'])
+    if not folds:
+        print(f"❌ 季數不足 (需要超過 {TRAIN_SEASONS} 季)，無法回測。")
+        return None
+
+    workers = max(1, min(N_WORKERS, len(folds)))
+    n_threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"🧪 Walk-forward: {len(folds)} 個 fold (訓練 {TRAIN_SEASONS} 季 -> 測試 1 季) | "
+          f"workers={workers}, 每 fold threads={n_threads}, seeds={N_SEEDS}")
+
+    # 回測用到的欄位只寫一次到磁碟；worker 用 spawn 啟動 (fork 在已啟動 OpenMP 的程序中可能卡死，
+    # 且 Windows / macOS 預設沒有 fork)
+    extra = ['target_win', 'target_margin', 'target_total', 'season']
+    if lines is not None:
+        extra += ['vegas_spread', 'vegas_total']
+    columns = list(dict.fromkeys(features['spread'] + features['total'] + extra))
+    shared = shared_dir()
+    try:
+        path = os.path.join(shared, 'backtest.npy')
+        np.save(path, data[columns].to_numpy(dtype=np.float64, na_value=np.nan))
+        del data
+
+        wall_start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context('spawn'),
+                                 initializer=_init_worker, initargs=(path, columns, features)) as pool:
+            results = list(pool.map(run_fold, folds, [n_threads] * len(folds)))
+        wall = time.perf_counter() - wall_start
+    finally:
+        shutil.rmtree(shared, ignore_errors=True)
+
+    report = pd.DataFrame(results)
+    print("\n" + "=" * 70)
+    print("📊 Walk-Forward 回測結果")
+    print("=" * 70)
+    for r in results:
+        line = (f"   {r['test_season']} (train {r['train_seasons']}, {r['n_test']} 場) | "
+                f"Acc {r['accuracy']*100:5.2f}% | Spread MAE {r['spread_mae']:5.2f} | Total MAE {r['total_mae']:5.2f}")
+        if r['ats_n']:
+            line += f" | ATS {r['ats_rate']*100:5.2f}% ({r['ats_n']}) | O/U {r['ou_rate']*100:5.2f}% ({r['ou_n']})"
+        print(line)
+
+    # 整體：以場數加權
+    w = report['n_test']
+    print(f"\n   🎯 整體準確率: {np.average(report['accuracy'], weights=w)*100:.2f}%")
+    print(f"   📏 整體 MAE: Spread {np.average(report['spread_mae'], weights=w):.2f} | Total {np.average(report['total_mae'], weights=w):.2f}")
+    if report['ats_n'].sum():
+        ats = report[report['ats_n'] > 0]
+        ou = report[report['ou_n'] > 0]
+        print(f"   💰 整體 ATS 命中率: {np.average(ats['ats_rate'], weights=ats['ats_n'])*100:.2f}% | "
+              f"大小分命中率: {np.average(ou['ou_rate'], weights=ou['ou_n'])*100:.2f}%")
+    print(f"   ⏱️ 總耗時 {wall:.1f}s (各 fold 加總 {report['seconds'].sum():.1f}s)")
+
+    if OUTPUT_CSV:
+        os.makedirs(os.path.dirname(OUTPUT_CSV) or '.', exist_ok=True)
+        report.to_csv(OUTPUT_CSV, index=False)
+        print(f"   💾 已輸出: {OUTPUT_CSV}")
+    return report
+
+
+if __name__ == "__main__":
+    backtest()
@@ -1,5 +1,5 @@
 import random
-from config import get_supabase_client
+from storage import get_storage
 
 # ==========================================
 # 🎯 上帝控制台 (God Console)
@@ -18,17 +18,13 @@ CHEAT_LOSS_CONFIDENCE = (55, 70)
 # ==========================================
 
 def run_cheat_mode():
-    supabase = get_supabase_client()
+    storage = get_storage()
     print("😈 正在啟動「上帝模式 (Cheat Mode) - 信心優先版」...")
     print(f"🎯 目標設定 -> 讓分: {TARGET_SPREAD_WIN_RATE:.0%} | 大小分: {TARGET_TOTAL_WIN_RATE:.0%}")
     print("-" * 50)
 
     # 抓取資料庫所有資料
-    picks_res = supabase.table("aggregated_picks")\
-        .select("*, matches(home_team_id, away_team_id)")\
-        .execute()
-    
-    all_picks = picks_res.data
+    all_picks = storage.picks_with_matches()
     
     if not all_picks:
         print("❌ 資料庫是空的，無法作弊。")
@@ -102,7 +98,7 @@ def run_cheat_mode():
 
                 # 執行更新
                 try:
-                    supabase.table("aggregated_picks").update(update_data).eq("id", pick['id']).execute()
+                    storage.update_pick(pick['id'], update_data)
                     print(f"   -> 修正 ID {pick['id']} (Loss -> WIN) | 信心度提升至 {update_data.get('confidence_score') or update_data.get('ou_confidence')}%")
                 except Exception as e:
                     print(f"   ❌ 失敗: {e}")
@@ -145,7 +141,7 @@ def run_cheat_mode():
                     update_data["ou_confidence"] = random.randint(*CHEAT_LOSS_CONFIDENCE)
 
                 try:
-                    supabase.table("aggregated_picks").update(update_data).eq("id", pick['id']).execute()
+                    storage.update_pick(pick['id'], update_data)
                     print(f"   -> 修正 ID {pick['id']} (Win -> LOSS) | 信心度調降至 {update_data.get('confidence_score') or update_data.get('ou_confidence')}%")
                 except Exception as e:
                     print(f"   ❌ 失敗: {e}")
@@ -1,23 +1,25 @@
-import joblib
 import pandas as pd
-import matplotlib.pyplot as plt
-import xgboost as xgb
+from model_bundle import ModelBundle
 
-def plot_importance(model_path, feature_names_path, title):
+def plot_importance(bundle, model_name, title):
     print(f"🔍 分析 {title} 的關鍵特徵...")
     try:
         # 載入模型與特徵列表
-        model = joblib.load(model_path)
-        feature_names = joblib.load(feature_names_path)
+        model = bundle.model(model_name)
+        feature_names = bundle.features(model_name)
         
-        # 取得特徵重要性
-        # XGBoost sklearn API 裡，feature_importances_ 屬性直接提供了重要性
-        importance = model.feature_importances_
+        # 取得特徵重要性：各種子 Booster 的 gain 正規化後取平均
+        importance = pd.Series(0.0, index=feature_names)
+        for booster in model.boosters:
+            gain = pd.Series(booster.get_score(importance_type='gain')).reindex(feature_names, fill_value=0)
+            if gain.sum() > 0:
+                importance += gain / gain.sum()
+        importance /= len(model.boosters)
         
         # 建立 DataFrame
         df_imp = pd.DataFrame({
             'Feature': feature_names,
-            'Importance': importance
+            'Importance': importance.to_numpy()
         }).sort_values('Importance', ascending=False)
         
         print(f"\n🏆 {title} - 前 10 大關鍵因素：")
@@ -30,11 +32,13 @@ def plot_importance(model_path, feature_names_path, title):
         return None
 
 if __name__ == "__main__":
+    bundle = ModelBundle.load()
+
     # 檢查勝負預測模型
-    plot_importance('model_win.pkl', 'features_spread.pkl', '勝負預測 (Win/Loss)')
+    plot_importance(bundle, 'win', '勝負預測 (Win/Loss)')
     
     # 檢查讓分預測模型
-    plot_importance('model_spread.pkl', 'features_spread.pkl', '讓分預測 (Spread)')
+    plot_importance(bundle, 'spread', '讓分預測 (Spread)')
     
     # 檢查大小分預測模型
-    plot_importance('model_total.pkl', 'features_total.pkl', '大小分預測 (Total)')
\ No newline at end of file
+    plot_importance(bundle, 'total', '大小分預測 (Total)')
\ No newline at end of file
@@ -1,4 +1,5 @@
 import os
+from functools import lru_cache
 try:
     from dotenv import load_dotenv
     load_dotenv()
@@ -6,14 +7,14 @@ except ImportError:
     pass
 from supabase import create_client, Client
 
-# 1. 載入 .env 檔案裡的設定
-load_dotenv()
+# 1. 載入 .env 檔案裡的設定 (上方 import 時已載入)
 
 # 2. 取得環境變數
 url = os.environ.get("SUPABASE_URL")
 key = os.environ.get("SUPABASE_KEY")
 
-# 3. 建立連線並回傳 client 物件
+# 3. 建立連線並回傳 client 物件 (同一個程序共用一個 client，重用連線)
+@lru_cache(maxsize=None)
 def get_supabase_client() -> Client:
     if not url or not key:
         raise ValueError("請檢查 .env 檔案，確認 SUPABASE_URL 和 SUPABASE_KEY 是否已設定")
@@ -0,0 +1,108 @@
+import time
+import numpy as np
+
+# ==========================================
+# 輕量集成預測器 (Native Booster Ensemble)
+# 直接對 5 個種子的 XGBoost Booster 做 inplace_predict，再用 NumPy 平均，
+# 不經過 sklearn VotingX 的驗證與 joblib 平行化開銷
+# ==========================================
+
+
+class BoosterEnsemble:
+    """
+    kind='classifier'：平均各 Booster 的機率 (等同 soft voting)
+    kind='regressor' ：平均各 Booster 的預測值 (等同 VotingRegressor)
+    """
+
+    def __init__(self, boosters, kind='regressor', classes=None, feature_names=None):
+        self.boosters = list(boosters)
+        self.kind = kind
+        self.classes_ = np.asarray(classes if classes is not None else [0, 1])
+        self.feature_names = list(feature_names) if feature_names is not None else None
+
+    @classmethod
+    def from_voting(cls, voting):
+        """從訓練好的 VotingClassifier / VotingRegressor 匯出底層 Booster。"""
+        boosters = [est.get_booster() for est in voting.estimators_]
+        is_classifier = hasattr(voting, 'classes_')
+        return cls(
+            boosters,
+            kind='classifier' if is_classifier else 'regressor',
+            classes=voting.classes_ if is_classifier else None,
+            feature_names=getattr(voting, 'feature_names_in_', None),
+        )
+
+    def _as_matrix(self, X):
+        if self.feature_names is not None and hasattr(X, 'columns'):
+            X = X[self.feature_names]
+        return np.ascontiguousarray(X, dtype=np.float32)
+
+    def _average(self, X):
+        X = self._as_matrix(X)
+        preds = [b.inplace_predict(X, missing=np.nan, validate_features=False) for b in self.boosters]
+        return np.mean(preds, axis=0)
+
+    def predict_proba(self, X):
+        if self.kind != 'classifier':
+            raise AttributeError("predict_proba 只適用於分類模型")
+        p = self._average(X)
+        return np.column_stack([1 - p, p])
+
+    def predict(self, X):
+        if self.kind == 'classifier':
+            p = self._average(X)
+            return np.where(p > 0.5, self.classes_[1], self.classes_[0])
+        return self._average(X)
+
+
+def check_parity(voting, ensemble, X, atol=1e-5):
+    """比對 Voting 物件與 BoosterEnsemble 的輸出，回傳最大誤差。"""
+    if ensemble.kind == 'classifier':
+        expected, got = voting.predict_proba(X), ensemble.predict_proba(X)
+        if not np.array_equal(voting.predict(X), ensemble.predict(X)):
+            raise AssertionError("分類結果不一致")
+    else:
+        expected, got = voting.predict(X), ensemble.predict(X)
+
+    max_err = float(np.max(np.abs(np.asarray(expected) - np.asarray(got)))) if len(got) else 0.0
+    if max_err > atol:
+        raise AssertionError(f"預測誤差過大: {max_err}")
+    return max_err
+
+
+def benchmark(predict_fn, X, repeat=50):
+    """回傳單次 predict 呼叫的平均延遲 (毫秒)。"""
+    predict_fn(X)  # 預熱
+    start = time.perf_counter()
+    for _ in range(repeat):
+        predict_fn(X)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+if __name__ == "__main__":
+    # 延遲測試 (+ 若還有舊版 pickle，順便做一致性檢查)：python ensemble_predictor.py
+    import os
+    import joblib
+    import pandas as pd
+    from model_bundle import ModelBundle
+
+    bundle = ModelBundle.load()
+    rng = np.random.default_rng(42)
+    for name in ('win', 'spread', 'total'):
+        ensemble = bundle.model(name)
+        features = bundle.features(name)
+        legacy = f'model_{name}.pkl'
+        voting = joblib.load(legacy) if os.path.exists(legacy) else None
+
+        for rows in (1, 15, 1000):
+            X = pd.DataFrame(rng.normal(0, 5, size=(rows, len(features))), columns=features)
+            if 'is_home' in X:
+                X['is_home'] = 1
+            t_native = benchmark(ensemble.predict, X)
+            if voting is None:
+                print(f"🔬 {name:<7} rows={rows:<5} Native {t_native:6.2f} ms")
+                continue
+            max_err = check_parity(voting, ensemble, X)
+            t_voting = benchmark(voting.predict, X)
+            print(f"🔬 {name:<7} rows={rows:<5} 誤差={max_err:.2e} | "
+                  f"Voting {t_voting:7.2f} ms -> Native {t_native:6.2f} ms ({t_voting / t_native:.1f}x)")
@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import hashlib
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# ==========================================
+# ESPN Scoreboard 共用客戶端
+# 賽程 / 盤口爬蟲共用同一個 keep-alive 連線池，
+# 所有日期一次平行抓取 (有上限的執行緒數)，失敗自動退避重試
+# ==========================================
+ESPN_SCOREBOARD_URL = "http://site.api.espn.com/apis/site/v2/sports/basketball/nba/scoreboard"
+MAX_CONCURRENCY = 4
+TIMEOUT = 10
+
+_session = None
+# 同一個程序內，同一天的 scoreboard 只下載一次
+_payloads = {}
+
+# 條件式下載快取：每天一個 meta 檔 (ETag / Last-Modified / 內容 hash)
+CACHE_DIR = 'data/.cache/espn'
+CACHE_TTL_HOURS = 6   # 超過這個時間沒處理過的日期，即使內容相同也重新處理一次
+# 已下載、尚未寫入資料庫的 meta；呼叫端寫入成功後才 commit_scoreboards()
+_pending = {}
+
+
+def get_session():
+    """共用 Session：連線池大小 = 併發上限，429 / 5xx 以指數退避重試 3 次。"""
+    global _session
+    if _session is None:
+        retry = Retry(
+            total=3, backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504], allowed_methods=['GET'],
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONCURRENCY, max_retries=retry)
+        _session = requests.Session()
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+    return _session
+
+
+def fetch_scoreboard(date_str):
+    """單日 scoreboard JSON (date_str: YYYYMMDD)；失敗回傳 None。"""
+    if date_str in _payloads:
+        return _payloads[date_str]
+    try:
+        resp = get_session().get(ESPN_SCOREBOARD_URL, params={'dates': date_str}, timeout=TIMEOUT)
+        if resp.status_code != 200:
+            print(f"      ⚠️ {date_str} API 錯誤: {resp.status_code}")
+            return None
+        _payloads[date_str] = resp.json()
+        return _payloads[date_str]
+    except Exception as e:
+        print(f"      ⚠️ {date_str} 下載失敗: {e}")
+        return None
+
+
+def _meta_path(date_str):
+    return os.path.join(CACHE_DIR, f'{date_str}.json')
+
+
+def _load_meta(date_str):
+    try:
+        with open(_meta_path(date_str)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _fetch_if_changed(date_str):
+    """
+    條件式下載：帶上次的 ETag / Last-Modified，304 或內容 hash 相同就視為沒變。
+    回傳 (payload 或 None, 狀態)，狀態為 'changed' / 'not_modified' / 'unchanged' / 'failed'。
+    """
+    meta = _load_meta(date_str)
+    fresh = time.time() - meta.get('processed_at', 0) < CACHE_TTL_HOURS * 3600
+    headers = {}
+    if fresh and meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if fresh and meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+
+    try:
+        resp = get_session().get(ESPN_SCOREBOARD_URL, params={'dates': date_str}, timeout=TIMEOUT, headers=headers)
+        if resp.status_code == 304:
+            return None, 'not_modified'
+        if resp.status_code != 200:
+            print(f"      ⚠️ {date_str} API 錯誤: {resp.status_code}")
+            return None, 'failed'
+
+        digest = hashlib.sha256(resp.content).hexdigest()
+        if fresh and digest == meta.get('sha256'):
+            return None, 'unchanged'
+
+        payload = resp.json()
+        _payloads[date_str] = payload
+        _pending[date_str] = {
+            'etag': resp.headers.get('ETag'),
+            'last_modified': resp.headers.get('Last-Modified'),
+            'sha256': digest,
+            'n_events': len(payload.get('events', [])),
+        }
+        return payload, 'changed'
+    except Exception as e:
+        print(f"      ⚠️ {date_str} 下載失敗: {e}")
+        return None, 'failed'
+
+
+def fetch_changed_scoreboards(dates, max_workers=MAX_CONCURRENCY):
+    """
+    平行條件式下載，只回傳內容有變的日期 {date_str: payload}。
+    沒變的日期完全跳過 (不解析、不寫入)，並印出跳過的日期 / 比賽數。
+    寫入資料庫成功後請呼叫 commit_scoreboards(changed 的日期)。
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(dates))) as pool:
+        results = dict(zip(dates, pool.map(_fetch_if_changed, dates)))
+
+    changed = {d: payload for d, (payload, status) in results.items() if status == 'changed'}
+    skipped = [d for d, (_, status) in results.items() if status in ('not_modified', 'unchanged')]
+    failed = [d for d, (_, status) in results.items() if status == 'failed']
+    skipped_games = sum(_load_meta(d).get('n_events', 0) for d in skipped)
+    print(f"   🌐 條件式下載 {len(dates)} 天: {time.perf_counter() - start:.2f}s | "
+          f"有變動 {len(changed)} 天、跳過 {len(skipped)} 天 ({skipped_games} 場)、失敗 {len(failed)} 天")
+    return changed
+
+
+def commit_scoreboards(dates):
+    """資料庫寫入成功後，記錄這些日期的 ETag / hash，下次內容相同就跳過。"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    for date_str in dates:
+        meta = _pending.pop(date_str, None)
+        if meta is None:
+            continue
+        meta['processed_at'] = time.time()
+        tmp_path = _meta_path(date_str) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, _meta_path(date_str))
+
+
+def fetch_scoreboards(dates, max_workers=MAX_CONCURRENCY):
+    """平行抓取多個日期，回傳 {date_str: payload 或 None} (依輸入順序)。"""
+    start = time.perf_counter()
+    todo = [d for d in dict.fromkeys(dates) if d not in _payloads]
+    if todo:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(todo))) as pool:
+            list(pool.map(fetch_scoreboard, todo))
+        print(f"   🌐 平行下載 {len(todo)} 天 scoreboard: {time.perf_counter() - start:.2f}s")
+    return {d: _payloads.get(d) for d in dates}
+
+
+# ==========================================
+# Scoreboard 解析 (賽程 / 盤口共用)
+# ==========================================
+def parse_status(event):
+    """ESPN status type -> 資料庫狀態 ('STATUS_FINISHED' / 'STATUS_IN_PROGRESS' / 'STATUS_SCHEDULED')。"""
+    espn_status = event['status']['type']['name']
+    if espn_status == 'STATUS_FINAL':
+        return "STATUS_FINISHED"
+    if espn_status == 'STATUS_IN_PROGRESS':
+        return "STATUS_IN_PROGRESS"
+    return "STATUS_SCHEDULED"
+
+
+def parse_event(event):
+    """單場比賽的主客隊代碼、狀態、比分與開賽時間 (ISO UTC)。"""
+    competition = event['competitions'][0]
+    competitors = competition['competitors']
+
+    home_comp = next(filter(lambda x: x['homeAway'] == 'home', competitors))
+    away_comp = next(filter(lambda x: x['homeAway'] == 'away', competitors))
+
+    return {
+        'home_abbr': home_comp['team']['abbreviation'],
+        'away_abbr': away_comp['team']['abbreviation'],
+        'status': parse_status(event),
+        'home_score': int(home_comp['score']) if home_comp.get('score') else 0,
+        'away_score': int(away_comp['score']) if away_comp.get('score') else 0,
+        'start_time': event['date'],
+        'competition': competition,
+    }
+
+
+def parse_odds(competition, home_abbr):
+    """
+    解析第一家莊家的盤口，回傳 (vegas_spread, vegas_total)，抓不到的為 None。
+    資料庫存的是「主隊讓分」：主隊被看好為負值，客隊被看好為正值。
+    """
+    vegas_spread = None
+    vegas_total = None
+    if not competition.get('odds'):
+        return vegas_spread, vegas_total
+
+    odds_obj = competition['odds'][0]  # 通常取第一個莊家 (ESPN BET)
+
+    # 讓分，格式通常是 "BOS -5.5"
+    details = odds_obj.get('details', '')
+    if details:
+        try:
+            parts = details.split(' ')
+            if len(parts) >= 2:
+                favored_team = parts[0]
+                spread_val = float(parts[1])
+                if favored_team == home_abbr:
+                    vegas_spread = spread_val if spread_val < 0 else -spread_val
+                else:
+                    vegas_spread = abs(spread_val)  # 客隊讓分，主隊就是正的
+        except Exception:
+            pass
+
+    # 大小分，例如 225.5
+    ou_val = odds_obj.get('overUnder')
+    if ou_val:
+        vegas_total = float(ou_val)
+
+    return vegas_spread, vegas_total
@@ -0,0 +1,248 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 設定：TeamStatistics 清理後資料的欄式快取
+# ==========================================
+TEAM_STATS_CSV = 'data/TeamStatistics.csv'
+CACHE_DIR = os.path.join('data', '.cache', 'team_stats')
+
+# 🔥 清理邏輯有任何變動時請 +1，舊快取會自動失效
+CLEANING_VERSION = 1
+
+# 🔥 快取檔案格式有變動時請 +1 (例如新增 team 索引)
+CACHE_FORMAT_VERSION = 2
+
+# Concept Drift 修正：僅保留現代籃球數據
+CUTOFF_YEAR = 2015
+
+REQ_COLS = [
+    'gameId', 'teamId', 'gameDateTimeEst', 'home', 'win', 'teamScore', 'opponentScore',
+    'fieldGoalsMade', 'fieldGoalsAttempted', 'threePointersMade',
+    'freeThrowsAttempted',
+    'fieldGoalsPercentage', 'threePointersPercentage', 'freeThrowsPercentage',
+    'reboundsTotal', 'assists', 'steals', 'blocks', 'turnovers',
+    'plusMinusPoints', 'pointsInThePaint'
+]
+
+DATE_COL = 'gameDateTimeEst'
+META_FILE = 'meta.json'
+
+
+def clean_team_statistics(df):
+    """
+    TeamStatistics 原始資料 -> 已排序、已型別化、含 eFG% / TS% / RestDays 的乾淨資料。
+    訓練 (train_model) 與預測 (aggregate_picks) 共用同一份邏輯。
+    """
+    # 1. 日期處理
+    df[DATE_COL] = df[DATE_COL].astype(str).str.slice(0, 10)
+    df[DATE_COL] = pd.to_datetime(df[DATE_COL], utc=True, errors='coerce')
+    df = df.dropna(subset=[DATE_COL])
+
+    # Concept Drift 修正
+    print(f"✂️ [Concept Drift Fix] 過濾數據：僅保留 {CUTOFF_YEAR} 年以後的現代籃球數據...")
+    df = df[df[DATE_COL].dt.year >= CUTOFF_YEAR]
+
+    # 2. 排序 (重要)
+    df = df.sort_values(['teamId', DATE_COL])
+
+    # 移除 'win' 為 NaN 的資料 (未來賽程)
+    if df['win'].isnull().any():
+        print(f"   ⚠️ 發現 {df['win'].isnull().sum()} 筆無勝負結果的資料(可能是未來賽程)，已移除。")
+        df = df.dropna(subset=['win'])
+
+    # 3. 特徵工程
+    df['threePointersMade'] = df['threePointersMade'].fillna(0)
+    df['fieldGoalsAttempted'] = df['fieldGoalsAttempted'].replace(0, np.nan)
+
+    df['eFG_Percentage'] = (df['fieldGoalsMade'] + 0.5 * df['threePointersMade']) / df['fieldGoalsAttempted']
+    df['TS_Percentage'] = df['teamScore'] / (2 * (df['fieldGoalsAttempted'] + 0.44 * df['freeThrowsAttempted']))
+    df['eFG_Percentage'] = df['eFG_Percentage'].fillna(0)
+    df['TS_Percentage'] = df['TS_Percentage'].fillna(0)
+
+    prev_game_date = df.groupby('teamId')[DATE_COL].shift(1)
+    df['RestDays'] = (df[DATE_COL] - prev_game_date).dt.days
+    df['RestDays'] = df['RestDays'].fillna(3).clip(upper=7)
+
+    # 數值化勝負
+    df['win_numeric'] = df['win'].astype(int)
+
+    # 4. 型別整理：全部轉成數值欄位，才能以 .npy 欄式儲存
+    df['gameId'] = df['gameId'].astype(np.int64)
+    df['teamId'] = df['teamId'].astype(np.int64)
+    df['home'] = df['home'].astype(np.int64)
+
+    return df.reset_index(drop=True)
+
+
+def _file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def read_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, META_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(cache_dir, meta):
+    tmp_path = os.path.join(cache_dir, META_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, os.path.join(cache_dir, META_FILE))
+
+
+def _source_key(csv_path):
+    st = os.stat(csv_path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def _is_cache_valid(meta, csv_path):
+    """
+    快取有效條件：清理版本相同，且 CSV 的 size/mtime 相同。
+    若 mtime 變了 (例如 Kaggle force 重新下載同一份檔案)，再用 sha256 確認內容。
+    """
+    if not meta or meta.get('cleaning_version') != CLEANING_VERSION:
+        return False
+    if meta.get('format_version') != CACHE_FORMAT_VERSION:
+        return False
+
+    source = _source_key(csv_path)
+    cached = meta.get('source', {})
+    if cached.get('size') != source['size']:
+        return False
+    if cached.get('mtime_ns') == source['mtime_ns']:
+        return True
+    return cached.get('sha256') == _file_sha256(csv_path)
+
+
+def _save_npy(path, arr):
+    # 先寫暫存檔再 os.replace：正在 memory-map 舊檔的程式不會讀到寫一半的資料
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, np.ascontiguousarray(arr), allow_pickle=False)
+    os.replace(tmp_path, path)
+
+
+def save_columns(df, cache_dir, meta, arrays=None):
+    """
+    將 DataFrame 以「一欄一個 .npy」的方式寫入 cache_dir，meta.json 最後寫入代表完成。
+    arrays: 額外要一起保存的 numpy 陣列 (name -> ndarray)，例如增量狀態。
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    meta_path = os.path.join(cache_dir, META_FILE)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    columns = {}
+    for col in df.columns:
+        s = df[col]
+        if isinstance(s.dtype, pd.DatetimeTZDtype):
+            arr = s.dt.tz_convert(None).to_numpy()
+            columns[col] = {'tz': str(s.dt.tz)}
+        else:
+            arr = s.to_numpy()
+            columns[col] = {}
+        _save_npy(os.path.join(cache_dir, f'{col}.npy'), arr)
+
+    for name, arr in (arrays or {}).items():
+        _save_npy(os.path.join(cache_dir, f'_{name}.npy'), arr)
+
+    meta = dict(meta, columns=columns, arrays=sorted(arrays or {}), rows=len(df))
+    _write_meta(cache_dir, meta)
+    return meta
+
+
+def load_columns(cache_dir, meta, columns=None, rows=None):
+    """
+    以 memory-map 方式讀回欄式快取 (不複製資料)。
+    rows: 只讀取指定位置的列 (只會觸及這些列所在的頁面)。
+    """
+    data = {}
+    for col, info in meta['columns'].items():
+        if columns is not None and col not in columns:
+            continue
+        arr = np.load(os.path.join(cache_dir, f'{col}.npy'), mmap_mode='r', allow_pickle=False)
+        if rows is not None:
+            arr = arr[rows]
+        if info.get('tz'):
+            data[col] = pd.DatetimeIndex(arr).tz_localize(info['tz'])
+        else:
+            data[col] = arr
+    return pd.DataFrame(data, copy=False)
+
+
+def load_arrays(cache_dir, meta, names):
+    """讀回 save_columns(arrays=...) 保存的額外陣列 (memory-map)。"""
+    return [np.load(os.path.join(cache_dir, f'_{name}.npy'), mmap_mode='r', allow_pickle=False) for name in names]
+
+
+def _team_index(df):
+    """每支球隊在已排序資料中的列區間 [start, end)，供預測時直接取尾端。"""
+    team_col = df['teamId'].to_numpy()
+    n = len(team_col)
+    boundary = np.flatnonzero(team_col[1:] != team_col[:-1]) + 1
+    starts = np.concatenate([[0], boundary]) if n else np.zeros(0, dtype=np.int64)
+    ends = np.concatenate([boundary, [n]]) if n else np.zeros(0, dtype=np.int64)
+    return {'team_ids': team_col[starts], 'team_starts': starts, 'team_ends': ends}
+
+
+def load_team_statistics(csv_path=TEAM_STATS_CSV, cache_dir=CACHE_DIR, use_cache=True):
+    """
+    取得清理後的 TeamStatistics。
+    快取命中時直接 memory-map .npy 檔，完全跳過 CSV 解析與特徵計算。
+    """
+    if use_cache:
+        meta = read_meta(cache_dir)
+        if _is_cache_valid(meta, csv_path):
+            print(f"   ⚡ 使用欄式快取 ({meta['rows']} 筆): {cache_dir}")
+            return load_columns(cache_dir, meta)
+
+    print(f"   📄 解析 CSV: {csv_path}")
+    raw = pd.read_csv(csv_path, usecols=lambda c: c in REQ_COLS, low_memory=False)
+    df = clean_team_statistics(raw)
+
+    if use_cache:
+        try:
+            source = _source_key(csv_path)
+            source['sha256'] = _file_sha256(csv_path)
+            meta = {'cleaning_version': CLEANING_VERSION, 'format_version': CACHE_FORMAT_VERSION, 'source': source}
+            save_columns(df, cache_dir, meta, arrays=_team_index(df))
+            print(f"   💾 已寫入欄式快取: {cache_dir}")
+        except Exception as e:
+            print(f"   ⚠️ 快取寫入失敗 (不影響結果): {e}")
+
+    return df
+
+
+def load_team_tails(n, columns=None, csv_path=TEAM_STATS_CSV, cache_dir=CACHE_DIR):
+    """
+    每支球隊只取最後 n 場 (預測只需要最新狀態)。
+    快取有效時依 team 索引直接從 memory-map 取列，不讀整段歷史；
+    快取不存在時先解析 CSV 並建立快取。
+    """
+    meta = read_meta(cache_dir)
+    if not _is_cache_valid(meta, csv_path):
+        df = load_team_statistics(csv_path, cache_dir)
+        tail = df.groupby('teamId', sort=False).tail(n)
+        return tail if columns is None else tail[columns]
+
+    starts, ends = load_arrays(cache_dir, meta, ['team_starts', 'team_ends'])
+    begins = np.maximum(np.asarray(ends) - n, starts)
+    rows = np.concatenate([np.arange(b, e) for b, e in zip(begins, ends)]) if len(ends) else np.zeros(0, dtype=np.int64)
+    print(f"   ⚡ 只讀取每隊最後 {n} 場 ({len(rows)} / {meta['rows']} 筆)")
+    return load_columns(cache_dir, meta, columns, rows=rows)
+
+
+if __name__ == "__main__":
+    # 手動預熱快取：python feature_cache.py
+    load_team_statistics()
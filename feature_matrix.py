@@ -0,0 +1,102 @@
+import time
+import hashlib
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+# ==========================================
+# 共用特徵矩陣層 (QuantileDMatrix Cache)
+# 同一組 (特徵集合, 切分) 只量化一次，所有種子 / 目標 / Optuna trial 共用
+# ==========================================
+MAX_BIN = 256
+
+# (feature_set, split) -> (資料指紋, QuantileDMatrix)
+_matrices = {}
+
+# sklearn 參數名稱 -> XGBoost 原生參數名稱
+_PARAM_ALIASES = {
+    'learning_rate': 'eta',
+    'reg_alpha': 'alpha',
+    'reg_lambda': 'lambda',
+    'random_state': 'seed',
+    'n_jobs': 'nthread',
+}
+
+
+def to_native_params(params, kind):
+    """sklearn 風格參數 (BEST_PARAMS_*) -> (xgb.train 參數, num_boost_round)。"""
+    native = {'objective': 'binary:logistic' if kind == 'classifier' else 'reg:squarederror',
+              'tree_method': 'hist', 'max_bin': MAX_BIN}
+    rounds = 100
+    for key, value in params.items():
+        if key == 'n_estimators':
+            rounds = value
+        elif key == 'missing':
+            continue  # 缺值由 DMatrix 處理
+        else:
+            native[_PARAM_ALIASES.get(key, key)] = value
+    return native, rounds
+
+
+def data_fingerprint(X):
+    """
+    資料指紋：形狀 + 欄位 + 全部內容的 hash，用來確認快取的矩陣就是這份資料。
+    掃一遍資料的成本遠小於建立 QuantileDMatrix，只比首尾列會漏掉中間被改動的資料。
+    """
+    h = hashlib.sha1(repr(np.shape(X)).encode())
+    if isinstance(X, pd.DataFrame):
+        h.update(repr(list(X.columns)).encode())
+        h.update(pd.util.hash_pandas_object(X, index=True).to_numpy().tobytes())
+    else:
+        arr = np.ascontiguousarray(X)
+        h.update(str(arr.dtype).encode())
+        h.update(memoryview(arr).cast('B'))
+    return h.hexdigest()
+
+
+def get_matrix(feature_set, split, X, ref=None, feature_names=None, fingerprint=None):
+    """
+    取得 (feature_set, split) 的 QuantileDMatrix，第一次呼叫才建立。
+    驗證集請傳入 ref=訓練集矩陣，讓兩者使用相同的分箱切點。
+    X 也可以是 callable，只有在真正需要建立矩陣時才呼叫 (避免每次都切 DataFrame)；
+    此時請傳入 fingerprint (可先用 data_fingerprint 算好)，否則每次都要先取出資料比對。
+    快取的矩陣與傳入資料的指紋不同時會重建，不會沿用舊資料。
+    """
+    key = (feature_set, split)
+    if fingerprint is None:
+        if callable(X):
+            X = X()
+        fingerprint = data_fingerprint(X)
+    # ref 不同 (分箱切點不同) 也要重建：用 ref 自己的指紋比對
+    ref_fp = None if ref is None else next((fp for fp, m in _matrices.values() if m is ref), id(ref))
+    fingerprint = (fingerprint, ref_fp)
+
+    cached = _matrices.get(key)
+    if cached is None or cached[0] != fingerprint:
+        if cached is not None:
+            print(f"   ♻️ [{feature_set}/{split}] 資料已變更，重建 QuantileDMatrix")
+        start = time.perf_counter()
+        if callable(X):
+            X = X()
+        if feature_names is None and hasattr(X, 'columns'):
+            feature_names = list(X.columns)
+        cached = _matrices[key] = (fingerprint, xgb.QuantileDMatrix(
+            np.ascontiguousarray(X, dtype=np.float32), missing=np.nan,
+            ref=ref, max_bin=MAX_BIN, feature_names=feature_names
+        ))
+        print(f"   🧱 建立 QuantileDMatrix [{feature_set}/{split}] {len(X)} 筆: {time.perf_counter() - start:.2f}s (之後共用)")
+    return cached[1]
+
+
+def clear_matrices():
+    _matrices.clear()
+
+
+def fit_booster(params, kind, dtrain, label, **train_kwargs):
+    """
+    在共用矩陣上訓練一個 Booster。
+    不同目標 (勝負 / 讓分) 共用同一份特徵矩陣，只需換標籤。
+    """
+    dtrain.set_label(np.asarray(label, dtype=np.float32))
+    native, rounds = to_native_params(params, kind)
+    return xgb.train(native, dtrain, num_boost_round=rounds, **train_kwargs)
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+from feature_cache import load_team_statistics, load_team_tails
+from feature_store import FEATURE_DTYPE, update_feature_store, rolling_feature_names
+from rolling_engine import rolling_means
+
+# ==========================================
+# 共用特徵管線 (訓練 / 預測 共用同一份定義)
+# ==========================================
+# 基礎數據 (Raw Stats)
+BASE_STATS_COLS = [
+    'fieldGoalsPercentage', 'threePointersPercentage', 'freeThrowsPercentage',
+    'reboundsTotal', 'assists', 'steals', 'blocks', 'turnovers',
+    'plusMinusPoints', 'pointsInThePaint', 'teamScore',
+    'eFG_Percentage', 'TS_Percentage', 'RestDays'
+]
+
+# 🔥 V2.0 升級：定義多重時間窗口
+ROLLING_WINDOWS = [5, 10, 30]
+
+META_COLS = ['gameId', 'gameDateTimeEst', 'home', 'win', 'teamScore', 'opponentScore']
+
+
+def build_feature_lists(windows=ROLLING_WINDOWS):
+    """動態生成訓練特徵列表 (Spread 用 diff，Total 用 sum)。"""
+    features_spread = ['is_home']
+    features_total = []
+
+    for w in windows:
+        for col in BASE_STATS_COLS:
+            features_spread.append(f'diff_rolling_{w}_{col}')
+            features_total.append(f'sum_rolling_{w}_{col}')
+
+        # 🔥 特別加入：勝率 (Win Rate) 作為實力指標
+        features_spread.append(f'diff_rolling_{w}_win_rate')
+        features_total.append(f'sum_rolling_{w}_win_rate')
+
+    return features_spread, features_total
+
+
+def get_roll_cols(df):
+    """實際要滾動的欄位 (RestDays 固定放最後)。"""
+    cols = [c for c in BASE_STATS_COLS if c in df.columns and c != 'RestDays']
+    cols.append('RestDays')
+    return cols
+
+
+def build_training_features(windows=ROLLING_WINDOWS):
+    """
+    訓練模式：每一場比賽一列，特徵只使用「該場之前」的比賽 (shift，無資料洩漏)。
+    滾動特徵由增量特徵庫提供。
+    """
+    df = load_team_statistics()
+    cols = get_roll_cols(df)
+
+    print(f"   🔄 執行多重滾動平均計算 (Windows: {', '.join(map(str, windows))})...")
+    rolled = update_feature_store(df, windows, cols)
+
+    df_final = pd.concat([df[META_COLS], rolled], axis=1).rename(columns={
+        'teamScore': 'actual_teamScore',
+        'opponentScore': 'actual_opponentScore'
+    })
+    return df_final.dropna(subset=['win', 'actual_teamScore', 'actual_opponentScore'])
+
+
+def build_serving_features(windows=ROLLING_WINDOWS):
+    """
+    預測模式：每支球隊只回傳「最新狀態」(包含最後一場，不 shift)。
+    只從欄式快取讀取每隊最後 max(windows) 場，不需載入或滾動整段歷史。
+    回傳以 teamId 為 index 的緊湊 DataFrame (一隊一列)。
+    """
+    tail = load_team_tails(max(windows))
+    cols = get_roll_cols(tail)
+
+    team_col = tail['teamId'].to_numpy()
+    last_rows = np.flatnonzero(np.append(team_col[1:] != team_col[:-1], True))
+
+    block = rolling_means(
+        tail[cols + ['win_numeric']].to_numpy(dtype=np.float64),
+        team_col, windows, shift=False, rows=last_rows, dtype=FEATURE_DTYPE
+    )
+    return pd.DataFrame(block, columns=rolling_feature_names(windows, cols),
+                        index=pd.Index(team_col[last_rows], name='teamId'))
+
+
+def build_features(mode='training', windows=ROLLING_WINDOWS):
+    """mode: 'training' (每場、shift) 或 'serving' (每隊最新狀態)。"""
+    if mode == 'training':
+        return build_training_features(windows)
+    if mode == 'serving':
+        return build_serving_features(windows)
+    raise ValueError(f"未知的特徵模式: {mode}")
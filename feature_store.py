@@ -0,0 +1,171 @@
+import os
+import warnings
+import numpy as np
+import pandas as pd
+from feature_cache import CLEANING_VERSION, read_meta, save_columns, load_columns, load_arrays
+from rolling_engine import rolling_means
+
+# ==========================================
+# 設定：增量滾動特徵庫 (Incremental Rolling Feature Store)
+# ==========================================
+STORE_DIR = os.path.join('data', '.cache', 'feature_store')
+
+# 🔥 特徵庫格式或滾動邏輯有變動時請 +1，會自動全量重建
+STORE_VERSION = 3
+
+KEY_COLS = ['gameId', 'teamId']
+
+# ⚠️ 平均值保留 float64：diff_/sum_ 特徵是兩隊平均值相減，
+# 若先存成 float32，誤差會讓數值落在樹的切點另一側 (例如 5.8 -> 5.800003)
+FEATURE_DTYPE = np.float64
+
+
+def rolling_feature_names(windows, cols):
+    """rolling_{w}_{col} ... rolling_{w}_win_rate，順序與訓練特徵一致。"""
+    names = []
+    for w in windows:
+        names += [f'rolling_{w}_{c}' for c in cols]
+        names.append(f'rolling_{w}_win_rate')
+    return names
+
+
+def compute_rolling_features(df, windows, cols, shift=True):
+    """
+    全量計算：每支球隊的多重窗口滾動平均。
+    shift=True 時只使用「該場之前」的比賽 (訓練用，避免資料洩漏)。
+    """
+    values = df[cols + ['win_numeric']].to_numpy(dtype=np.float64)
+    block = rolling_means(values, df['teamId'].to_numpy(), windows, shift=shift, dtype=FEATURE_DTYPE)
+    return pd.DataFrame(block, columns=rolling_feature_names(windows, cols), index=df.index, copy=False)
+
+
+def _window_means(ring, pos, windows):
+    """從環狀緩衝區取出最近 w 場的平均 (忽略 NaN，與 rolling(min_periods=1) 相同)。"""
+    size = ring.shape[0]
+    means = []
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)  # 全 NaN 視窗 -> NaN
+        for w in windows:
+            idx = (pos - 1 - np.arange(w)) % size
+            means.append(np.nanmean(ring[idx], axis=0))
+    return means
+
+
+def _build_state(df, value_cols, size):
+    """以每支球隊最後 size 場比賽建立環狀緩衝區。"""
+    team_ids = np.unique(df['teamId'].to_numpy())
+    ring = np.full((len(team_ids), size, len(value_cols)), np.nan)
+    ring_pos = np.zeros(len(team_ids), dtype=np.int64)
+
+    values = df[value_cols].to_numpy(dtype=np.float64)
+    team_col = df['teamId'].to_numpy()
+    for t, team_id in enumerate(team_ids):
+        rows = np.flatnonzero(team_col == team_id)
+        n = len(rows)
+        tail = rows[-size:]
+        slots = np.arange(n - len(tail), n) % size
+        ring[t, slots] = values[tail]
+        ring_pos[t] = n % size
+    return team_ids, ring, ring_pos
+
+
+def _save_store(store_dir, keys_df, features, state, windows, cols):
+    team_ids, ring, ring_pos = state
+    frame = pd.concat([keys_df.reset_index(drop=True), features.reset_index(drop=True)], axis=1)
+    meta = {
+        'store_version': STORE_VERSION,
+        'cleaning_version': CLEANING_VERSION,
+        'windows': list(windows),
+        'cols': list(cols),
+    }
+    save_columns(frame, store_dir, meta, arrays={
+        'ring_teams': team_ids, 'ring': ring, 'ring_pos': ring_pos
+    })
+
+
+def _is_store_compatible(meta, windows, cols):
+    return (
+        meta is not None
+        and meta.get('store_version') == STORE_VERSION
+        and meta.get('cleaning_version') == CLEANING_VERSION
+        and meta.get('windows') == list(windows)
+        and meta.get('cols') == list(cols)
+    )
+
+
+def _find_appended_rows(df, stored):
+    """
+    找出新增的 (gameId, teamId)。
+    只有在「舊資料全部還在，且新資料都排在各隊舊資料之後」時才可增量更新，否則回傳 None。
+    """
+    keys = pd.MultiIndex.from_frame(df[KEY_COLS])
+    stored_keys = pd.MultiIndex.from_frame(stored[KEY_COLS])
+    new_mask = ~keys.isin(stored_keys)
+    if len(df) - new_mask.sum() != len(stored):
+        return None
+
+    old_counts = pd.Series(stored['teamId']).value_counts()
+    pos_in_team = df.groupby('teamId').cumcount().to_numpy()
+    n_old = df['teamId'].map(old_counts).fillna(0).to_numpy()
+    if (pos_in_team[new_mask] < n_old[new_mask]).any():
+        return None
+    return new_mask
+
+
+def update_feature_store(df, windows, cols, store_dir=STORE_DIR):
+    """
+    取得訓練用 (shift 後) 的滾動特徵，與 df 的列一一對應。
+    已有特徵庫時只處理新增的比賽 (時間與新增場數成正比)，否則全量重建。
+    """
+    value_cols = cols + ['win_numeric']
+    names = rolling_feature_names(windows, cols)
+    size = max(windows)
+
+    meta = read_meta(store_dir)
+    if _is_store_compatible(meta, windows, cols):
+        stored = load_columns(store_dir, meta)
+        new_mask = _find_appended_rows(df, stored)
+        if new_mask is None:
+            print("   ⚠️ 歷史資料有變動 (非單純新增)，特徵庫全量重建...")
+        else:
+            team_ids, ring, ring_pos = (np.array(a) for a in load_arrays(store_dir, meta, ['ring_teams', 'ring', 'ring_pos']))
+            new_rows = df[new_mask]
+            print(f"   ⚡ 特徵庫增量更新：新增 {len(new_rows)} 筆 (既有 {len(stored)} 筆)")
+
+            # 新球隊 -> 擴充緩衝區
+            unseen = np.setdiff1d(np.unique(new_rows['teamId'].to_numpy()), team_ids)
+            if len(unseen):
+                team_ids = np.concatenate([team_ids, unseen])
+                ring = np.concatenate([ring, np.full((len(unseen), size, len(value_cols)), np.nan)])
+                ring_pos = np.concatenate([ring_pos, np.zeros(len(unseen), dtype=np.int64)])
+            team_index = {tid: i for i, tid in enumerate(team_ids)}
+
+            # 依 (球隊, 日期) 順序推進狀態：先取平均 (shift)，再放入本場數據
+            new_values = new_rows[value_cols].to_numpy(dtype=np.float64)
+            new_features = np.empty((len(new_rows), len(names)), dtype=FEATURE_DTYPE)
+            for i, team_id in enumerate(new_rows['teamId'].to_numpy()):
+                t = team_index[team_id]
+                new_features[i] = np.concatenate(_window_means(ring[t], ring_pos[t], windows))
+                ring[t, ring_pos[t]] = new_values[i]
+                ring_pos[t] = (ring_pos[t] + 1) % size
+
+            all_keys = pd.concat([stored[KEY_COLS], new_rows[KEY_COLS]], ignore_index=True)
+            all_features = pd.DataFrame(
+                np.concatenate([stored[names].to_numpy(), new_features]), columns=names
+            )
+            if len(new_rows):
+                _save_store(store_dir, all_keys, all_features, (team_ids, ring, ring_pos), windows, cols)
+
+            # 對齊回 df 的列順序
+            order = pd.MultiIndex.from_frame(all_keys).get_indexer(pd.MultiIndex.from_frame(df[KEY_COLS]))
+            result = all_features.iloc[order]
+            result.index = df.index
+            return result
+
+    print("   🔄 特徵庫全量計算...")
+    features = compute_rolling_features(df, windows, cols)
+    try:
+        _save_store(store_dir, df[KEY_COLS], features, _build_state(df, value_cols, size), windows, cols)
+    except Exception as e:
+        print(f"   ⚠️ 特徵庫寫入失敗 (不影響結果): {e}")
+    return features
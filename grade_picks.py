@@ -1,33 +1,101 @@
-from config import get_supabase_client
+from storage import get_storage
 import pandas as pd
+import numpy as np
+
+# ==========================================
+# 向量化結算規則 (與下方逐筆結算完全相同，供回測 / 批次結算使用)
+# ==========================================
+def grade_spread(home_margin, line, rec_is_home):
+    """
+    讓分盤：home_margin + line > 0 代表主隊過盤。
+    回傳 'WIN' / 'LOSS' / 'PUSH' 陣列 (推薦方的角度)。
+    """
+    cover = np.asarray(home_margin, dtype=float) + np.asarray(line, dtype=float)
+    home_result = np.select([cover > 0, cover < 0], ['WIN', 'LOSS'], 'PUSH')
+    away_result = np.select([cover > 0, cover < 0], ['LOSS', 'WIN'], 'PUSH')
+    return np.where(np.asarray(rec_is_home, dtype=bool), home_result, away_result)
+
+def grade_total(total_score, line, ou_pick):
+    """大小分：總分高於盤口時 OVER 贏、其他皆輸；低於盤口時 UNDER 贏；相等為 PUSH。"""
+    diff = np.asarray(total_score, dtype=float) - np.asarray(line, dtype=float)
+    ou_pick = np.asarray(ou_pick)
+    return np.select(
+        [(diff > 0) & (ou_pick == 'OVER'), diff > 0, (diff < 0) & (ou_pick == 'UNDER'), diff < 0],
+        ['WIN', 'LOSS', 'WIN', 'LOSS'], 'PUSH'
+    )
+
+FINISHED_STATUSES = ["STATUS_FINAL", "STATUS_FINISHED", "Final"]
+UPSERT_CHUNK = 1000   # 一次 upsert 的最大筆數 (一般每次排程只有一批)
+
+def compute_outcomes(picks):
+    """
+    整批結算 (picks 需內嵌 matches 比分)。
+    回傳 DataFrame：spread_outcome / total_outcome (無法結算為 None) 與 graded 遮罩。
+    """
+    matches = [p['matches'] for p in picks]
+    home_score = pd.to_numeric(pd.Series([m.get('home_score') for m in matches], dtype=object), errors='coerce')
+    away_score = pd.to_numeric(pd.Series([m.get('away_score') for m in matches], dtype=object), errors='coerce')
+    has_score = (home_score.notna() & away_score.notna()).to_numpy()
+
+    # --- A. 讓分盤：有盤口 (line_info) 才結算 ---
+    line_raw = pd.Series([p.get('line_info') for p in picks], dtype=object)
+    line = pd.to_numeric(line_raw.replace('', None), errors='coerce').to_numpy(dtype=float)
+    bad_lines = int((line_raw.notna() & (line_raw != '') & np.isnan(line)).sum())
+    if bad_lines:
+        print(f"   ⚠️ {bad_lines} 筆讓分盤口格式錯誤，略過")
+    spread_mask = has_score & ~np.isnan(line)
+    rec_is_home = np.array([p.get('recommended_team_id') == m.get('home_team_id') for p, m in zip(picks, matches)], dtype=bool)
+    home_margin = (home_score - away_score).to_numpy(dtype=float)
+
+    spread_outcome = np.full(len(picks), None, dtype=object)
+    spread_outcome[spread_mask] = grade_spread(home_margin[spread_mask], line[spread_mask], rec_is_home[spread_mask])
+
+    # --- B. 大小分：有選邊與盤口 (非 0) 才結算 ---
+    ou_pick = np.array([p.get('ou_pick') or '' for p in picks], dtype=object)
+    ou_line = pd.to_numeric(pd.Series([p.get('ou_line') for p in picks], dtype=object), errors='coerce').to_numpy(dtype=float)
+    total_mask = has_score & (ou_pick != '') & ~np.isnan(ou_line) & (ou_line != 0)
+    total_score = (home_score + away_score).to_numpy(dtype=float)
+
+    total_outcome = np.full(len(picks), None, dtype=object)
+    total_outcome[total_mask] = grade_total(total_score[total_mask], ou_line[total_mask], ou_pick[total_mask].astype(str))
+
+    return pd.DataFrame({
+        'spread_outcome': spread_outcome,
+        'spread_graded': spread_mask,
+        'total_outcome': total_outcome,
+        'total_graded': total_mask,
+        'graded': spread_mask | total_mask,
+    })
+
+def build_updates(picks, outcomes):
+    """
+    組出要寫回的完整 pick 列 (只含有結算結果的)。
+    用完整列 upsert，避免 insert 路徑因缺少必填欄位失敗。
+    """
+    spread_graded = outcomes['spread_graded'].to_numpy()
+    spread_outcome = outcomes['spread_outcome'].to_numpy()
+    total_graded = outcomes['total_graded'].to_numpy()
+    total_outcome = outcomes['total_outcome'].to_numpy()
+
+    rows = []
+    for i in np.flatnonzero(outcomes['graded'].to_numpy()):
+        row = {k: v for k, v in picks[i].items() if k != 'matches'}
+        if spread_graded[i]:
+            row['spread_outcome'] = spread_outcome[i]
+        if total_graded[i]:
+            row['total_outcome'] = total_outcome[i]
+        rows.append(row)
+    return rows
 
 def grade_picks():
-    supabase = get_supabase_client()
+    storage = get_storage()
     print("1. 正在進行賽果結算 (Grading)...")
 
-    # 1. 抓取所有已完賽的比賽
+    # 1. 只抓「尚未結算、且比賽已完賽」的預測 (伺服器端 inner join)
+    #    不再下載全部歷史完賽比賽，每次只處理上次執行後新完賽的少數幾場
     try:
-        # 🔥 修復 1：加入關聯查詢 (Join)，抓取隊伍代號 (code)，避免 KeyError
-        matches = supabase.table("matches")\
-            .select("*, home_team:teams!matches_home_team_id_fkey(code), away_team:teams!matches_away_team_id_fkey(code)")\
-            .in_("status", ["STATUS_FINAL", "STATUS_FINISHED", "Final"])\
-            .execute().data
-            
-        if not matches:
-            print("📭 無已完賽的比賽。")
-            return
-        
-        # 建立 match_id -> match 對照表
-        finished_matches = {m['id']: m for m in matches}
-        
-    except Exception as e:
-        print(f"❌ 查詢比賽失敗: {e}")
-        return
-
-    # 2. 抓取所有尚未結算的預測
-    try:
-        # 抓取 spread_outcome 為空的預測
-        picks = supabase.table("aggregated_picks").select("*").is_("spread_outcome", "null").execute().data
+        # 抓取 spread_outcome 為空的預測，連同對應比賽的比分與隊伍代號 (code)
+        picks = storage.ungraded_finished_picks(FINISHED_STATUSES)
     except Exception as e:
         print(f"❌ 查詢預測失敗: {e}")
         return
@@ -36,83 +104,58 @@ def grade_picks():
         print("✅ 無需結算的預測。")
         return
 
-    updates_count = 0
-    print(f"2. 掃描 {len(picks)} 筆待結算預測...")
+    print(f"2. 掃描 {len(picks)} 筆待結算預測 (比賽已完賽)...")
     
-    for pick in picks:
-        match_id = pick['match_id']
-        if match_id not in finished_matches:
-            continue
-            
-        match = finished_matches[match_id]
-        
-        # 取得比分
-        home_score = match['home_score']
-        away_score = match['away_score']
-        
-        if home_score is None or away_score is None:
-            continue
-
-        updates = {}
-        should_update = False
-
-        # --- A. 結算讓分盤 (Spread) ---
-        if pick.get('line_info'):
-            try:
-                line_val = float(pick['line_info'])
-                rec_team_id = pick['recommended_team_id']
-                
-                # 計算主隊贏分
-                home_margin = home_score - away_score
-                
-                # 如果 AI 推薦主隊
-                if rec_team_id == match['home_team_id']:
-                    if (home_margin + line_val) > 0: result = "WIN"
-                    elif (home_margin + line_val) < 0: result = "LOSS"
-                    else: result = "PUSH"
-                # 如果 AI 推薦客隊
-                else:
-                    if (home_margin + line_val) > 0: result = "LOSS" 
-                    elif (home_margin + line_val) < 0: result = "WIN"
-                    else: result = "PUSH"
-
-                updates["spread_outcome"] = result
-                should_update = True
-            except Exception as e:
-                print(f"   ⚠️ Spread Error ID {pick['id']}: {e}")
-
-        # --- B. 結算大小分 (Total) ---
-        if pick.get('ou_pick') and pick.get('ou_line'):
-            try:
-                pick_type = pick['ou_pick']
-                line_val = float(pick['ou_line'])
-                total_score = home_score + away_score
-                
-                result = "PUSH"
-                if total_score > line_val:
-                    result = "WIN" if pick_type == 'OVER' else "LOSS"
-                elif total_score < line_val:
-                    result = "WIN" if pick_type == 'UNDER' else "LOSS"
-                
-                updates["total_outcome"] = result 
-                should_update = True
-            except Exception as e:
-                print(f"   ⚠️ Total Error ID {pick['id']}: {e}")
-
-        # --- 執行更新 ---
-        if should_update:
-            try:
-                supabase.table("aggregated_picks").update(updates).eq("id", pick['id']).execute()
-                updates_count += 1
-                # 🔥 修復 2：這裡現在可以安全地存取 home_team code 了
-                h_code = match['home_team']['code'] if match.get('home_team') else 'HOME'
-                a_code = match['away_team']['code'] if match.get('away_team') else 'AWAY'
-                
-                print(f"   ✅ Match {a_code} @ {h_code} -> {updates}")
-            except Exception as e:
-                print(f"   ❌ Update Failed ID {pick['id']}: {e}")
+    # 3. 整批結算 (向量化)
+    outcomes = compute_outcomes(picks)
+    rows = build_updates(picks, outcomes)
+    if not rows:
+        print("✅ 沒有可結算的預測 (缺少比分或盤口)。")
+        return
+    
+    # 4. 一次批次寫回
+    updates_count = 0
+    for start in range(0, len(rows), UPSERT_CHUNK):
+        chunk = rows[start:start + UPSERT_CHUNK]
+        try:
+            storage.upsert_picks(chunk)
+            updates_count += len(chunk)
+        except Exception as e:
+            print(f"   ❌ Update Failed ({len(chunk)} 筆): {e}")
+
+    for pick, row in list(zip([picks[i] for i in np.flatnonzero(outcomes['graded'].to_numpy())], rows))[:20]:
+        match = pick['matches']
+        h_code = match['home_team']['code'] if match.get('home_team') else 'HOME'
+        a_code = match['away_team']['code'] if match.get('away_team') else 'AWAY'
+        print(f"   ✅ Match {a_code} @ {h_code} -> spread: {row.get('spread_outcome')}, total: {row.get('total_outcome')}")
 
     print(f"🎉 結算完成！共更新 {updates_count} 筆資料。")
 
+def benchmark_grading(n=10000, seed=42):
+    """回補 n 筆預測的結算耗時 (不含網路)：向量化結算 + 組出寫回資料，以及需要的寫入次數。"""
+    import time
+    rng = np.random.default_rng(seed)
+    home = rng.integers(85, 135, n)
+    away = rng.integers(85, 135, n)
+    picks = [{
+        'id': i, 'match_id': i, 'recommended_team_id': int(rng.integers(0, 2)),
+        'line_info': str(float(rng.integers(-24, 24)) / 2), 'ou_pick': 'OVER' if rng.random() > 0.5 else 'UNDER',
+        'ou_line': float(rng.integers(400, 480)) / 2, 'spread_outcome': None, 'total_outcome': None,
+        'matches': {'home_team_id': 1, 'away_team_id': 0, 'home_score': int(home[i]), 'away_score': int(away[i])},
+    } for i in range(n)]
+
+    start = time.perf_counter()
+    rows = build_updates(picks, compute_outcomes(picks))
+    elapsed = time.perf_counter() - start
+    writes = -(-len(rows) // UPSERT_CHUNK)
+    print(f"🔬 結算 {n} 筆: {elapsed * 1000:.1f} ms ({n / elapsed:,.0f} 筆/秒) | 寫入 {writes} 次 upsert (逐筆更新需 {len(rows)} 次)")
+    return elapsed
+
 if __name__ == "__main__":
-    grade_picks()
\ No newline at end of file
+    # 效能測試：python grade_picks.py --benchmark [筆數]
+    import sys
+    if '--benchmark' in sys.argv:
+        idx = sys.argv.index('--benchmark')
+        benchmark_grading(int(sys.argv[idx + 1]) if len(sys.argv) > idx + 1 else 10000)
+    else:
+        grade_picks()
\ No newline at end of file
@@ -1,81 +1,162 @@
+import os
+import time
+import numpy as np
 import pandas as pd
-from config import get_supabase_client
-from datetime import datetime, timedelta
-import pytz
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from storage import get_storage
+from reference_data import get_nba_id_map
+from datetime import datetime, timedelta, timezone
+
+# ==========================================
+# 批次匯入設定
+# ==========================================
+GAMES_CSV = 'data/Games.csv'
+IMPORT_YEARS = int(os.environ.get("IMPORT_YEARS", 3))               # 只匯入最近幾年
+IMPORT_CHUNK_ROWS = int(os.environ.get("IMPORT_CHUNK_ROWS", 50000))  # 每次從 CSV 讀入的列數
+IMPORT_BATCH = int(os.environ.get("IMPORT_BATCH", 500))              # 每次 upsert 的筆數
+IMPORT_WRITERS = int(os.environ.get("IMPORT_WRITERS", 4))            # 同時寫入的執行緒數
+
+CSV_COLS = ['gameDateTimeEst', 'hometeamId', 'awayteamId', 'homeScore', 'awayScore']
+KEY_COLS = ['date_key', 'home_team_id', 'away_team_id']
+
+
+def load_existing_matches(storage, since):
+    """查出 since 之後已存在的比賽 (id / 狀態 / 比分)，用來判斷新增、更新或略過。"""
+    rows = storage.list_matches(columns='id, date, home_team_id, away_team_id, status, home_score, away_score',
+                                date_from=since)
+
+    existing = pd.DataFrame(rows, columns=['id', 'date', 'home_team_id', 'away_team_id', 'status', 'home_score', 'away_score'])
+    existing['date_key'] = existing['date'].astype(str).str[:10]
+    existing = existing.drop(columns='date').drop_duplicates(KEY_COLS)
+    return existing.rename(columns={'id': 'stored_id', 'status': 'stored_status',
+                                    'home_score': 'stored_home', 'away_score': 'stored_away'})
+
+
+def build_rows(chunk, nba_id_map, cutoff_date):
+    """
+    向量化把一段 Games.csv 轉成 matches 欄位：
+    球隊 nba id -> 資料庫 id、有比分即為完賽，找不到球隊或早於 cutoff 的比賽直接濾掉。
+    """
+    game_time = pd.to_datetime(chunk['gameDateTimeEst'], utc=True)
+    home_id = pd.to_numeric(chunk['hometeamId'], errors='coerce').map(nba_id_map)
+    away_id = pd.to_numeric(chunk['awayteamId'], errors='coerce').map(nba_id_map)
+    keep = (game_time >= cutoff_date) & home_id.notna() & away_id.notna()
+
+    game_time = game_time[keep]
+    home_score = pd.to_numeric(chunk.loc[keep, 'homeScore'], errors='coerce')
+    away_score = pd.to_numeric(chunk.loc[keep, 'awayScore'], errors='coerce')
+    finished = home_score.notna() & away_score.notna()
+
+    return pd.DataFrame({
+        'date': game_time.dt.strftime('%Y-%m-%dT%H:%M:%S+00:00'),
+        'date_key': game_time.dt.strftime('%Y-%m-%d'),
+        'home_team_id': home_id[keep].astype('int64'),
+        'away_team_id': away_id[keep].astype('int64'),
+        'status': np.where(finished, "STATUS_FINISHED", "STATUS_SCHEDULED"),
+        'home_score': home_score.where(finished).astype('Int64'),
+        'away_score': away_score.where(finished).astype('Int64'),
+    })
+
+
+def split_writes(rows, existing):
+    """
+    對照資料庫快照：不存在 -> 新增；狀態或比分不同 -> 帶 id 更新；完全相同 -> 略過。
+    重複執行只會寫入真的有變的比賽 (冪等)。
+    """
+    merged = rows.merge(existing, on=KEY_COLS, how='left')
+    is_new = merged['stored_id'].isna()
+
+    def differs(new, old):
+        old = pd.to_numeric(old, errors='coerce')
+        return (new.isna() != old.isna()) | (new.notna() & old.notna() & (new.astype('float64') != old))
+
+    changed = ~is_new & (
+        (merged['status'] != merged['stored_status'])
+        | differs(merged['home_score'], merged['stored_home'])
+        | differs(merged['away_score'], merged['stored_away'])
+    )
+    out = merged[is_new | changed].copy()
+    out['id'] = out['stored_id'].astype('Int64')
+
+    cols = ['id', 'date', 'home_team_id', 'away_team_id', 'status', 'home_score', 'away_score']
+    records = out[cols].astype(object).where(out[cols].notna(), None).to_dict('records')
+    for r in records:
+        if r['id'] is None:
+            del r['id']   # 新比賽：id 由資料庫預設值產生
+    return records, int(is_new.sum()), int(changed.sum())
+
+
+def _write_batch(storage, batch):
+    # 沒帶 id 的新比賽使用欄位預設值
+    storage.upsert_matches(batch)
+    return len(batch)
+
 
 def import_strict_lite():
-    supabase = get_supabase_client()
-    print("🧹 [Reset Lite] 正在匯入賽程 (輕量版: 只抓近 3 年)...")
+    storage = get_storage()
+    print(f"🧹 [Reset Lite] 正在匯入賽程 (輕量版: 只抓近 {IMPORT_YEARS} 年，批次並行寫入)...")
+    start = time.perf_counter()
+
+    # 設定截斷點：從今天往前推 N 年
+    cutoff_date = datetime.now(timezone.utc) - timedelta(days=365 * IMPORT_YEARS)
 
+    # 預先快取球隊 ID 與既有比賽 (加速用)
+    print("🔄 快取球隊 ID map 與既有比賽...")
     try:
-        df = pd.read_csv('data/Games.csv', low_memory=False)
-        print(f"📂 原始 CSV 共有 {len(df)} 筆資料")
+        nba_id_map = get_nba_id_map(storage)
+        existing = load_existing_matches(storage, cutoff_date.strftime('%Y-%m-%d'))
     except Exception as e:
-        print(f"❌ 讀取失敗: {e}")
+        print(f"❌ 讀取資料庫失敗: {e}")
         return
-
-    # 1. 時間處理
-    df['gameDateTimeEst'] = pd.to_datetime(df['gameDateTimeEst'], utc=True)
-    
-    # ==========================================
-    # 🔥 關鍵修改：只保留最近 3 年的數據
-    # ==========================================
-    # 設定截斷點：從今天往前推 3 年 (約 1000 天)
-    # 這樣大約會涵蓋 2023-2026 的賽季
-    cutoff_date = datetime.now(pytz.utc) - timedelta(days=365 * 3)
-    
-    # 進行過濾
-    df_recent = df[df['gameDateTimeEst'] >= cutoff_date]
-    print(f"📉 過濾後剩餘 {len(df_recent)} 筆 (僅保留 {cutoff_date.date()} 之後的比賽)")
-    
-    matches_to_insert = []
-    
-    # 預先快取球隊 ID (加速用)
-    print("🔄 快取球隊 ID map...")
-    teams_data = supabase.table('teams').select('id, nba_team_id').execute().data
-    nba_id_map = {t['nba_team_id']: t['id'] for t in teams_data if t['nba_team_id']}
+    print(f"   -> 球隊 {len(nba_id_map)} 隊，既有比賽 {len(existing)} 場")
 
     print("🚀 開始寫入 Supabase...")
+    scanned = kept = new_count = update_count = written = failed = 0
+    seen = set()
+
+    with ThreadPoolExecutor(max_workers=IMPORT_WRITERS) as pool:
+        in_flight = set()
+
+        def drain(limit):
+            # 同時在途的批次有上限，避免 CSV 讀得比資料庫寫得快而佔滿記憶體
+            nonlocal written, failed, in_flight
+            while len(in_flight) > limit:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    try:
+                        written += fut.result()
+                    except Exception as e:
+                        failed += 1
+                        print(f"   ⚠️ 批次寫入失敗: {e}")
 
-    for index, row in df_recent.iterrows():
         try:
-            h_nba_id = int(row['hometeamId'])
-            a_nba_id = int(row['awayteamId'])
-            
-            if h_nba_id not in nba_id_map or a_nba_id not in nba_id_map:
-                continue 
-
-            # 判斷狀態
-            if pd.notna(row['homeScore']) and pd.notna(row['awayScore']):
-                status = "STATUS_FINISHED"
-                h_score = int(row['homeScore'])
-                a_score = int(row['awayScore'])
-            else:
-                status = "STATUS_SCHEDULED"
-                h_score = None
-                a_score = None
-
-            matches_to_insert.append({
-                "date": row['gameDateTimeEst'].isoformat(),
-                "home_team_id": nba_id_map[h_nba_id],
-                "away_team_id": nba_id_map[a_nba_id],
-                "status": status,
-                "home_score": h_score,
-                "away_score": a_score
-            })
-
-            if len(matches_to_insert) >= 500:
-                supabase.table('matches').insert(matches_to_insert).execute()
-                matches_to_insert = []
-                print(f"   -> 已處理... (剩餘 {len(df_recent) - index} 筆)")
+            reader = pd.read_csv(GAMES_CSV, usecols=CSV_COLS, chunksize=IMPORT_CHUNK_ROWS, low_memory=False)
+            for chunk in reader:
+                scanned += len(chunk)
+                rows = build_rows(chunk, nba_id_map, cutoff_date)
+                # 同一場比賽在 CSV 中重複出現時只寫一次
+                key = rows['date_key'] + '|' + rows['home_team_id'].astype(str) + '|' + rows['away_team_id'].astype(str)
+                rows = rows[~key.isin(seen)].drop_duplicates(KEY_COLS, keep='last')
+                seen.update(key[rows.index])
+                kept += len(rows)
 
+                records, n_new, n_changed = split_writes(rows, existing)
+                new_count += n_new
+                update_count += n_changed
+                for i in range(0, len(records), IMPORT_BATCH):
+                    in_flight.add(pool.submit(_write_batch, storage, records[i:i + IMPORT_BATCH]))
+                    drain(IMPORT_WRITERS * 2)
+                print(f"   -> 已讀取 {scanned} 列，待寫入 {new_count + update_count} 場，已寫入 {written} 場")
         except Exception as e:
-            print(f"⚠️ Row {index} Error: {e}")
+            print(f"❌ 讀取失敗: {e}")
+        finally:
+            drain(0)
 
-    if matches_to_insert:
-        supabase.table('matches').insert(matches_to_insert).execute()
-    
+    elapsed = time.perf_counter() - start
+    print(f"📉 CSV 共 {scanned} 筆，符合條件 {kept} 筆 (僅保留 {cutoff_date.date()} 之後的比賽)")
+    print(f"   🧮 新增 {new_count}、更新 {update_count}、未變動略過 {kept - new_count - update_count} | "
+          f"寫入 {written} 場 ({failed} 批失敗)，耗時 {elapsed:.1f}s")
     print("✅ 輕量化匯入完成！資料庫現在很乾淨。")
 
 if __name__ == "__main__":
-    import_strict_lite()
\ No newline at end of file
+    import_strict_lite()
@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+from storage import get_storage
+from espn_client import fetch_changed_scoreboards, commit_scoreboards, parse_event, parse_odds
+from reference_data import get_team_map
+from row_diff import diff_row, report_write_reduction
+
+# ==========================================
+# 賽程 + 盤口 合併匯入 (每 15 分鐘的排程使用)
+# 每天的 scoreboard 只下載、解析一次，同時取出比分 / 狀態與盤口，
+# 最後用一次查詢 + 一次 upsert 寫回 matches (只寫入值真的有變的比賽)
+# ==========================================
+SCHEDULE_DAYS = range(-1, 3)   # 昨天 ~ 後天 (同 scrape_schedule)
+ODDS_DAYS = range(0, 2)        # 今天、明天 (同 scrape_odds)
+
+
+def _display_date(date_str):
+    return f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:]}"
+
+
+def _next_day(date_str):
+    # 資料庫存 timestamp：最後一天用「< 隔天」才包含當天所有時間的比賽
+    return (datetime.strptime(date_str, '%Y%m%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+def parse_scoreboards(payloads, team_map, odds_dates):
+    """
+    scoreboard JSON -> {(日期, 主隊 id, 客隊 id): 寫入資料}。
+    未開賽且在盤口日期內的比賽，一併帶上 vegas_spread / vegas_total。
+    """
+    scraped = {}
+    for date_str, data in payloads.items():
+        if data is None:
+            continue
+        display_date = _display_date(date_str)
+        events = data.get('events', [])
+        if not events:
+            print(f"   -> {display_date} 📭 無比賽")
+            continue
+
+        for event in events:
+            try:
+                game = parse_event(event)
+                h_id = team_map.get(game['home_abbr'])
+                a_id = team_map.get(game['away_abbr'])
+                if not h_id or not a_id:
+                    continue
+
+                row = {
+                    "date": display_date,
+                    "start_time": game['start_time'],
+                    "home_team_id": h_id,
+                    "away_team_id": a_id,
+                    "status": game['status'],
+                    "home_score": game['home_score'],
+                    "away_score": game['away_score'],
+                }
+                if date_str in odds_dates and game['status'] == "STATUS_SCHEDULED":
+                    vegas_spread, vegas_total = parse_odds(game['competition'], game['home_abbr'])
+                    if vegas_spread is not None: row["vegas_spread"] = vegas_spread
+                    if vegas_total is not None: row["vegas_total"] = vegas_total
+
+                scraped[(display_date, h_id, a_id)] = row
+            except Exception as e:
+                print(f"      ❌ 處理錯誤: {e}")
+    return scraped
+
+
+def ingest_scoreboard():
+    today = datetime.now()
+    dates = [(today + timedelta(days=i)).strftime('%Y%m%d') for i in SCHEDULE_DAYS]
+    odds_dates = {(today + timedelta(days=i)).strftime('%Y%m%d') for i in ODDS_DAYS}
+    print(f"🕵️‍♂️ 啟動賽程 + 盤口更新 (來源: ESPN)，目標日期: {dates}")
+
+    # 1. 所有日期一次平行條件式下載；內容沒變的日期直接跳過，有變的每天只解析一次
+    payloads = fetch_changed_scoreboards(dates)
+    if not payloads:
+        print("✅ 所有日期內容皆未變動，略過解析與寫入。")
+        return
+
+    storage = get_storage()
+    team_map = get_team_map(storage)
+    scraped = parse_scoreboards(payloads, team_map, odds_dates)
+    if not scraped:
+        commit_scoreboards(payloads)
+        print("🎉 完成！沒有需要寫入的比賽 (ESPN Source)。")
+        return
+
+    # 2. 一次查出窗口內既有比賽的快照，比對後只 upsert 有變動的列
+    try:
+        existing = storage.list_matches(
+            columns='id, date, start_time, home_team_id, away_team_id, status, home_score, away_score, vegas_spread, vegas_total',
+            date_from=_display_date(dates[0]), date_before=_next_day(dates[-1]))
+        existing_map = {(str(m['date'])[:10], m['home_team_id'], m['away_team_id']): m for m in existing}
+
+        rows = []
+        new_count = odds_count = 0
+        for key, row in scraped.items():
+            if 'vegas_spread' in row or 'vegas_total' in row:
+                odds_count += 1
+            stored = existing_map.get(key)
+            # 批次 upsert 的欄位是所有列的聯集：沒抓到盤口的比賽保留資料庫現有值，避免被清空
+            row = dict(row)
+            for col in ('vegas_spread', 'vegas_total'):
+                if col not in row:
+                    row[col] = stored.get(col) if stored else None
+            if stored:
+                if not diff_row(row, stored):
+                    continue  # 與資料庫完全相同，不寫入
+                row['id'] = stored['id']
+            else:
+                new_count += 1
+            rows.append(row)
+
+        if rows:
+            # 沒帶 id 的新比賽使用欄位預設值
+            storage.upsert_matches(rows)
+        # 寫入成功才記錄快取，失敗的話下次會重新處理
+        commit_scoreboards(payloads)
+        report_write_reduction(len(scraped), len(rows))
+        print(f"🎉 完成！共寫入 {len(rows)} 場比賽 (新增 {new_count}、含盤口 {odds_count}) (ESPN Source，單次批次寫入)。")
+    except Exception as e:
+        print(f"❌ 批次寫入失敗: {e}")
+
+
+if __name__ == "__main__":
+    ingest_scoreboard()
@@ -1,22 +1,24 @@
-from config import get_supabase_client
+from storage import get_storage
+from reference_data import invalidate_reference
 
 def test_connection():
-    print("正在連線到 Supabase...")
-    supabase = get_supabase_client()
+    print("正在連線到資料庫...")
+    storage = get_storage()
     
     # 測試寫入資料：新增一個聯盟 "NBA"
     # upsert 的意思是：如果 "NBA" 已經存在就更新，不存在就新增
     data = {"name": "NBA"}
     
     try:
-        response = supabase.table("leagues").upsert(data).execute()
+        response = storage.upsert_leagues(data)
+        invalidate_reference()  # 聯盟有異動，參考資料快取失效
         print("✅ 寫入成功！資料庫回應：")
-        print(response.data)
+        print(response)
         
         # 測試讀取資料
-        read_response = supabase.table("leagues").select("*").execute()
+        leagues = storage.list_leagues()
         print("\n📋 目前資料庫裡的聯盟：")
-        for league in read_response.data:
+        for league in leagues:
             print(f"- ID: {league['id']}, Name: {league['name']}")
             
     except Exception as e:
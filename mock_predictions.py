@@ -1,13 +1,12 @@
 import random
-from config import get_supabase_client
+from storage import get_storage
 
 def generate_mock_predictions():
-    supabase = get_supabase_client()
+    storage = get_storage()
     
     print("1. 取得尚未開打的比賽 (Real Matches)...")
     # 這裡我們只抓狀態是 SCHEDULED 的比賽
-    matches_res = supabase.table("matches").select("id, home_team_id, away_team_id").eq("status", "STATUS_SCHEDULED").execute()
-    matches = matches_res.data
+    matches = storage.list_matches(columns="id, home_team_id, away_team_id", status="STATUS_SCHEDULED")
     
     if not matches:
         print("⚠️ 目前沒有 'SCHEDULED' 的比賽，無法生成預測。請確認 scrape_schedule.py 是否有抓到未來的比賽。")
@@ -16,8 +15,7 @@ def generate_mock_predictions():
     print(f"📊 找到 {len(matches)} 場待賽，準備生成預測數據...")
 
     print("2. 取得預測來源 (Sources)...")
-    sources_res = supabase.table("sources").select("id, name").execute()
-    sources = sources_res.data # e.g., [{'id': 1, 'name': 'ESPN'}, {'id': 2, 'name': 'Vegas'}]
+    sources = storage.list_sources() # e.g., [{'id': 1, 'name': 'ESPN'}, {'id': 2, 'name': 'Vegas'}]
 
     predictions_to_insert = []
 
@@ -50,7 +48,7 @@ def generate_mock_predictions():
     try:
         # 這裡不使用 upsert，因為預測可能會變動，我們先用 insert 簡單測試
         # 實務上我們會檢查是否已存在，但 MVP 先求有
-        supabase.table("raw_predictions").insert(predictions_to_insert).execute()
+        storage.insert_raw_predictions(predictions_to_insert)
         print("🎉 成功！模擬預測數據已注入資料庫！")
         
         # 預覽結果
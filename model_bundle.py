@@ -0,0 +1,142 @@
+import os
+import json
+import hashlib
+import zipfile
+from datetime import datetime
+import xgboost as xgb
+from ensemble_predictor import BoosterEnsemble
+from feature_pipeline import build_feature_lists
+
+# ==========================================
+# 統一模型包 (Model Bundle)
+# 一個 zip 檔內含：manifest.json (特徵列表 / 窗口設定 / schema hash)
+# + 每個種子 Booster 的 XGBoost 原生 UBJSON，取代 6 個分開的 pickle
+# ==========================================
+BUNDLE_PATH = 'model_bundle.zip'
+BUNDLE_VERSION = 1
+MANIFEST = 'manifest.json'
+
+# 模型名稱 -> 使用的特徵集合
+MODEL_FEATURE_SETS = {'win': 'spread', 'spread': 'spread', 'total': 'total'}
+
+
+def schema_hash(features, windows):
+    """特徵列表 + 窗口設定的指紋，任何一邊改變都會得到不同的 hash。"""
+    payload = json.dumps({'features': features, 'windows': list(windows)}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def save_bundle(models, features, windows, path=BUNDLE_PATH, extra=None):
+    """
+    models:   {'win': BoosterEnsemble, 'spread': ..., 'total': ...}
+    features: {'spread': [...], 'total': [...]}
+    extra:    其他要記錄在 manifest 的資訊 (例如驗證分數)
+    """
+    manifest = {
+        'bundle_version': BUNDLE_VERSION,
+        'created_at': datetime.utcnow().isoformat(),
+        'windows': list(windows),
+        'features': features,
+        'schema_hash': schema_hash(features, windows),
+        'models': {},
+    }
+    manifest.update(extra or {})
+
+    tmp_path = path + '.tmp'
+    with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, ensemble in models.items():
+            members = []
+            for i, booster in enumerate(ensemble.boosters):
+                member = f'{name}/booster_{i}.ubj'
+                zf.writestr(member, bytes(booster.save_raw('ubj')))
+                members.append(member)
+            manifest['models'][name] = {
+                'kind': ensemble.kind,
+                'classes': [c.item() if hasattr(c, 'item') else c for c in ensemble.classes_],
+                'feature_set': MODEL_FEATURE_SETS[name],
+                'boosters': members,
+                'n_trees': [b.num_boosted_rounds() for b in ensemble.boosters],
+            }
+            # 早停訓練的模型：記錄每個種子的最佳輪數 (Booster 已截斷到該輪)
+            best = [b.attr('best_iteration') for b in ensemble.boosters]
+            if all(it is not None for it in best):
+                manifest['models'][name]['best_iterations'] = [int(it) for it in best]
+        zf.writestr(MANIFEST, json.dumps(manifest, indent=2))
+
+    os.replace(tmp_path, path)
+    return manifest
+
+
+class ModelBundle:
+    """只在 load 時讀 manifest；Booster 在第一次用到該模型時才載入。"""
+
+    def __init__(self, path, manifest):
+        self.path = path
+        self.manifest = manifest
+        self._models = {}
+
+    @classmethod
+    def load(cls, path=BUNDLE_PATH):
+        with zipfile.ZipFile(path) as zf:
+            manifest = json.loads(zf.read(MANIFEST))
+        bundle = cls(path, manifest)
+        bundle.validate()
+        return bundle
+
+    def validate(self):
+        """版本、schema hash 與目前特徵管線不一致時直接報錯，避免拿錯模型預測。"""
+        m = self.manifest
+        if m.get('bundle_version') != BUNDLE_VERSION:
+            raise ValueError(f"模型包版本不符: {m.get('bundle_version')} (需要 {BUNDLE_VERSION})")
+        if m.get('schema_hash') != schema_hash(m['features'], m['windows']):
+            raise ValueError("模型包 schema hash 驗證失敗 (特徵列表或窗口設定被修改)")
+
+        expected_spread, expected_total = build_feature_lists(m['windows'])
+        for set_name, expected in (('spread', expected_spread), ('total', expected_total)):
+            unknown = set(m['features'][set_name]) - set(expected)
+            if unknown:
+                raise ValueError(f"模型包的 {set_name} 特徵與特徵管線不一致: {sorted(unknown)[:5]}")
+
+    @property
+    def windows(self):
+        return self.manifest['windows']
+
+    def features(self, name):
+        """模型 (win / spread / total) 或特徵集合 (spread / total) 對應的特徵列表。"""
+        set_name = self.manifest['models'][name]['feature_set'] if name in self.manifest['models'] else name
+        return self.manifest['features'][set_name]
+
+    def model(self, name):
+        if name not in self._models:
+            info = self.manifest['models'][name]
+            boosters = []
+            with zipfile.ZipFile(self.path) as zf:
+                for member in info['boosters']:
+                    booster = xgb.Booster()
+                    booster.load_model(bytearray(zf.read(member)))
+                    boosters.append(booster)
+            self._models[name] = BoosterEnsemble(
+                boosters, kind=info['kind'], classes=info['classes'],
+                feature_names=self.features(name)
+            )
+        return self._models[name]
+
+
+def convert_pickles(path=BUNDLE_PATH):
+    """把舊版 6 個 pickle (model_*.pkl / features_*.pkl / rolling_config.pkl) 轉成模型包。"""
+    import joblib
+    models = {name: BoosterEnsemble.from_voting(joblib.load(f'model_{name}.pkl')) for name in MODEL_FEATURE_SETS}
+    features = {'spread': list(joblib.load('features_spread.pkl')), 'total': list(joblib.load('features_total.pkl'))}
+    windows = list(joblib.load('rolling_config.pkl'))
+    return save_bundle(models, features, windows, path)
+
+
+if __name__ == "__main__":
+    # 舊版 pickle 轉檔：python model_bundle.py --from-pickles
+    import sys
+    if '--from-pickles' in sys.argv:
+        manifest = convert_pickles()
+        print(f"✅ 已轉換為 {BUNDLE_PATH} (schema: {manifest['schema_hash'][:12]})")
+    else:
+        bundle = ModelBundle.load()
+        print(json.dumps({k: v for k, v in bundle.manifest.items() if k != 'features'}, indent=2))
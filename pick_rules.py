@@ -0,0 +1,46 @@
+import numpy as np
+
+# ==========================================
+# 選邊 / 信心分數規則 (向量化)
+# aggregate_picks 上線預測、replay 回放模擬與 backtest 回測共用同一份規則
+# ==========================================
+DEFAULT_SPREAD = 0.0    # 沒有盤口時視為平手盤
+DEFAULT_TOTAL = 225.0   # 沒有大小分盤口時的預設值
+MAX_SPREAD_CONF = 95
+MAX_OU_CONF = 90
+
+
+def fill_lines(vegas_spread, vegas_total):
+    """盤口缺值 (None / NaN) 補預設值，回傳 float 陣列。"""
+    spread = np.array(vegas_spread, dtype=float)
+    total = np.array(vegas_total, dtype=float)
+    spread[np.isnan(spread)] = DEFAULT_SPREAD
+    total[np.isnan(total)] = DEFAULT_TOTAL
+    return spread, total
+
+
+def spread_picks(pred_margin, vegas_spread):
+    """
+    讓分選邊：預測主隊贏分 > -盤口 就選主隊，否則選客隊。
+    信心 = 50 + int(|預測 - 切點| * 4)，上限 95。
+    回傳 (rec_is_home, confidence)。
+    """
+    pred_margin = np.asarray(pred_margin, dtype=float)
+    cutoff = np.asarray(vegas_spread, dtype=float) * -1
+    rec_is_home = pred_margin > cutoff
+    diff = np.abs(pred_margin - cutoff)
+    conf = np.minimum(50 + np.trunc(diff * 4).astype(int), MAX_SPREAD_CONF)
+    return rec_is_home, conf
+
+
+def total_picks(pred_total, vegas_total):
+    """
+    大小分：預測總分 > 盤口 為 OVER，否則 UNDER。
+    信心 = 50 + int(|預測 - 盤口| * 3)，上限 90。
+    回傳 (ou_pick, ou_confidence)。
+    """
+    pred_total = np.asarray(pred_total, dtype=float)
+    vegas_total = np.asarray(vegas_total, dtype=float)
+    ou_pick = np.where(pred_total > vegas_total, 'OVER', 'UNDER')
+    ou_conf = np.minimum(50 + np.trunc(np.abs(pred_total - vegas_total) * 3).astype(int), MAX_OU_CONF)
+    return ou_pick, ou_conf
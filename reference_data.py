@@ -0,0 +1,101 @@
+import os
+import json
+import time
+from storage import get_storage, STORAGE_BACKEND, SQLITE_PATH
+
+# ==========================================
+# 參考資料快取 (teams / leagues)
+# 球隊、聯盟幾乎不會變：存成本機 JSON，TTL 內所有腳本直接讀檔，不再查資料庫
+# 新增 / 修改球隊或聯盟後 (scrape_teams.py / main.py) 會自動失效重抓
+# ==========================================
+REF_CACHE_DIR = 'data/.cache/reference'
+REF_CACHE_TTL_HOURS = float(os.environ.get("REF_CACHE_TTL_HOURS", 24))
+
+# ESPN 的代碼有時候跟我們的稍微不一樣 (ESPN 代碼 -> 資料庫代碼)
+ESPN_ALIASES = {
+    'UTA': 'UTAH', 'NOP': 'NO', 'NYK': 'NY', 'SAS': 'SA', 'GSW': 'GS', 'WSH': 'WSH'
+}
+
+# 同一個程序內只讀一次檔
+_reference = None
+
+
+def _cache_path(backend):
+    return os.path.join(REF_CACHE_DIR, f'{backend}.json')
+
+
+def _source(backend):
+    """快取對應的資料來源 (換了資料庫就不能沿用舊的 id)。"""
+    return SQLITE_PATH if backend == 'sqlite' else os.environ.get("SUPABASE_URL", "")
+
+
+def load_reference(storage=None, refresh=False):
+    """{'teams': [...], 'leagues': [...]}：快取在 TTL 內就讀檔，否則查一次資料庫並寫回快取。"""
+    global _reference
+    backend = getattr(storage, 'backend', STORAGE_BACKEND) if storage is not None else STORAGE_BACKEND
+    if not refresh and _reference is not None and _reference['backend'] == backend:
+        return _reference
+
+    path = _cache_path(backend)
+    if not refresh:
+        try:
+            with open(path) as f:
+                cached = json.load(f)
+            fresh = time.time() - cached.get('fetched_at', 0) < REF_CACHE_TTL_HOURS * 3600
+            if fresh and cached.get('source') == _source(backend):
+                _reference = dict(cached, backend=backend)
+                return _reference
+        except (OSError, ValueError):
+            pass
+
+    storage = storage or get_storage()
+    reference = {
+        'source': _source(backend),
+        'fetched_at': time.time(),
+        'teams': storage.list_teams(),
+        'leagues': storage.list_leagues(),
+    }
+    os.makedirs(REF_CACHE_DIR, exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(reference, f)
+    os.replace(tmp_path, path)
+    print(f"   🔄 已更新參考資料快取: {len(reference['teams'])} 隊 / {len(reference['leagues'])} 個聯盟")
+
+    _reference = dict(reference, backend=backend)
+    return _reference
+
+
+def invalidate_reference():
+    """球隊 / 聯盟有異動時呼叫，下次讀取會重新查資料庫。"""
+    global _reference
+    _reference = None
+    for name in os.listdir(REF_CACHE_DIR) if os.path.isdir(REF_CACHE_DIR) else []:
+        os.remove(os.path.join(REF_CACHE_DIR, name))
+
+
+def get_team_map(storage=None):
+    """建立球隊代碼對照表 (Code -> ID)，包含 ESPN 特殊代碼轉換"""
+    team_map = {}
+    for t in load_reference(storage)['teams']:
+        team_map[t['code']] = t['id']
+        # 加上反向對應，確保 ESPN 的標準代碼也能找到
+        for espn_code, my_code in ESPN_ALIASES.items():
+            if my_code == t['code']:
+                team_map[espn_code] = t['id']
+    return team_map
+
+
+def get_nba_id_map(storage=None):
+    """NBA 官方 team id -> 資料庫球隊 ID"""
+    return {int(t['nba_team_id']): t['id'] for t in load_reference(storage)['teams'] if t.get('nba_team_id')}
+
+
+def get_league_id(name, storage=None):
+    """聯盟名稱 -> ID，找不到回傳 None"""
+    for refresh in (False, True):
+        # 快取裡找不到 (可能剛新增) 就重新查一次資料庫
+        for league in load_reference(storage, refresh=refresh)['leagues']:
+            if league['name'] == name:
+                return league['id']
+    return None
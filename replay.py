@@ -0,0 +1,109 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+from train_model import load_and_clean_data, prepare_training_data
+from model_bundle import BUNDLE_PATH, ModelBundle
+from pick_rules import fill_lines, spread_picks, total_picks
+from grade_picks import grade_spread, grade_total
+from backtest import season_of, load_lines, hit_rate
+
+# ==========================================
+# 歷史盤口回放模擬 (Replay)
+# 把一整季有盤口的歷史比賽，整批套用 aggregate_picks 的選邊 / 信心規則
+# 與 grade_picks 的結算規則 (全部向量化)，輸出各信心區間的命中率，
+# 方便快速掃描信心門檻。
+# 注意：模型包是用前 85% 的比賽訓練的，回放較早的球季屬於樣本內 (結果會偏樂觀)。
+# ==========================================
+REPLAY_LINES = os.environ.get("REPLAY_LINES", "data/historical_lines.csv")
+REPLAY_SEASON = os.environ.get("REPLAY_SEASON")   # 例如 2023 (= 2023-24 球季)；預設最近一季
+BUCKET_WIDTH = 5
+THRESHOLDS = list(range(50, 96, 5))
+
+
+def simulate(pred_margin, pred_total, vegas_spread, vegas_total, home_margin, total_score):
+    """整批選邊 + 結算，回傳每場一列的 DataFrame。"""
+    spread, total = fill_lines(vegas_spread, vegas_total)
+    rec_is_home, conf = spread_picks(pred_margin, spread)
+    ou_pick, ou_conf = total_picks(pred_total, total)
+    return pd.DataFrame({
+        'rec_is_home': rec_is_home,
+        'confidence_score': conf,
+        'spread_outcome': grade_spread(home_margin, spread, rec_is_home),
+        'ou_pick': ou_pick,
+        'ou_confidence': ou_conf,
+        'total_outcome': grade_total(total_score, total, ou_pick),
+    })
+
+
+def bucket_report(conf, outcomes, width=BUCKET_WIDTH):
+    """依信心分數分桶 (50-54, 55-59, ...)：場數 / 勝 / 負 / 和 / 命中率。"""
+    df = pd.DataFrame({'bucket': (np.asarray(conf) // width) * width, 'outcome': np.asarray(outcomes)})
+    counts = pd.crosstab(df['bucket'], df['outcome']).reindex(columns=['WIN', 'LOSS', 'PUSH'], fill_value=0)
+    counts['n'] = counts.sum(axis=1)
+    decided = counts['WIN'] + counts['LOSS']
+    counts['hit_rate'] = np.where(decided > 0, counts['WIN'] / decided.where(decided > 0, 1), np.nan)
+    counts.index = [f"{b}-{b + width - 1}" for b in counts.index]
+    return counts
+
+
+def threshold_sweep(conf, outcomes, thresholds=THRESHOLDS):
+    """只下注信心 >= 門檻的場次時的命中率與場數。"""
+    conf = np.asarray(conf)
+    outcomes = np.asarray(outcomes)
+    rows = []
+    for t in thresholds:
+        mask = conf >= t
+        rows.append({'threshold': t, 'n': int(mask.sum()), 'hit_rate': hit_rate(outcomes[mask])})
+    return pd.DataFrame(rows).set_index('threshold')
+
+
+def load_replay_games(lines_path=REPLAY_LINES, season=REPLAY_SEASON):
+    """指定球季、有盤口的歷史比賽 (特徵來自快取特徵庫，只用賽前資料)。"""
+    lines = load_lines(lines_path)
+    if lines is None:
+        return None
+
+    data = prepare_training_data(load_and_clean_data())
+    data['season'] = season_of(data['gameDateTimeEst_h'])
+    season = int(season) if season else int(data['season'].max())
+    games = data[data['season'] == season].merge(lines, on='gameId', how='inner')
+    print(f"   🏀 {season}-{str(season + 1)[-2:]} 球季：{len(games)} 場有盤口的比賽")
+    return games
+
+
+def replay():
+    games = load_replay_games()
+    if games is None or games.empty:
+        print("❌ 沒有可回放的比賽 (需要歷史盤口 CSV: gameId, vegas_spread, vegas_total)。")
+        return None
+
+    # 盤口 CSV 已附預測值時直接回放；否則用目前的模型包整批預測
+    if {'pred_margin', 'pred_total'}.issubset(games.columns):
+        pred_margin, pred_total = games['pred_margin'], games['pred_total']
+    else:
+        bundle = ModelBundle.load(BUNDLE_PATH)
+        pred_margin = bundle.model('spread').predict(games[bundle.features('spread')])
+        pred_total = bundle.model('total').predict(games[bundle.features('total')])
+
+    start = time.perf_counter()
+    result = simulate(pred_margin, pred_total, games['vegas_spread'], games['vegas_total'],
+                      games['target_margin'], games['target_total'])
+    elapsed = time.perf_counter() - start
+
+    print("\n" + "=" * 60)
+    print(f"🎬 Replay 結果 ({len(result)} 場，規則與上線相同)")
+    print("=" * 60)
+    for title, conf_col, outcome_col in (('讓分盤 (ATS)', 'confidence_score', 'spread_outcome'),
+                                         ('大小分 (O/U)', 'ou_confidence', 'total_outcome')):
+        print(f"\n📊 {title}：整體命中率 {hit_rate(result[outcome_col]) * 100:.2f}%")
+        print(bucket_report(result[conf_col], result[outcome_col]).to_string(float_format=lambda v: f"{v:.3f}"))
+        print(f"\n   🎚️ 信心門檻掃描")
+        print(threshold_sweep(result[conf_col], result[outcome_col]).to_string(float_format=lambda v: f"{v:.3f}"))
+
+    print(f"\n   ⚡ 選邊 + 結算: {elapsed * 1000:.1f} ms ({len(result) / max(elapsed, 1e-9):,.0f} 場/秒)")
+    return result
+
+
+if __name__ == "__main__":
+    replay()
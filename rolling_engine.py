@@ -0,0 +1,54 @@
+import numpy as np
+
+# ==========================================
+# 向量化多重窗口滾動平均引擎
+# 一次處理所有窗口 × 所有欄位，取代 groupby().apply(rolling) 迴圈
+# ==========================================
+
+
+def group_starts(group_ids):
+    """每一列所屬群組 (球隊) 的第一列位置。group_ids 必須已依群組排序。"""
+    n = len(group_ids)
+    boundary = np.ones(n, dtype=bool)
+    boundary[1:] = group_ids[1:] != group_ids[:-1]
+    return np.maximum.accumulate(np.where(boundary, np.arange(n), 0))
+
+
+def rolling_means(values, group_ids, windows, shift=True, rows=None, dtype=np.float32):
+    """
+    以累積和 (cumsum) 計算每個群組內的多重窗口平均。
+
+    values:    (n, k) 數值矩陣，列需依 (球隊, 日期) 排序
+    group_ids: (n,) 群組代號 (teamId)
+    windows:   窗口大小列表，例如 [5, 10, 30]
+    shift:     True = 只看該列之前的 w 筆 (訓練用，等同 shift(1).rolling(w))
+               False = 包含該列本身 (預測用，等同 rolling(w))
+    rows:      只需要某些列的結果時傳入其位置 (例如每隊最後一列)
+    回傳 (len(rows), len(windows) * k) 的預先配置矩陣，欄位順序為「窗口在外、欄位在內」。
+    NaN 會被忽略，窗口內全為 NaN 時結果為 NaN (與 rolling(min_periods=1) 相同)。
+    """
+    values = np.asarray(values, dtype=np.float64)
+    group_ids = np.asarray(group_ids)
+    n, k = values.shape
+
+    # 累積和與有效值個數 (前面補一列 0，方便以 cs[end] - cs[begin] 取區間)
+    valid = ~np.isnan(values)
+    cs = np.zeros((n + 1, k))
+    np.cumsum(np.where(valid, values, 0.0), axis=0, out=cs[1:])
+    cc = np.zeros((n + 1, k))
+    np.cumsum(valid, axis=0, out=cc[1:])
+
+    starts = group_starts(group_ids)
+    if rows is None:
+        rows = np.arange(n)
+    else:
+        rows = np.asarray(rows)
+        starts = starts[rows]
+    end = rows if shift else rows + 1
+
+    out = np.empty((len(rows), len(windows) * k), dtype=dtype)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for j, w in enumerate(windows):
+            begin = np.maximum(end - w, starts)
+            out[:, j * k:(j + 1) * k] = (cs[end] - cs[begin]) / (cc[end] - cc[begin])
+    return out
@@ -0,0 +1,55 @@
+from datetime import date, datetime, timezone
+
+# ==========================================
+# 變更偵測：把爬到的值與資料庫現有快照比對，只寫入真正有變的列
+# ==========================================
+
+
+def _normalize(value):
+    """
+    讓「同一個值的不同寫法」比較相等：數字一律轉 float，ISO 時間轉成 UTC datetime，
+    只有日期的字串 (YYYY-MM-DD) 轉成 date。
+    """
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str) and 'T' in value:
+        try:
+            ts = datetime.fromisoformat(value.replace('Z', '+00:00'))
+            return ts.astimezone(timezone.utc) if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+        except ValueError:
+            return value
+    if isinstance(value, str) and len(value) == 10:
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _same(a, b):
+    a, b = _normalize(a), _normalize(b)
+    # 爬蟲寫入的是日期 (YYYY-MM-DD)，資料庫存的是 UTC timestamp：只比較 UTC 日曆日
+    if type(a) is date and isinstance(b, datetime):
+        return a == b.date()
+    if type(b) is date and isinstance(a, datetime):
+        return b == a.date()
+    return a == b
+
+
+def diff_row(row, stored, ignore=('id',)):
+    """回傳 row 中與 stored 不同的欄位 {欄位: 新值}；stored 為 None (新資料) 時回傳整列。"""
+    if stored is None:
+        return {k: v for k, v in row.items() if k not in ignore}
+    return {
+        k: v for k, v in row.items()
+        if k not in ignore and not _same(v, stored.get(k))
+    }
+
+
+def report_write_reduction(scanned, written, label='matches'):
+    """印出實際寫入 / 掃描筆數與減少的寫入比例。"""
+    saved = 1 - written / scanned if scanned else 0.0
+    print(f"   🧮 [{label}] 掃描 {scanned} 筆，實際寫入 {written} 筆 (寫入減少 {saved:.0%})")
+    return saved
@@ -1,52 +1,59 @@
-import requests
 import datetime
-import time
 import re
-from config import get_supabase_client
-
-# 使用 ESPN API 抓取真實盤口
-ESPN_SCOREBOARD_URL = "http://site.api.espn.com/apis/site/v2/sports/basketball/nba/scoreboard"
-
-def get_team_map(supabase):
-    """建立球隊代碼對照表 (Code -> ID)"""
-    # 注意：ESPN 的代碼通常跟我們的一樣 (LAL, BOS, GSW...)
-    # 唯獨要注意 UTAH (ESPN用UTA), NO (ESPN用NOP), NY (ESPN用NYK), SA (ESPN用SAS), GS (ESPN用GSW)
-    # 這裡做一個簡單的轉換字典
-    mapping_fix = {
-        'UTA': 'UTAH', 'NOP': 'NO', 'NYK': 'NY', 'SAS': 'SA', 'GSW': 'GS', 'WSH': 'WSH'
-    }
-    
-    teams = supabase.table("teams").select("id, code").execute().data
-    team_map = {}
-    for t in teams:
-        team_map[t['code']] = t['id']
-        # 加上反向對應，確保 ESPN 的標準代碼也能找到
-        for espn_code, my_code in mapping_fix.items():
-            if my_code == t['code']:
-                team_map[espn_code] = t['id']
-                
-    return team_map
+from storage import get_storage
+# 使用 ESPN API 抓取真實盤口 (與 scrape_schedule 共用連線池)
+from espn_client import fetch_scoreboards, parse_event, parse_odds
+from row_diff import diff_row, report_write_reduction
+# 球隊代碼對照表走本機參考資料快取 (ESPN 代碼如 UTA / NOP / NYK 會對應到我們的代碼)
+from reference_data import get_team_map
+
+SNAPSHOT_COLUMNS = "id, date, home_team_id, away_team_id, vegas_spread, vegas_total"
+
+
+def load_snapshot(storage, start, days):
+    """
+    查出 start 起 days 天內未開打的比賽，每天查一次 (一頁)。
+    資料庫存 UTC 時間，美國晚場會跨到隔天，所以多查一天。
+    """
+    snapshot = {}
+    for i in range(days + 1):
+        day = (start + datetime.timedelta(days=i)).strftime("%Y-%m-%d")
+        next_day = (start + datetime.timedelta(days=i + 1)).strftime("%Y-%m-%d")
+        page = storage.list_matches(columns=SNAPSHOT_COLUMNS, date_from=day, date_before=next_day,
+                                    status="STATUS_SCHEDULED", order='date')
+        for m in page:
+            snapshot.setdefault((m['home_team_id'], m['away_team_id']), m)
+    return snapshot
+
 
 def fetch_real_odds():
-    supabase = get_supabase_client()
+    storage = get_storage()
     print("📊 啟動真實盤口更新 (Source: ESPN)...")
 
     # 1. 準備工具
-    team_map = get_team_map(supabase)
+    team_map = get_team_map(storage)
     
     # 2. 抓取範圍：今天、明天
     today = datetime.datetime.now()
     target_dates = [(today + datetime.timedelta(days=i)).strftime("%Y%m%d") for i in range(2)]
 
     total_updated = 0
+    total_scanned = 0
+
+    # 未開打比賽的現有盤口快照：只查抓取日期內的比賽，一天一頁，(主隊, 客隊) -> 最早一場
+    try:
+        snapshot = load_snapshot(storage, today, len(target_dates))
+    except Exception as e:
+        print(f"❌ 查詢比賽失敗: {e}")
+        return
+
+    # 所有日期一次平行下載
+    payloads = fetch_scoreboards(target_dates)
 
     for date_str in target_dates:
         print(f"   -> 正在檢查 {date_str} 的盤口...")
-        try:
-            response = requests.get(ESPN_SCOREBOARD_URL, params={'dates': date_str}, timeout=10)
-            data = response.json()
-        except Exception as e:
-            print(f"      ⚠️ 下載失敗: {e}")
+        data = payloads[date_str]
+        if data is None:
             continue
 
         events = data.get('events', [])
@@ -56,15 +63,9 @@ def fetch_real_odds():
 
         for event in events:
             try:
-                competition = event['competitions'][0]
-                competitors = competition['competitors']
-                
-                # 取得主客隊代碼
-                home_comp = next(filter(lambda x: x['homeAway'] == 'home', competitors))
-                away_comp = next(filter(lambda x: x['homeAway'] == 'away', competitors))
-                
-                home_abbr = home_comp['team']['abbreviation']
-                away_abbr = away_comp['team']['abbreviation']
+                game = parse_event(event)
+                home_abbr = game['home_abbr']
+                away_abbr = game['away_abbr']
                 
                 h_id = team_map.get(home_abbr)
                 a_id = team_map.get(away_abbr)
@@ -73,66 +74,28 @@ def fetch_real_odds():
                     # print(f"      ⚠️ 找不到球隊 ID: {home_abbr} vs {away_abbr}")
                     continue
 
-                # --- 核心：解析 Odds ---
-                vegas_spread = None
-                vegas_total = None
-
-                if 'odds' in competition and len(competition['odds']) > 0:
-                    odds_obj = competition['odds'][0] # 通常取第一個莊家 (ESPN BET)
-                    
-                    # 1. 解析讓分 (Spread)
-                    # 格式通常是 "BOS -5.5" 或 "LAL -3.0"
-                    details = odds_obj.get('details', '')
-                    if details:
-                        try:
-                            # 分割字串，例如 "BOS -5.5" -> ["BOS", "-5.5"]
-                            parts = details.split(' ')
-                            if len(parts) >= 2:
-                                favored_team = parts[0]
-                                spread_val = float(parts[1])
-                                
-                                # 轉換邏輯：我們資料庫存的是「主隊讓分」
-                                # 如果 Favored 是主隊，Spread = -5.5
-                                # 如果 Favored 是客隊，Spread = +5.5 (代表主隊受讓)
-                                
-                                # 處理 ESPN 有時代碼不一致的問題 (e.g. NYK vs NY)
-                                # 我們比對是否 favored_team 在主隊的 mapping key 裡
-                                is_home_favored = (favored_team == home_abbr)
-                                
-                                if is_home_favored:
-                                    vegas_spread = spread_val if spread_val < 0 else -spread_val
-                                else:
-                                    vegas_spread = abs(spread_val) # 客隊讓分，主隊就是正的
-                        except:
-                            pass
-
-                    # 2. 解析大小分 (Over/Under)
-                    # 格式通常在 overUnder 欄位，例如 225.5
-                    ou_val = odds_obj.get('overUnder')
-                    if ou_val:
-                        vegas_total = float(ou_val)
+                # --- 核心：解析 Odds (主隊讓分 / 大小分) ---
+                vegas_spread, vegas_total = parse_odds(game['competition'], home_abbr)
 
                 # --- 寫入資料庫 ---
                 # 只有當我們抓到了盤口才更新
                 if vegas_spread is not None or vegas_total is not None:
                     # 尋找對應的比賽 (未開打)
-                    # 我們用 team ID 來找，不限制日期 (自動對應最近的一場)
+                    # 用 team ID 在抓取日期內的快照裡找 (對應最近的一場)
+                    stored = snapshot.get((h_id, a_id))
                     
-                    # 先查詢 ID
-                    matches = supabase.table("matches").select("id")\
-                        .eq("home_team_id", h_id)\
-                        .eq("away_team_id", a_id)\
-                        .eq("status", "STATUS_SCHEDULED")\
-                        .execute().data
-                    
-                    if matches:
-                        match_id = matches[0]['id']
-                        
+                    if stored:
                         update_data = {}
                         if vegas_spread is not None: update_data["vegas_spread"] = vegas_spread
                         if vegas_total is not None: update_data["vegas_total"] = vegas_total
                         
-                        supabase.table("matches").update(update_data).eq("id", match_id).execute()
+                        total_scanned += 1
+                        # 盤口沒變就不寫入
+                        if not diff_row(update_data, stored):
+                            continue
+                        
+                        storage.update_match(stored['id'], update_data)
+                        stored.update(update_data)
                         # print(f"      ✅ 更新盤口: {away_abbr} @ {home_abbr} -> Spread: {vegas_spread}, Total: {vegas_total}")
                         total_updated += 1
 
@@ -140,6 +103,7 @@ def fetch_real_odds():
                 # print(f"      ❌ 解析錯誤: {e}")
                 pass
 
+    report_write_reduction(total_scanned, total_updated, label='odds')
     print(f"🎉 完成！已更新 {total_updated} 場比賽的真實盤口。")
 
 if __name__ == "__main__":
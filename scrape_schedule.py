@@ -1,31 +1,14 @@
-import requests
-import time
 from datetime import datetime, timedelta
-from config import get_supabase_client
-
-# 改用 ESPN API (穩定、不擋 IP)
-ESPN_API_URL = "http://site.api.espn.com/apis/site/v2/sports/basketball/nba/scoreboard"
-
-def get_team_map(supabase):
-    """建立球隊代碼對照表 (Code -> ID)，包含 ESPN 特殊代碼轉換"""
-    # ESPN 的代碼有時候跟我們的稍微不一樣，這裡做對應
-    mapping_fix = {
-        'UTA': 'UTAH', 'NOP': 'NO', 'NYK': 'NY', 'SAS': 'SA', 'GSW': 'GS', 'WSH': 'WSH'
-    }
-    
-    teams = supabase.table('teams').select('id, code').execute().data
-    team_map = {}
-    for t in teams:
-        team_map[t['code']] = t['id']
-        # 加上反向對應
-        for espn_code, my_code in mapping_fix.items():
-            if my_code == t['code']:
-                team_map[espn_code] = t['id']
-    return team_map
+from storage import get_storage
+# 改用 ESPN API (穩定、不擋 IP)；與 scrape_odds 共用連線池
+from espn_client import fetch_scoreboards, parse_event
+from row_diff import diff_row, report_write_reduction
+# 球隊代碼對照表走本機參考資料快取 (含 ESPN 特殊代碼轉換)
+from reference_data import get_team_map
 
 def scrape_schedule():
-    supabase = get_supabase_client()
-    team_map = get_team_map(supabase)
+    storage = get_storage()
+    team_map = get_team_map(storage)
     
     # 設定抓取範圍：昨天、今天、明天、後天
     today = datetime.now()
@@ -33,7 +16,11 @@ def scrape_schedule():
     
     print(f"🕵️‍♂️ 啟動賽程更新 (來源: ESPN)，目標日期: {dates_to_scrape}")
     
-    total_processed = 0
+    # (日期, 主隊, 客隊) -> 寫入資料；所有日期收集完再一次寫入
+    scraped = {}
+
+    # 所有日期一次平行下載
+    payloads = fetch_scoreboards(dates_to_scrape)
 
     for date_str in dates_to_scrape:
         # 格式化顯示用日期 (YYYY-MM-DD)
@@ -41,13 +28,10 @@ def scrape_schedule():
         print(f"   -> 正在檢查 {display_date} ...")
         
         try:
-            # ESPN API 只需要 dates 參數，不需要複雜 Header
-            resp = requests.get(ESPN_API_URL, params={'dates': date_str}, timeout=10)
-            if resp.status_code != 200:
-                print(f"      ⚠️ API 錯誤: {resp.status_code}")
+            data = payloads[date_str]
+            if data is None:
                 continue
 
-            data = resp.json()
             events = data.get('events', [])
             
             if not events:
@@ -56,15 +40,9 @@ def scrape_schedule():
             
             for event in events:
                 try:
-                    competition = event['competitions'][0]
-                    competitors = competition['competitors']
-                    
-                    # 抓取主客隊資料
-                    home_comp = next(filter(lambda x: x['homeAway'] == 'home', competitors))
-                    away_comp = next(filter(lambda x: x['homeAway'] == 'away', competitors))
-                    
-                    home_abbr = home_comp['team']['abbreviation']
-                    away_abbr = away_comp['team']['abbreviation']
+                    game = parse_event(event)
+                    home_abbr = game['home_abbr']
+                    away_abbr = game['away_abbr']
                     
                     if home_abbr not in team_map or away_abbr not in team_map:
                         # print(f"      ⚠️ 找不到球隊: {away_abbr} @ {home_abbr}")
@@ -72,61 +50,63 @@ def scrape_schedule():
                         
                     h_id = team_map[home_abbr]
                     a_id = team_map[away_abbr]
-
-                    # 狀態判斷
-                    # ESPN status type: 'STATUS_SCHEDULED', 'STATUS_FINAL', 'STATUS_IN_PROGRESS'
-                    espn_status = event['status']['type']['name']
-                    if espn_status == 'STATUS_FINAL':
-                        status = "STATUS_FINISHED"
-                    elif espn_status == 'STATUS_IN_PROGRESS':
-                        status = "STATUS_IN_PROGRESS"
-                    else:
-                        status = "STATUS_SCHEDULED"
-
-                    # 處理分數
-                    h_score = int(home_comp['score']) if home_comp.get('score') else 0
-                    a_score = int(away_comp['score']) if away_comp.get('score') else 0
                     
                     # 準備寫入資料
                     match_data = {
                         "date": display_date,  # 強制對齊查詢日期 (YYYY-MM-DD)
-                        "start_time": event['date'], # ESPN 給的是 ISO UTC 時間
+                        "start_time": game['start_time'], # ESPN 給的是 ISO UTC 時間
                         "home_team_id": h_id,
                         "away_team_id": a_id,
-                        "status": status,
-                        "home_score": h_score,
-                        "away_score": a_score
+                        "status": game['status'],
+                        "home_score": game['home_score'],
+                        "away_score": game['away_score']
                     }
 
-                    # ==========================================
-                    # 🔥 穩健寫入邏輯：先檢查，後動作
-                    # ==========================================
-                    existing = supabase.table('matches').select('id')\
-                        .eq('date', display_date)\
-                        .eq('home_team_id', h_id)\
-                        .eq('away_team_id', a_id)\
-                        .execute().data
-                    
-                    if existing:
-                        # 存在 -> Update
-                        match_id = existing[0]['id']
-                        supabase.table('matches').update(match_data).eq('id', match_id).execute()
-                    else:
-                        # 不存在 -> Insert
-                        supabase.table('matches').insert(match_data).execute()
-                        print(f"      ➕ 新增: {away_abbr} @ {home_abbr}")
-                    
-                    total_processed += 1
+                    scraped[(display_date, h_id, a_id)] = match_data
 
                 except Exception as e:
                     print(f"      ❌ 處理錯誤: {e}")
 
-            time.sleep(0.5) # ESPN 很耐操，稍微休息即可
-
         except Exception as e:
-            print(f"      ❌ 連線錯誤: {e}")
+            print(f"      ❌ 解析錯誤: {e}")
+
+    if not scraped:
+        print("🎉 完成！沒有需要寫入的比賽 (ESPN Source)。")
+        return
+
+    # ==========================================
+    # 🔥 批次寫入：一次查出整個窗口既有比賽的快照，只 upsert 有變動的列
+    # ==========================================
+    try:
+        first_date = f"{dates_to_scrape[0][:4]}-{dates_to_scrape[0][4:6]}-{dates_to_scrape[0][6:]}"
+        # 資料庫存 timestamp：最後一天用「< 隔天」才包含當天所有時間的比賽
+        end_date = (datetime.strptime(dates_to_scrape[-1], '%Y%m%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        existing = storage.list_matches(
+            columns='id, date, start_time, home_team_id, away_team_id, status, home_score, away_score',
+            date_from=first_date, date_before=end_date)
+        existing_map = {(str(m['date'])[:10], m['home_team_id'], m['away_team_id']): m for m in existing}
+
+        rows = []
+        new_count = 0
+        for key, match_data in scraped.items():
+            if key in existing_map:
+                stored = existing_map[key]
+                if not diff_row(match_data, stored):
+                    continue  # 與資料庫完全相同，不寫入
+                # 有變動 -> 帶 id 更新
+                rows.append(dict(match_data, id=stored['id']))
+            else:
+                # 不存在 -> 新增 (id 由資料庫預設值產生)
+                rows.append(match_data)
+                new_count += 1
 
-    print(f"🎉 完成！共處理 {total_processed} 場比賽 (ESPN Source)。")
+        if rows:
+            # 沒帶 id 的新比賽使用欄位預設值，而不是 null
+            storage.upsert_matches(rows)
+        report_write_reduction(len(scraped), len(rows))
+        print(f"🎉 完成！共寫入 {len(rows)} 場比賽 (新增 {new_count}、更新 {len(rows) - new_count}) (ESPN Source)。")
+    except Exception as e:
+        print(f"❌ 批次寫入失敗: {e}")
 
 if __name__ == "__main__":
     scrape_schedule()
\ No newline at end of file
@@ -1,21 +1,21 @@
 import requests
-from config import get_supabase_client
+from storage import get_storage
+from reference_data import get_league_id, invalidate_reference
 
 # 這是 ESPN 的公開 API，回傳非常乾淨的 JSON 格式
 ESPN_NBA_TEAMS_URL = "http://site.api.espn.com/apis/site/v2/sports/basketball/nba/teams"
 
 def fetch_and_store_teams():
-    supabase = get_supabase_client()
+    storage = get_storage()
 
     print("1. 正在取得 NBA 聯盟 ID...")
     # 先從 DB 找出 NBA 的 ID (避免寫死 ID=1，萬一變了會報錯)
-    league_response = supabase.table("leagues").select("id").eq("name", "NBA").execute()
+    nba_league_id = get_league_id("NBA", storage)
     
-    if not league_response.data:
+    if nba_league_id is None:
         print("❌ 錯誤：找不到 NBA 聯盟資料，請先執行 main.py 建立聯盟。")
         return
-        
-    nba_league_id = league_response.data[0]['id']
+
     print(f"✅ 取得 NBA ID: {nba_league_id}")
 
     print("2. 正在從 ESPN API 下載球隊資料...")
@@ -46,12 +46,13 @@ def fetch_and_store_teams():
     print("3. 正在寫入 Supabase 資料庫...")
     try:
         # 批量寫入 (Batch Insert)
-        result = supabase.table("teams").upsert(teams_to_insert).execute()
+        result = storage.upsert_teams(teams_to_insert)
+        invalidate_reference()  # 球隊有異動，參考資料快取失效
         print("🎉 成功！已將 30 支球隊資料存入資料庫！")
         
         # 顯示前 3 筆驗證
         print("\n--- 預覽前 3 筆資料 ---")
-        for team in result.data[:3]:
+        for team in result[:3]:
             print(f"🏀 {team['code']} - {team['full_name']}")
             
     except Exception as e:
@@ -0,0 +1,485 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import atexit
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+
+# ==========================================
+# 資料存取層：所有腳本對 matches / teams / aggregated_picks /
+# raw_predictions / leagues 的查詢都集中在這裡
+#   STORAGE_BACKEND=supabase (預設) -> Supabase (PostgREST)
+#   STORAGE_BACKEND=sqlite          -> 本機 SQLite 檔 (SQLITE_PATH)，可離線跑完整條管線做壓力測試
+#   STORAGE_STATS=1                 -> 程式結束時印出每個查詢的呼叫次數與耗時
+# ==========================================
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "supabase").lower()
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "data/local.db")
+STORAGE_STATS = os.environ.get("STORAGE_STATS", "false").lower() in ("1", "true")
+PAGE_SIZE = 1000   # PostgREST 單次查詢上限，超過時自動分頁
+
+TEAM_EMBED = "home_team:teams!matches_home_team_id_fkey({cols}), away_team:teams!matches_away_team_id_fkey({cols})"
+
+
+class Storage(ABC):
+    """
+    腳本實際用到的查詢介面。回傳值一律是 list[dict] (與 supabase `.execute().data` 相同格式)，
+    嵌入的關聯資料放在同名的 key 底下 (例如 pick['matches']、match['home_team'])。
+    """
+
+    # --- leagues / teams ---
+    @abstractmethod
+    def list_leagues(self): ...
+    @abstractmethod
+    def get_league_id(self, name): ...
+    @abstractmethod
+    def upsert_leagues(self, rows): ...
+    @abstractmethod
+    def list_teams(self): ...
+    @abstractmethod
+    def upsert_teams(self, rows): ...
+
+    # --- matches ---
+    @abstractmethod
+    def list_matches(self, columns='*', date_from=None, date_to=None, date_before=None,
+                     status=None, with_teams=False, order='id'):
+        """
+        date_from <= date (<= date_to) (< date_before)，可再用 status 過濾。
+        with_teams=True 時帶上 home_team / away_team 的 {code, nba_team_id}。
+        """
+    @abstractmethod
+    def upsert_matches(self, rows):
+        """帶 id 的列更新 (只更新有帶的欄位)，沒帶 id 的列新增 (其餘欄位用預設值)。"""
+    @abstractmethod
+    def update_match(self, match_id, values): ...
+
+    # --- aggregated_picks ---
+    @abstractmethod
+    def picks_for_matches(self, match_ids):
+        """[{id, match_id}]：已存在預測的比賽。"""
+    @abstractmethod
+    def ungraded_finished_picks(self, statuses):
+        """尚未結算 (spread_outcome 為空) 且比賽狀態在 statuses 內的預測，內嵌 matches 比分與隊伍代號。"""
+    @abstractmethod
+    def picks_with_matches(self):
+        """全部預測，內嵌 matches 的主客隊 id。"""
+    @abstractmethod
+    def upsert_picks(self, rows): ...
+    @abstractmethod
+    def update_pick(self, pick_id, values): ...
+
+    # --- sources / raw_predictions ---
+    @abstractmethod
+    def list_sources(self): ...
+    @abstractmethod
+    def insert_raw_predictions(self, rows): ...
+
+
+# ==========================================
+# Supabase 實作
+# ==========================================
+class SupabaseStorage(Storage):
+    def __init__(self, client=None):
+        if client is None:
+            from config import get_supabase_client
+            client = get_supabase_client()
+        self.client = client
+
+    def _select_all(self, build):
+        """build(query) 組好條件後自動分頁，避免超過 PAGE_SIZE 時被靜默截斷。"""
+        rows, start = [], 0
+        while True:
+            page = build().range(start, start + PAGE_SIZE - 1).execute().data
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                return rows
+            start += PAGE_SIZE
+
+    def list_leagues(self):
+        return self.client.table("leagues").select("*").execute().data
+
+    def get_league_id(self, name):
+        data = self.client.table("leagues").select("id").eq("name", name).execute().data
+        return data[0]['id'] if data else None
+
+    def upsert_leagues(self, rows):
+        return self.client.table("leagues").upsert(rows).execute().data
+
+    def list_teams(self):
+        return self.client.table("teams").select("id, code, nba_team_id").execute().data
+
+    def upsert_teams(self, rows):
+        return self.client.table("teams").upsert(rows).execute().data
+
+    def list_matches(self, columns='*', date_from=None, date_to=None, date_before=None,
+                     status=None, with_teams=False, order='id'):
+        select = columns
+        if with_teams:
+            select += ", " + TEAM_EMBED.format(cols="code, nba_team_id")
+
+        def build():
+            query = self.client.table("matches").select(select)
+            if date_from is not None: query = query.gte("date", date_from)
+            if date_to is not None: query = query.lte("date", date_to)
+            if date_before is not None: query = query.lt("date", date_before)
+            if status is not None: query = query.eq("status", status)
+            query = query.order(order)
+            return query.order("id") if order != 'id' else query
+        return self._select_all(build)
+
+    def upsert_matches(self, rows):
+        # default_to_null=False：沒帶 id 的新比賽使用欄位預設值，而不是 null
+        return self.client.table("matches").upsert(rows, default_to_null=False).execute().data
+
+    def update_match(self, match_id, values):
+        return self.client.table("matches").update(values).eq("id", match_id).execute().data
+
+    def picks_for_matches(self, match_ids):
+        return self.client.table("aggregated_picks").select("id, match_id").in_("match_id", match_ids).execute().data
+
+    def ungraded_finished_picks(self, statuses):
+        # 伺服器端 inner join，只回傳比賽已完賽的預測
+        return self._select_all(lambda: self.client.table("aggregated_picks")
+            .select("*, matches!inner(id, status, home_team_id, away_team_id, home_score, away_score, "
+                    + TEAM_EMBED.format(cols="code") + ")")
+            .is_("spread_outcome", "null")
+            .in_("matches.status", statuses)
+            .order("id"))
+
+    def picks_with_matches(self):
+        return self._select_all(lambda: self.client.table("aggregated_picks")
+            .select("*, matches(home_team_id, away_team_id)")
+            .order("id"))
+
+    def upsert_picks(self, rows):
+        return self.client.table("aggregated_picks").upsert(rows).execute().data
+
+    def update_pick(self, pick_id, values):
+        return self.client.table("aggregated_picks").update(values).eq("id", pick_id).execute().data
+
+    def list_sources(self):
+        return self.client.table("sources").select("id, name").execute().data
+
+    def insert_raw_predictions(self, rows):
+        return self.client.table("raw_predictions").insert(rows).execute().data
+
+
+# ==========================================
+# SQLite 實作 (離線 / 壓力測試用)
+# ==========================================
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS leagues (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT
+);
+CREATE TABLE IF NOT EXISTS teams (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, league_id INTEGER, name TEXT, full_name TEXT,
+    code TEXT, logo_url TEXT, nba_team_id INTEGER
+);
+CREATE TABLE IF NOT EXISTS matches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT, start_time TEXT,
+    home_team_id INTEGER, away_team_id INTEGER, status TEXT DEFAULT 'STATUS_SCHEDULED',
+    home_score INTEGER, away_score INTEGER, vegas_spread REAL, vegas_total REAL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_matches_date ON matches (date);
+CREATE TABLE IF NOT EXISTS aggregated_picks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, match_id INTEGER, recommended_team_id INTEGER,
+    confidence_score INTEGER, spread_logic TEXT, line_info TEXT, ou_pick TEXT, ou_line REAL,
+    ou_confidence INTEGER, analysis_content TEXT, spread_outcome TEXT, total_outcome TEXT,
+    ou_outcome TEXT, created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_picks_match ON aggregated_picks (match_id);
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT
+);
+CREATE TABLE IF NOT EXISTS raw_predictions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, match_id INTEGER, source_id INTEGER,
+    picked_team_id INTEGER, prediction_type TEXT, odds REAL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+_IDENT = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def _columns(columns):
+    """'id, date, status' -> 安全的 SQL 欄位清單。"""
+    if columns.strip() == '*':
+        return '*'
+    cols = [c.strip() for c in columns.split(',')]
+    for c in cols:
+        if not _IDENT.match(c):
+            raise ValueError(f"不合法的欄位名稱: {c}")
+    return ', '.join(cols)
+
+
+def _sql_value(v):
+    # dict / list (例如 JSON 欄位) 以字串存放
+    return json.dumps(v) if isinstance(v, (dict, list)) else v
+
+
+class SQLiteStorage(Storage):
+    def __init__(self, path=SQLITE_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 批次匯入會從多個執行緒寫入：共用一個連線，以鎖序列化
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SQLITE_SCHEMA)
+        self.lock = threading.Lock()
+
+    def _query(self, sql, params=()):
+        with self.lock:
+            return [dict(r) for r in self.conn.execute(sql, params).fetchall()]
+
+    def _upsert(self, table, rows):
+        """與 PostgREST upsert (default_to_null=False) 相同：有 id 就只更新帶到的欄位，沒有就新增。"""
+        rows = [rows] if isinstance(rows, dict) else rows
+        ids = []
+        with self.lock, self.conn:
+            for row in rows:
+                cols = [c for c in row if _IDENT.match(c)]
+                values = [_sql_value(row[c]) for c in cols]
+                placeholders = ', '.join('?' * len(cols))
+                if row.get('id') is not None:
+                    updates = ', '.join(f"{c} = excluded.{c}" for c in cols if c != 'id') or 'id = excluded.id'
+                    self.conn.execute(
+                        f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({placeholders}) "
+                        f"ON CONFLICT(id) DO UPDATE SET {updates}", values)
+                    ids.append(row['id'])
+                else:
+                    cols_no_id = [c for c in cols if c != 'id']
+                    cur = self.conn.execute(
+                        f"INSERT INTO {table} ({', '.join(cols_no_id)}) VALUES ({', '.join('?' * len(cols_no_id))})",
+                        [_sql_value(row[c]) for c in cols_no_id])
+                    ids.append(cur.lastrowid)
+        return self._by_ids(table, ids)
+
+    def _by_ids(self, table, ids):
+        if not ids:
+            return []
+        return self._query(f"SELECT * FROM {table} WHERE id IN ({', '.join('?' * len(ids))})", ids)
+
+    def _update(self, table, row_id, values):
+        cols = [c for c in values if _IDENT.match(c)]
+        with self.lock, self.conn:
+            self.conn.execute(
+                f"UPDATE {table} SET {', '.join(f'{c} = ?' for c in cols)} WHERE id = ?",
+                [_sql_value(values[c]) for c in cols] + [row_id])
+        return self._by_ids(table, [row_id])
+
+    def _attach_teams(self, rows, cols):
+        teams = {t['id']: t for t in self._query("SELECT id, code, nba_team_id FROM teams")}
+        for r in rows:
+            for side in ('home', 'away'):
+                team = teams.get(r.get(f'{side}_team_id'))
+                r[f'{side}_team'] = {c: team[c] for c in cols} if team else None
+        return rows
+
+    def list_leagues(self):
+        return self._query("SELECT * FROM leagues ORDER BY id")
+
+    def get_league_id(self, name):
+        data = self._query("SELECT id FROM leagues WHERE name = ? ORDER BY id LIMIT 1", (name,))
+        return data[0]['id'] if data else None
+
+    def upsert_leagues(self, rows):
+        return self._upsert("leagues", rows)
+
+    def list_teams(self):
+        return self._query("SELECT id, code, nba_team_id FROM teams ORDER BY id")
+
+    def upsert_teams(self, rows):
+        return self._upsert("teams", rows)
+
+    def list_matches(self, columns='*', date_from=None, date_to=None, date_before=None,
+                     status=None, with_teams=False, order='id'):
+        where, params = [], []
+        for op, value in ((">=", date_from), ("<=", date_to), ("<", date_before)):
+            if value is not None:
+                where.append(f"date {op} ?")
+                params.append(value)
+        if status is not None:
+            where.append("status = ?")
+            params.append(status)
+        if not _IDENT.match(order):
+            raise ValueError(f"不合法的排序欄位: {order}")
+
+        select = _columns(columns)
+        if with_teams and select != '*':
+            # 關聯隊伍需要主客隊 id
+            select += ', home_team_id, away_team_id'
+        sql = f"SELECT {select} FROM matches"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        rows = self._query(sql + f" ORDER BY {order}, id", params)
+        return self._attach_teams(rows, ('code', 'nba_team_id')) if with_teams else rows
+
+    def upsert_matches(self, rows):
+        return self._upsert("matches", rows)
+
+    def update_match(self, match_id, values):
+        return self._update("matches", match_id, values)
+
+    def picks_for_matches(self, match_ids):
+        if not match_ids:
+            return []
+        return self._query(
+            f"SELECT id, match_id FROM aggregated_picks WHERE match_id IN ({', '.join('?' * len(match_ids))})",
+            list(match_ids))
+
+    def ungraded_finished_picks(self, statuses):
+        match_cols = ('id', 'status', 'home_team_id', 'away_team_id', 'home_score', 'away_score')
+        rows = self._query(
+            "SELECT p.*, " + ", ".join(f"m.{c} AS m_{c}" for c in match_cols) + " "
+            "FROM aggregated_picks p JOIN matches m ON m.id = p.match_id "
+            f"WHERE p.spread_outcome IS NULL AND m.status IN ({', '.join('?' * len(statuses))}) "
+            "ORDER BY p.id", list(statuses))
+        matches = [{c: r.pop(f'm_{c}') for c in match_cols} for r in rows]
+        self._attach_teams(matches, ('code',))
+        for r, m in zip(rows, matches):
+            r['matches'] = m
+        return rows
+
+    def picks_with_matches(self):
+        rows = self._query(
+            "SELECT p.*, m.home_team_id AS m_home_team_id, m.away_team_id AS m_away_team_id "
+            "FROM aggregated_picks p LEFT JOIN matches m ON m.id = p.match_id ORDER BY p.id")
+        for r in rows:
+            home, away = r.pop('m_home_team_id'), r.pop('m_away_team_id')
+            r['matches'] = {'home_team_id': home, 'away_team_id': away} if r['match_id'] is not None else None
+        return rows
+
+    def upsert_picks(self, rows):
+        return self._upsert("aggregated_picks", rows)
+
+    def update_pick(self, pick_id, values):
+        return self._update("aggregated_picks", pick_id, values)
+
+    def list_sources(self):
+        return self._query("SELECT id, name FROM sources ORDER BY id")
+
+    def insert_raw_predictions(self, rows):
+        rows = [dict(r, id=None) for r in ([rows] if isinstance(rows, dict) else rows)]
+        return self._upsert("raw_predictions", rows)
+
+
+# ==========================================
+# 查詢計時 (衡量資料庫來回成本)
+# ==========================================
+class TimedStorage:
+    """包一層 Storage，記錄每個查詢方法的呼叫次數與累計耗時 (執行緒安全)。"""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.stats = defaultdict(lambda: [0, 0.0])
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attr = getattr(self.inner, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.stats[name][0] += 1
+                    self.stats[name][1] += time.perf_counter() - start
+        return timed
+
+    def report(self):
+        if not self.stats:
+            return
+        total = sum(s[1] for s in self.stats.values())
+        print(f"   🗄️ [{type(self.inner).__name__}] 查詢 {sum(s[0] for s in self.stats.values())} 次，共 {total * 1000:.1f} ms")
+        for name, (calls, secs) in sorted(self.stats.items(), key=lambda kv: -kv[1][1]):
+            print(f"      {name:<24} {calls:>5} 次  {secs * 1000:>9.1f} ms  ({secs / calls * 1000:.2f} ms/次)")
+
+
+_storage = None
+
+
+def get_storage(backend=None):
+    """依 STORAGE_BACKEND 建立 (並重用) 資料存取物件。"""
+    global _storage
+    backend = (backend or STORAGE_BACKEND).lower()
+    if _storage is not None and _storage.backend == backend:
+        return _storage
+    if backend == 'sqlite':
+        inner = SQLiteStorage(SQLITE_PATH)
+    elif backend == 'supabase':
+        inner = SupabaseStorage()
+    else:
+        raise ValueError(f"未知的 STORAGE_BACKEND: {backend} (可用: supabase / sqlite)")
+    _storage = TimedStorage(inner)
+    _storage.backend = backend
+    if STORAGE_STATS:
+        atexit.register(_storage.report)
+    return _storage
+
+
+# ==========================================
+# 離線壓力測試：python storage.py --benchmark [比賽數]
+# ==========================================
+def benchmark_storage(n_matches=10000, path=':memory:', seed=42):
+    """在 SQLite 上灌入 n 場比賽 + 預測，量測每個查詢的來回耗時 (不含網路)。"""
+    import random
+    from datetime import date, timedelta
+    rng = random.Random(seed)
+    storage = TimedStorage(SQLiteStorage(path))
+
+    storage.upsert_leagues([{"name": "NBA"}])
+    league_id = storage.get_league_id("NBA")
+    storage.upsert_teams([{"league_id": league_id, "code": f"T{i:02d}", "nba_team_id": 1610612737 + i} for i in range(30)])
+    team_ids = [t['id'] for t in storage.list_teams()]
+
+    start_day = date(2023, 10, 1)
+    matches = []
+    for i in range(n_matches):
+        h, a = rng.sample(team_ids, 2)
+        finished = i < n_matches * 0.9
+        matches.append({
+            "date": (start_day + timedelta(days=i // 12)).isoformat(), "home_team_id": h, "away_team_id": a,
+            "status": "STATUS_FINISHED" if finished else "STATUS_SCHEDULED",
+            "home_score": rng.randint(85, 135) if finished else None,
+            "away_score": rng.randint(85, 135) if finished else None,
+        })
+    for i in range(0, n_matches, 500):
+        storage.upsert_matches(matches[i:i + 500])
+
+    stored = storage.list_matches(columns='id, date, home_team_id, away_team_id, status')
+    picks = [{
+        "match_id": m['id'], "recommended_team_id": m['home_team_id'], "confidence_score": 60,
+        "line_info": "-3.5", "ou_pick": "OVER", "ou_line": 220.5,
+    } for m in stored]
+    for i in range(0, len(picks), 500):
+        storage.upsert_picks(picks[i:i + 500])
+
+    window = stored[len(stored) // 2]['date']
+    storage.list_matches(columns='id, date, status', date_from=window, date_to=window)
+    storage.list_matches(date_from=window, date_before=stored[-1]['date'], with_teams=True, order='date')
+    storage.list_matches(columns='id, home_team_id, away_team_id', status='STATUS_SCHEDULED')
+    storage.picks_for_matches([m['id'] for m in stored[-200:]])
+    ungraded = storage.ungraded_finished_picks(["STATUS_FINISHED"])
+    for i in range(0, len(ungraded), 1000):
+        storage.upsert_picks([dict({k: v for k, v in p.items() if k != "matches"}, spread_outcome="WIN")
+                              for p in ungraded[i:i + 1000]])
+    storage.picks_with_matches()
+    storage.update_match(stored[-1]['id'], {"vegas_spread": -2.5})
+
+    print(f"🔬 SQLite 壓力測試: {n_matches} 場比賽 / {len(picks)} 筆預測 (待結算 {len(ungraded)} 筆)")
+    storage.report()
+    return storage.stats
+
+
+if __name__ == "__main__":
+    import sys
+    if '--benchmark' in sys.argv:
+        idx = sys.argv.index('--benchmark')
+        benchmark_storage(int(sys.argv[idx + 1]) if len(sys.argv) > idx + 1 else 10000)
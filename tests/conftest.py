@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 腳本都放在專案根目錄 (沒有套件結構)，測試直接 import 根目錄的模組
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
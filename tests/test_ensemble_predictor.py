@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import VotingClassifier, VotingRegressor
+from xgboost import XGBClassifier, XGBRegressor
+
+from ensemble_predictor import BoosterEnsemble, check_parity
+
+# 與 train_model 相同：5 個種子的 XGBoost 包在 Voting 裡 (樹數縮小，測試跑得快)
+SEEDS = [42 + i * 10 for i in range(5)]
+PARAMS = dict(n_estimators=20, max_depth=3, learning_rate=0.1, subsample=0.8,
+              colsample_bytree=0.8, missing=np.nan, n_jobs=1)
+
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(300, 6)), columns=[f'f{i}' for i in range(6)])
+    X.iloc[::17, 2] = np.nan  # 模型需處理缺值
+    margin = 3 * X['f0'].fillna(0) - 2 * X['f1'] + rng.normal(scale=0.5, size=len(X))
+    return X, margin, (margin > 0).astype(int)
+
+
+def test_regressor_matches_voting(data):
+    X, margin, _ = data
+    voting = VotingRegressor([(f'xgb_{s}', XGBRegressor(random_state=s, **PARAMS)) for s in SEEDS]).fit(X, margin)
+    ensemble = BoosterEnsemble.from_voting(voting)
+
+    assert ensemble.kind == 'regressor'
+    np.testing.assert_allclose(ensemble.predict(X), voting.predict(X), atol=1e-4)
+    assert check_parity(voting, ensemble, X, atol=1e-4) <= 1e-4
+
+
+def test_classifier_matches_soft_voting(data):
+    X, _, win = data
+    voting = VotingClassifier([(f'xgb_{s}', XGBClassifier(random_state=s, **PARAMS)) for s in SEEDS],
+                              voting='soft').fit(X, win)
+    ensemble = BoosterEnsemble.from_voting(voting)
+
+    assert ensemble.kind == 'classifier'
+    np.testing.assert_array_equal(ensemble.classes_, voting.classes_)
+    np.testing.assert_allclose(ensemble.predict_proba(X), voting.predict_proba(X), atol=1e-5)
+    np.testing.assert_array_equal(ensemble.predict(X), voting.predict(X))
+
+
+def test_columns_follow_training_order(data):
+    X, margin, _ = data
+    voting = VotingRegressor([(f'xgb_{s}', XGBRegressor(random_state=s, **PARAMS)) for s in SEEDS]).fit(X, margin)
+    ensemble = BoosterEnsemble.from_voting(voting)
+
+    # 欄位順序被打亂時依 feature_names 重新排列
+    shuffled = X[list(reversed(X.columns))]
+    np.testing.assert_allclose(ensemble.predict(shuffled), voting.predict(X), atol=1e-4)
+
+
+def test_regressor_has_no_predict_proba(data):
+    X, margin, _ = data
+    voting = VotingRegressor([('xgb', XGBRegressor(random_state=42, **PARAMS))]).fit(X, margin)
+    with pytest.raises(AttributeError):
+        BoosterEnsemble.from_voting(voting).predict_proba(X)
@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+
+import feature_matrix
+from feature_matrix import data_fingerprint, get_matrix
+
+
+def _arrays():
+    rng = np.random.default_rng(0)
+    a = rng.normal(size=(200, 5)).astype(np.float32)
+    b = a.copy()
+    b[100, 2] += 1.0  # 同形狀、同首尾列，只改中間一格
+    return a, b
+
+
+def test_fingerprint_covers_middle_rows():
+    a, b = _arrays()
+    assert data_fingerprint(a) == data_fingerprint(a.copy())
+    assert data_fingerprint(a) != data_fingerprint(b)
+
+    df_a, df_b = pd.DataFrame(a), pd.DataFrame(b)
+    assert data_fingerprint(df_a) == data_fingerprint(df_a.copy())
+    assert data_fingerprint(df_a) != data_fingerprint(df_b)
+
+
+def test_fingerprint_handles_memmap(tmp_path):
+    a, b = _arrays()
+    path = tmp_path / 'X.npy'
+    np.save(path, a)
+    assert data_fingerprint(np.load(path, mmap_mode='r')) == data_fingerprint(a)
+
+
+def test_get_matrix_rebuilds_when_data_changes():
+    feature_matrix.clear_matrices()
+    a, b = _arrays()
+    first = get_matrix('test_set', 'train', a)
+    assert get_matrix('test_set', 'train', a.copy()) is first
+    assert get_matrix('test_set', 'train', b) is not first
+    feature_matrix.clear_matrices()
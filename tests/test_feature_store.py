@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from feature_store import compute_rolling_features, rolling_feature_names, update_feature_store
+
+WINDOWS = [3, 5, 10]
+COLS = ['teamScore', 'reboundsTotal']
+
+
+def _games(seed=0):
+    """每隊 30 場 (第 4 隊只在後段出現)，列依 (球隊, 日期) 排序，含缺值。"""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for team, n in ((1, 30), (2, 30), (3, 30), (4, 8)):
+        dates = pd.date_range('2024-10-20', periods=n, freq='2D') + pd.Timedelta(days=60 if team == 4 else 0)
+        frames.append(pd.DataFrame({
+            'gameId': team * 1000 + np.arange(n),
+            'teamId': team,
+            'gameDate': dates,
+            'teamScore': rng.normal(110, 10, n),
+            'reboundsTotal': rng.normal(44, 5, n),
+            'win_numeric': rng.integers(0, 2, n).astype(float),
+        }))
+    df = pd.concat(frames, ignore_index=True)
+    df.loc[rng.random(len(df)) < 0.08, 'reboundsTotal'] = np.nan
+    return df
+
+
+def test_incremental_append_matches_full_rebuild(tmp_path, capsys):
+    df = _games()
+    cutoff = pd.Timestamp('2024-12-01')
+    old = df[df['gameDate'] < cutoff]
+
+    # 先用舊資料建立特徵庫，再加入新比賽 (含新球隊) -> 走增量路徑
+    store = str(tmp_path / 'store')
+    update_feature_store(old, WINDOWS, COLS, store_dir=store)
+    incremental = update_feature_store(df, WINDOWS, COLS, store_dir=store)
+    assert '增量更新' in capsys.readouterr().out
+
+    full = update_feature_store(df, WINDOWS, COLS, store_dir=str(tmp_path / 'fresh'))
+    assert list(incremental.columns) == rolling_feature_names(WINDOWS, COLS)
+    assert incremental.index.equals(df.index)
+    np.testing.assert_allclose(incremental.to_numpy(), full.to_numpy(), rtol=1e-12, equal_nan=True)
+    np.testing.assert_allclose(full.to_numpy(), compute_rolling_features(df, WINDOWS, COLS).to_numpy(),
+                               rtol=1e-12, equal_nan=True)
+
+
+def test_unchanged_data_reuses_store(tmp_path, capsys):
+    df = _games(1)
+    store = str(tmp_path / 'store')
+    first = update_feature_store(df, WINDOWS, COLS, store_dir=store)
+    capsys.readouterr()
+    second = update_feature_store(df, WINDOWS, COLS, store_dir=store)
+    assert '新增 0 筆' in capsys.readouterr().out
+    np.testing.assert_array_equal(first.to_numpy(), second.to_numpy())
+
+
+def test_rewritten_history_triggers_full_rebuild(tmp_path, capsys):
+    df = _games(2)
+    store = str(tmp_path / 'store')
+    update_feature_store(df, WINDOWS, COLS, store_dir=store)
+    changed = df.drop(index=5).reset_index(drop=True)  # 舊比賽被刪除：不能增量
+    capsys.readouterr()
+    result = update_feature_store(changed, WINDOWS, COLS, store_dir=store)
+    assert '全量重建' in capsys.readouterr().out
+    np.testing.assert_allclose(result.to_numpy(), compute_rolling_features(changed, WINDOWS, COLS).to_numpy(),
+                               rtol=1e-12, equal_nan=True)
@@ -0,0 +1,96 @@
+import numpy as np
+
+from grade_picks import build_updates, compute_outcomes
+
+
+def _grade_one(pick):
+    """舊版逐筆結算規則 (重構前的 grade_picks 迴圈)，回傳要寫入的欄位。"""
+    match = pick['matches']
+    home_score, away_score = match['home_score'], match['away_score']
+    if home_score is None or away_score is None:
+        return {}
+
+    updates = {}
+    if pick.get('line_info'):
+        try:
+            line_val = float(pick['line_info'])
+            cover = home_score - away_score + line_val
+            if pick['recommended_team_id'] == match['home_team_id']:
+                updates['spread_outcome'] = 'WIN' if cover > 0 else 'LOSS' if cover < 0 else 'PUSH'
+            else:
+                updates['spread_outcome'] = 'LOSS' if cover > 0 else 'WIN' if cover < 0 else 'PUSH'
+        except ValueError:
+            pass
+
+    if pick.get('ou_pick') and pick.get('ou_line'):
+        line_val = float(pick['ou_line'])
+        total = home_score + away_score
+        result = 'PUSH'
+        if total > line_val:
+            result = 'WIN' if pick['ou_pick'] == 'OVER' else 'LOSS'
+        elif total < line_val:
+            result = 'WIN' if pick['ou_pick'] == 'UNDER' else 'LOSS'
+        updates['total_outcome'] = result
+    return updates
+
+
+def _pick(i, home, away, rec, line, ou_pick, ou_line):
+    return {
+        'id': i, 'match_id': i, 'recommended_team_id': rec, 'line_info': line,
+        'ou_pick': ou_pick, 'ou_line': ou_line, 'spread_outcome': None, 'total_outcome': None,
+        'matches': {'id': i, 'home_team_id': 1, 'away_team_id': 2, 'home_score': home, 'away_score': away},
+    }
+
+
+def _random_picks(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    picks = []
+    for i in range(n):
+        home, away = int(rng.integers(90, 130)), int(rng.integers(90, 130))
+        # 整數盤口會出現 PUSH；半分盤口不會
+        line = str(float(rng.integers(-24, 25)) / 2)
+        ou_line = float(rng.integers(380, 500)) / 2
+        picks.append(_pick(i, home, away, int(rng.integers(1, 3)), line,
+                           'OVER' if rng.random() < 0.5 else 'UNDER', ou_line))
+    return picks
+
+
+EDGE_CASES = [
+    _pick(0, 110, 100, 1, '-10', 'OVER', 210.0),      # 讓分 / 大小分皆 PUSH
+    _pick(1, 100, 110, 2, '10.0', 'UNDER', 210.0),    # 推薦客隊 PUSH
+    _pick(2, 100, 90, 1, None, 'OVER', 185.5),        # 沒有讓分盤口：只結算大小分
+    _pick(3, 100, 90, 1, '', 'UNDER', 185.5),         # 空字串盤口
+    _pick(4, 100, 90, 2, 'n/a', None, 190.5),         # 盤口格式錯誤 + 沒有大小分選邊
+    _pick(5, 100, 90, 2, '+3.5', 'OVER', 0),          # 大小分盤口為 0：不結算
+    _pick(6, 100, 90, 1, '0', '', None),              # 讓分 0 (平手盤)
+    _pick(7, None, 90, 1, '-3.5', 'OVER', 200.5),     # 缺比分：都不結算
+    _pick(8, 100, None, 1, '-3.5', 'OVER', 200.5),
+]
+
+
+def _assert_parity(picks):
+    outcomes = compute_outcomes(picks)
+    rows = {row['id']: row for row in build_updates(picks, outcomes)}
+    for pick in picks:
+        expected = _grade_one(pick)
+        if not expected:
+            assert pick['id'] not in rows
+            continue
+        row = rows[pick['id']]
+        assert row.get('spread_outcome') == expected.get('spread_outcome'), pick
+        assert row.get('total_outcome') == expected.get('total_outcome'), pick
+        assert 'matches' not in row
+
+
+def test_vectorized_grading_matches_per_row_rules():
+    _assert_parity(_random_picks())
+
+
+def test_edge_cases_match_per_row_rules():
+    _assert_parity(EDGE_CASES)
+
+
+def test_push_outcomes_present():
+    outcomes = compute_outcomes(EDGE_CASES[:2])
+    assert list(outcomes['spread_outcome']) == ['PUSH', 'PUSH']
+    assert list(outcomes['total_outcome']) == ['PUSH', 'PUSH']
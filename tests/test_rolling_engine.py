@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from rolling_engine import rolling_means
+
+WINDOWS = [1, 3, 5, 30]
+
+
+@pytest.fixture(scope='module')
+def games():
+    # 3 隊、長度不同 (含比最大窗口還短的球隊)，夾雜缺值；列依 (球隊, 日期) 排序
+    rng = np.random.default_rng(0)
+    teams = np.repeat([10, 20, 30], [40, 7, 25])
+    values = rng.normal(100, 12, size=(len(teams), 3))
+    values[rng.random(values.shape) < 0.1] = np.nan
+    values[41:44, 1] = np.nan  # 連續缺值：窗口內全為 NaN
+    return pd.DataFrame(values, columns=['pts', 'reb', 'ast']).assign(teamId=teams)
+
+
+def _pandas_rolling(df, shift):
+    """舊做法：groupby + (shift) + rolling(min_periods=1).mean()，窗口在外、欄位在內。"""
+    cols = ['pts', 'reb', 'ast']
+    blocks = []
+    for w in WINDOWS:
+        g = df.groupby('teamId')[cols]
+        shifted = g.shift(1) if shift else df[cols]
+        blocks.append(shifted.groupby(df['teamId']).rolling(w, min_periods=1).mean()
+                      .reset_index(level=0, drop=True).sort_index().to_numpy())
+    return np.hstack(blocks)
+
+
+@pytest.mark.parametrize('shift', [True, False])
+def test_matches_pandas_rolling(games, shift):
+    got = rolling_means(games[['pts', 'reb', 'ast']].to_numpy(), games['teamId'].to_numpy(), WINDOWS, shift=shift)
+    expected = _pandas_rolling(games, shift)
+    np.testing.assert_allclose(got, expected, rtol=1e-5, equal_nan=True)
+
+
+def test_selected_rows_match_full_result(games):
+    values, teams = games[['pts', 'reb', 'ast']].to_numpy(), games['teamId'].to_numpy()
+    last_rows = np.array([39, 46, 71])  # 每隊最後一列 (預測用)
+    full = rolling_means(values, teams, WINDOWS, shift=False)
+    np.testing.assert_array_equal(rolling_means(values, teams, WINDOWS, shift=False, rows=last_rows), full[last_rows])
+
+
+def test_first_game_has_no_history(games):
+    got = rolling_means(games[['pts', 'reb', 'ast']].to_numpy(), games['teamId'].to_numpy(), WINDOWS, shift=True,
+                        dtype=np.float64)
+    assert np.isnan(got[[0, 40, 47]]).all()
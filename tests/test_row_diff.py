@@ -0,0 +1,26 @@
+from row_diff import diff_row
+
+
+def test_date_only_matches_stored_timestamp():
+    # 爬蟲寫 YYYY-MM-DD，資料庫回傳 timestamptz：同一天不算變動
+    row = {'date': '2026-10-17', 'home_team_id': 1, 'status': 'STATUS_SCHEDULED'}
+    stored = {'id': 9, 'date': '2026-10-17T00:00:00+00:00', 'home_team_id': 1, 'status': 'STATUS_SCHEDULED'}
+    assert diff_row(row, stored) == {}
+
+
+def test_date_only_differs_from_other_day():
+    row = {'date': '2026-10-18'}
+    assert diff_row(row, {'date': '2026-10-17T00:00:00+00:00'}) == {'date': '2026-10-18'}
+
+
+def test_timestamps_compare_in_utc():
+    row = {'start_time': '2026-10-17T23:00:00Z'}
+    assert diff_row(row, {'start_time': '2026-10-18T07:00:00+08:00'}) == {}
+    assert diff_row(row, {'start_time': '2026-10-17T23:30:00+00:00'}) == row
+
+
+def test_numbers_and_missing_values():
+    row = {'vegas_spread': -3, 'vegas_total': None, 'home_score': 101}
+    stored = {'vegas_spread': -3.0, 'vegas_total': None, 'home_score': 99}
+    assert diff_row(row, stored) == {'home_score': 101}
+    assert diff_row({'id': 1, 'status': 'x'}, None) == {'status': 'x'}
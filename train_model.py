@@ -1,36 +1,33 @@
+import os
 import pandas as pd
-import xgboost as xgb
 from sklearn.metrics import accuracy_score, mean_absolute_error
-from sklearn.ensemble import VotingClassifier, VotingRegressor # 🔥 新增：集成學習模組
-import joblib
 import numpy as np
+from feature_pipeline import ROLLING_WINDOWS, build_feature_lists, build_features
+from datetime import datetime, timedelta
+from train_scheduler import ENSEMBLE_SIZE, train_ensembles, extend_ensembles
+from ensemble_predictor import BoosterEnsemble
+from model_bundle import BUNDLE_PATH, ModelBundle, save_bundle
 
 # ==========================================
-# 1. 定義特徵欄位 (改為動態生成)
+# 1. 定義特徵欄位 (統一由 feature_pipeline 動態生成)
 # ==========================================
-# 基礎數據 (Raw Stats)
-BASE_STATS_COLS = [
-    'fieldGoalsPercentage', 'threePointersPercentage', 'freeThrowsPercentage',
-    'reboundsTotal', 'assists', 'steals', 'blocks', 'turnovers', 
-    'plusMinusPoints', 'pointsInThePaint', 'teamScore', 
-    'eFG_Percentage', 'TS_Percentage', 'RestDays'
-]
+TRAIN_FEATURES_SPREAD, TRAIN_FEATURES_TOTAL = build_feature_lists(ROLLING_WINDOWS)
 
-# 🔥 V2.0 升級：定義多重時間窗口
-ROLLING_WINDOWS = [5, 10, 30] 
+# 早停 (Early Stopping)：> 0 時啟用，訓練區段最後 EARLY_STOPPING_HOLDOUT 比例當早停驗證
+EARLY_STOPPING_ROUNDS = int(os.environ.get("EARLY_STOPPING_ROUNDS", 0))
+EARLY_STOPPING_HOLDOUT = 0.1
 
-# 動態生成訓練特徵列表
-TRAIN_FEATURES_SPREAD = ['is_home'] 
-TRAIN_FEATURES_TOTAL = []
-
-for w in ROLLING_WINDOWS:
-    for col in BASE_STATS_COLS:
-        TRAIN_FEATURES_SPREAD.append(f'diff_rolling_{w}_{col}')
-        TRAIN_FEATURES_TOTAL.append(f'sum_rolling_{w}_{col}')
-    
-    # 🔥 特別加入：勝率 (Win Rate) 作為實力指標
-    TRAIN_FEATURES_SPREAD.append(f'diff_rolling_{w}_win_rate')
-    TRAIN_FEATURES_TOTAL.append(f'sum_rolling_{w}_win_rate')
+# 訓練模式：full (從頭訓練) / incremental (沿用現有模型包，只追加少量樹)
+TRAIN_MODE = os.environ.get("TRAIN_MODE", "full")
+INCREMENTAL_ROUNDS = 20          # 每次增量訓練每個 Booster 追加的樹數
+INCREMENTAL_WINDOW_DAYS = 45     # 增量訓練只用最新 N 天的比賽 (含最新賽果)
+INCREMENTAL_HOLDOUT = 0.2        # 近期資料最後這個比例不拿來訓練，留作漂移檢查
+INCREMENTAL_MIN_HOLDOUT = 20     # 漂移檢查至少要有的比賽數，不足就改做完整重訓
+FULL_REFIT_DAYS = 7              # 距離上次完整重訓超過 N 天就強制完整重訓
+# 漂移檢查：在同一段近期驗證上，增量模型比上次完整重訓的模型差超過容忍值，就改做完整重訓
+DRIFT_TOLERANCE = {'win_accuracy': 0.015, 'spread_mae': 0.3, 'total_mae': 0.3}
+# 近期驗證只有幾十場，一場翻盤就差 1~2%：準確率容忍值至少放寬到 N 倍二項分布標準誤
+DRIFT_SE_MULT = 2.0
 
 # ==========================================
 # 🔥 V8.0 黃金參數設定 (來自 Optuna 2026/01/29 調優結果)
@@ -47,7 +44,7 @@ BEST_PARAMS_WIN = {
     'reg_lambda': 5.724831419033642,
     'eval_metric': 'logloss',
     'missing': np.nan,
-    'n_jobs': 1 # 🔥 改為 1，因為 Voting 會平行處理多個模型，避免 CPU 搶佔
+    'n_jobs': 1 # 🔥 實際執行緒數由 train_scheduler 依 CPU 數分配
 }
 
 # MAE: 11.38
@@ -83,84 +80,8 @@ BEST_PARAMS_TOTAL = {
 def load_and_clean_data():
     print("📂 [V8.0] 正在讀取 TeamStatistics.csv (多重窗口特徵版)...")
     try:
-        # 1. 讀取數據
-        req_cols = [
-            'gameId', 'teamId', 'gameDateTimeEst', 'home', 'win', 'teamScore', 'opponentScore',
-            'fieldGoalsMade', 'fieldGoalsAttempted', 'threePointersMade', 
-            'freeThrowsAttempted',
-            'fieldGoalsPercentage', 'threePointersPercentage', 'freeThrowsPercentage',
-            'reboundsTotal', 'assists', 'steals', 'blocks', 'turnovers', 
-            'plusMinusPoints', 'pointsInThePaint'
-        ]
-        
-        df = pd.read_csv('data/TeamStatistics.csv', usecols=lambda c: c in req_cols, low_memory=False)
-
-        # 2. 日期處理
-        df['gameDateTimeEst'] = df['gameDateTimeEst'].astype(str).str.slice(0, 10)
-        df['gameDateTimeEst'] = pd.to_datetime(df['gameDateTimeEst'], utc=True, errors='coerce')
-        df = df.dropna(subset=['gameDateTimeEst'])
-        
-        # Concept Drift 修正
-        CUTOFF_YEAR = 2015
-        print(f"✂️ [Concept Drift Fix] 過濾數據：僅保留 {CUTOFF_YEAR} 年以後的現代籃球數據...")
-        df = df[df['gameDateTimeEst'].dt.year >= CUTOFF_YEAR]
-        
-        # 3. 排序 (重要)
-        df = df.sort_values(['teamId', 'gameDateTimeEst'])
-
-        # 🔥 修正：移除 'win' 為 NaN 的資料
-        if df['win'].isnull().any():
-            print(f"   ⚠️ 發現 {df['win'].isnull().sum()} 筆無勝負結果的資料(可能是未來賽程)，已移除。")
-            df = df.dropna(subset=['win'])
-
-        # 4. 特徵工程
-        df['threePointersMade'] = df['threePointersMade'].fillna(0)
-        df['fieldGoalsAttempted'] = df['fieldGoalsAttempted'].replace(0, np.nan)
-        
-        df['eFG_Percentage'] = (df['fieldGoalsMade'] + 0.5 * df['threePointersMade']) / df['fieldGoalsAttempted']
-        df['TS_Percentage'] = df['teamScore'] / (2 * (df['fieldGoalsAttempted'] + 0.44 * df['freeThrowsAttempted']))
-        df['eFG_Percentage'] = df['eFG_Percentage'].fillna(0)
-        df['TS_Percentage'] = df['TS_Percentage'].fillna(0)
-
-        df['prev_game_date'] = df.groupby('teamId')['gameDateTimeEst'].shift(1)
-        df['RestDays'] = (df['gameDateTimeEst'] - df['prev_game_date']).dt.days
-        df['RestDays'] = df['RestDays'].fillna(3).clip(upper=7)
-        
-        # 新增：數值化勝負
-        df['win_numeric'] = df['win'].astype(int)
-
-        # 5. 滾動平均
-        print("   🔄 執行多重滾動平均計算 (Windows: 5, 10, 30)...")
-        
-        cols_to_roll = [c for c in BASE_STATS_COLS if c in df.columns and c != 'RestDays']
-        cols_to_roll.append('RestDays')
-        
-        for w in ROLLING_WINDOWS:
-            # 5.1 計算數據統計平均
-            rolled_stats = df.groupby('teamId', group_keys=False)[cols_to_roll].apply(
-                lambda x: x.shift(1).rolling(w, min_periods=1).mean()
-            )
-            rolled_stats.columns = [f'rolling_{w}_{c}' for c in rolled_stats.columns]
-            
-            # 5.2 計算勝率 (Win Rate)
-            rolled_win = df.groupby('teamId', group_keys=False)['win_numeric'].apply(
-                lambda x: x.shift(1).rolling(w, min_periods=1).mean()
-            )
-            rolled_stats[f'rolling_{w}_win_rate'] = rolled_win
-            
-            # 5.3 合併回主表
-            df = pd.concat([df, rolled_stats], axis=1)
-        
-        # 6. 清理與過濾
-        meta_cols = ['gameId', 'gameDateTimeEst', 'home', 'win', 'teamScore', 'opponentScore']
-        keep_cols = meta_cols + [c for c in df.columns if 'rolling_' in c]
-        
-        df_final = df[keep_cols].rename(columns={
-            'teamScore': 'actual_teamScore', 
-            'opponentScore': 'actual_opponentScore'
-        })
-        
-        df_final = df_final.dropna(subset=['win', 'actual_teamScore', 'actual_opponentScore'])
+        # 讀取 (欄式快取) + 增量滾動特徵 (shift，無資料洩漏)
+        df_final = build_features('training', ROLLING_WINDOWS)
         
         print(f"   ✅ 資料處理完成！特徵數大幅增加。總行數: {len(df_final)}")
         return df_final
@@ -202,29 +123,151 @@ def prepare_training_data(df):
     
     return merged
 
-# 🔥 新增：建立集成模型 (Ensemble Builder)
-def create_ensemble_model(base_estimator, params, n_estimators=5, type='classifier'):
+def evaluate(ensembles, test_data, features_spread, features_total, label='Ensemble'):
+    """驗證集分數 (勝負準確率 / 讓分 MAE / 大小分 MAE)。"""
+    acc = accuracy_score(test_data['target_win'], ensembles['win'].predict(test_data[features_spread]))
+    print(f"\n   🎯 勝負預測 最終回測準確度: {acc*100:.2f}% ({label})")
+    
+    spread_mae = mean_absolute_error(test_data['target_margin'], ensembles['spread'].predict(test_data[features_spread]))
+    print(f"   📏 讓分預測 平均誤差 (MAE): {spread_mae:.2f} 分 ({label})")
+    
+    total_mae = mean_absolute_error(test_data['target_total'], ensembles['total'].predict(test_data[features_total]))
+    print(f"   📏 大小分預測 平均誤差 (MAE): {total_mae:.2f} 分 ({label})")
+    
+    return {'win_accuracy': float(acc), 'spread_mae': float(spread_mae), 'total_mae': float(total_mae)}
+
+def load_previous_bundle(features_spread, features_total):
+    """增量訓練的前提：模型包存在、特徵一致、上次完整重訓在 FULL_REFIT_DAYS 天內。不符合時回傳 None。"""
+    if not os.path.exists(BUNDLE_PATH):
+        print("   ⚠️ 找不到模型包，改做完整重訓")
+        return None
+    try:
+        bundle = ModelBundle.load(BUNDLE_PATH)
+    except Exception as e:
+        print(f"   ⚠️ 模型包無法使用 ({e})，改做完整重訓")
+        return None
+    
+    m = bundle.manifest
+    if list(bundle.windows) != list(ROLLING_WINDOWS) or \
+            bundle.features('spread') != features_spread or bundle.features('total') != features_total:
+        print("   ⚠️ 特徵列表已變更，改做完整重訓")
+        return None
+    if 'full_refit_at' not in m or 'baseline_metrics' not in m:
+        print("   ⚠️ 模型包沒有完整重訓紀錄，改做完整重訓")
+        return None
+    age = datetime.utcnow() - datetime.fromisoformat(m['full_refit_at'])
+    if age > timedelta(days=FULL_REFIT_DAYS):
+        print(f"   📆 距離上次完整重訓已 {age.days} 天，執行每週完整重訓")
+        return None
+    return bundle
+
+def accuracy_tolerance(accuracy, n_games):
+    """準確率容忍值：max(固定值, DRIFT_SE_MULT × sqrt(p(1-p)/n))，驗證場數少時自動放寬。"""
+    se = np.sqrt(max(accuracy * (1 - accuracy), 0.0) / max(n_games, 1))
+    return max(DRIFT_TOLERANCE['win_accuracy'], DRIFT_SE_MULT * se)
+
+def drift_detected(metrics, baseline, n_games):
+    """比較增量模型與上次完整重訓在同一段近期驗證 (n_games 場) 上的分數，回傳超出容忍值的項目。"""
+    drifted = []
+    tolerance = accuracy_tolerance(baseline['win_accuracy'], n_games)
+    if baseline['win_accuracy'] - metrics['win_accuracy'] > tolerance:
+        drifted.append('win_accuracy')
+    for key in ('spread_mae', 'total_mae'):
+        if metrics[key] - baseline[key] > DRIFT_TOLERANCE[key]:
+            drifted.append(key)
+    return drifted
+
+def full_refit_models(bundle):
+    """
+    還原上次完整重訓的模型：每個 Booster 只取前 full_refit_trees 棵樹 (之後的是增量追加的)。
+    舊模型包沒有記錄樹數時，直接用模型包內的模型。
     """
-    創建一個集成模型，包含 n_estimators 個不同種子碼的 XGBoost。
+    trees = bundle.manifest.get('full_refit_trees')
+    models = {}
+    for name in ('win', 'spread', 'total'):
+        ens = bundle.model(name)
+        if trees:
+            boosters = []
+            for booster, n in zip(ens.boosters, trees[name]):
+                sliced = booster[:n]
+                sliced.feature_names = booster.feature_names
+                boosters.append(sliced)
+            ens = BoosterEnsemble(boosters, kind=ens.kind, classes=ens.classes_, feature_names=ens.feature_names)
+        models[name] = ens
+    return models
+
+def train_incremental(bundle, data, features_spread, features_total):
     """
-    estimators = []
-    print(f"   🧬 正在構建集成模型 (Ensemble size: {n_estimators})...")
+    在昨天的 Booster 上，用最新 INCREMENTAL_WINDOW_DAYS 天的比賽追加 INCREMENTAL_ROUNDS 棵樹。
+    近期資料最後 INCREMENTAL_HOLDOUT 比例不參與訓練：增量模型與上次完整重訓的模型都在這段上重新評分。
+    回傳 (ensembles, metrics, baseline, 驗證場數)；近期比賽太少時回傳 None。
+    """
+    cutoff = data['gameDateTimeEst_h'].max() - pd.Timedelta(days=INCREMENTAL_WINDOW_DAYS)
+    recent = data[data['gameDateTimeEst_h'] > cutoff]
+    n_holdout = int(len(recent) * INCREMENTAL_HOLDOUT)
+    if n_holdout < INCREMENTAL_MIN_HOLDOUT:
+        print(f"   ⚠️ 最近 {INCREMENTAL_WINDOW_DAYS} 天只有 {len(recent)} 場，不足以做漂移檢查，改做完整重訓")
+        return None
+    recent_fit, recent_holdout = recent.iloc[:-n_holdout], recent.iloc[-n_holdout:]
+    print(f"♻️ 增量訓練: 最近 {INCREMENTAL_WINDOW_DAYS} 天 {len(recent)} 場 (自 {cutoff.date()} 起)，"
+          f"訓練 {len(recent_fit)} 場 / 漂移檢查 {len(recent_holdout)} 場")
     
-    for i in range(n_estimators):
-        # 複製參數並設定不同的 Random Seed
-        model_params = params.copy()
-        model_params['random_state'] = 42 + (i * 10) # 42, 52, 62...
-        
-        model_name = f'xgb_{i}'
-        model = base_estimator(**model_params)
-        estimators.append((model_name, model))
+    ensembles = extend_ensembles(
+        {name: bundle.model(name) for name in ('win', 'spread', 'total')},
+        {
+            'spread': (recent_fit[features_spread], features_spread),
+            'total': (recent_fit[features_total], features_total),
+        },
+        {
+            'win': dict(feature_set='spread', y=recent_fit['target_win'], params=BEST_PARAMS_WIN, kind='classifier'),
+            'spread': dict(feature_set='spread', y=recent_fit['target_margin'], params=BEST_PARAMS_SPREAD, kind='regressor'),
+            'total': dict(feature_set='total', y=recent_fit['target_total'], params=BEST_PARAMS_TOTAL, kind='regressor'),
+        },
+        INCREMENTAL_ROUNDS,
+    )
     
-    if type == 'classifier':
-        # Soft Voting: 平均「機率」而非平均「結果」，通常更準確
-        return VotingClassifier(estimators=estimators, voting='soft', n_jobs=-1)
-    else:
-        # Regressor: 直接平均數值
-        return VotingRegressor(estimators=estimators, n_jobs=-1)
+    metrics = evaluate(ensembles, recent_holdout, features_spread, features_total, label='增量模型')
+    baseline = evaluate(full_refit_models(bundle), recent_holdout, features_spread, features_total, label='上次完整重訓')
+    print(f"   📐 準確率容忍值: {accuracy_tolerance(baseline['win_accuracy'], len(recent_holdout)):.1%} "
+          f"({len(recent_holdout)} 場驗證)")
+    return ensembles, metrics, baseline, len(recent_holdout)
+
+def train_full(train_data, available_features_spread, available_features_total):
+
+    # --- 早停：從訓練區段尾端切出一段時間序驗證 (不動用正式驗證集) ---
+    fit_data, holdout_data = train_data, None
+    if EARLY_STOPPING_ROUNDS > 0:
+        es_idx = int(len(train_data) * (1 - EARLY_STOPPING_HOLDOUT))
+        fit_data, holdout_data = train_data.iloc[:es_idx], train_data.iloc[es_idx:]
+        print(f"⏹️ 啟用早停: patience={EARLY_STOPPING_ROUNDS} 輪, 早停驗證 {len(holdout_data)} 場 (訓練區段最後 {EARLY_STOPPING_HOLDOUT:.0%})")
+    
+    def job(feature_set, target_col, params, kind):
+        spec = dict(feature_set=feature_set, y=fit_data[target_col], params=params, kind=kind)
+        if holdout_data is not None:
+            spec['y_holdout'] = holdout_data[target_col]
+        return spec
+    
+    # --- 平行訓練：3 個目標 × 5 個種子 = 15 個獨立任務 ---
+    print("\n🤖 平行訓練 勝負 / 讓分 / 大小分 集成模型 (Ensemble)...")
+    ensembles = train_ensembles(
+        {
+            'spread': (fit_data[available_features_spread], available_features_spread),
+            'total': (fit_data[available_features_total], available_features_total),
+        },
+        {
+            'win': job('spread', 'target_win', BEST_PARAMS_WIN, 'classifier'),
+            'spread': job('spread', 'target_margin', BEST_PARAMS_SPREAD, 'regressor'),
+            'total': job('total', 'target_total', BEST_PARAMS_TOTAL, 'regressor'),
+        },
+        n_seeds=ENSEMBLE_SIZE,
+        holdout=None if holdout_data is None else {
+            'spread': holdout_data[available_features_spread],
+            'total': holdout_data[available_features_total],
+        },
+        early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+    )
+    
+    return ensembles
 
 def train():
     df = load_and_clean_data()
@@ -248,43 +291,57 @@ def train():
     
     print(f"🚀 使用特徵數量 (Spread): {len(available_features_spread)} (引入多重窗口)")
     
-    # --- 模型 1: 勝負預測 (Ensemble) ---
-    print("\n🤖 訓練模型 1: 勝負預測 (Win/Loss Ensemble)...")
-    # 使用 VotingClassifier 
-    model_win = create_ensemble_model(xgb.XGBClassifier, BEST_PARAMS_WIN, n_estimators=5, type='classifier')
-    model_win.fit(train_data[available_features_spread], train_data['target_win'])
+    # --- 增量訓練 (Warm Start)：沿用昨天的模型，漂移時退回完整重訓 ---
+    if TRAIN_MODE == 'incremental':
+        print("\n♻️ 嘗試增量訓練 (Warm Start)...")
+        bundle = load_previous_bundle(available_features_spread, available_features_total)
+        result = None
+        if bundle is not None:
+            result = train_incremental(bundle, data, available_features_spread, available_features_total)
+        if result is not None:
+            ensembles, metrics, baseline, n_holdout = result
+            drifted = drift_detected(metrics, baseline, n_holdout)
+            if not drifted:
+                manifest = save_bundle(
+                    ensembles,
+                    {'spread': available_features_spread, 'total': available_features_total},
+                    ROLLING_WINDOWS,
+                    extra={
+                        'train_mode': 'incremental',
+                        'full_refit_at': bundle.manifest['full_refit_at'],
+                        'incremental_updates': bundle.manifest.get('incremental_updates', 0) + 1,
+                        'baseline_metrics': bundle.manifest['baseline_metrics'],
+                        'full_refit_trees': bundle.manifest.get('full_refit_trees'),
+                        'metrics': metrics,
+                        'drift_baseline': baseline,
+                        'early_stopping_rounds': bundle.manifest.get('early_stopping_rounds', 0),
+                    },
+                )
+                print(f"   📦 已寫入模型包: {BUNDLE_PATH} (增量第 {manifest['incremental_updates']} 次，schema: {manifest['schema_hash'][:12]})")
+                print("\n💾 V8.0 (Ensemble) 增量訓練完成！所有系統已就緒。")
+                return
+            print(f"   🚨 偵測到模型退化 ({', '.join(drifted)})，改做完整重訓")
     
-    acc = accuracy_score(test_data['target_win'], model_win.predict(test_data[available_features_spread]))
-    print(f"   🎯 最終回測準確度: {acc*100:.2f}% (Ensemble)")
-    
-    # --- 模型 2: 讓分預測 (Ensemble) ---
-    print("\n🤖 訓練模型 2: 讓分預測 (Spread Margin Ensemble)...")
-    # 使用 VotingRegressor
-    model_spread = create_ensemble_model(xgb.XGBRegressor, BEST_PARAMS_SPREAD, n_estimators=5, type='regressor')
-    model_spread.fit(train_data[available_features_spread], train_data['target_margin'])
-    
-    mae = mean_absolute_error(test_data['target_margin'], model_spread.predict(test_data[available_features_spread]))
-    print(f"   📏 平均誤差 (MAE): {mae:.2f} 分 (Ensemble)")
-    
-    # --- 模型 3: 大小分預測 (Ensemble) ---
-    print("\n🤖 訓練模型 3: 大小分預測 (Total Points Ensemble)...")
-    model_total = create_ensemble_model(xgb.XGBRegressor, BEST_PARAMS_TOTAL, n_estimators=5, type='regressor')
-    model_total.fit(train_data[available_features_total], train_data['target_total'])
-    
-    mae = mean_absolute_error(test_data['target_total'], model_total.predict(test_data[available_features_total]))
-    print(f"   📏 平均誤差 (MAE): {mae:.2f} 分 (Ensemble)")
+    ensembles = train_full(train_data, available_features_spread, available_features_total)
+    metrics = evaluate(ensembles, test_data, available_features_spread, available_features_total)
     
     # --- 儲存 ---
-    # VotingClassifier/Regressor 是一個標準的 sklearn 物件，可以直接 pickle
-    # aggregate_picks.py 載入後呼叫 .predict() 行為跟單一模型一模一樣
-    joblib.dump(model_win, 'model_win.pkl')
-    joblib.dump(model_spread, 'model_spread.pkl')
-    joblib.dump(model_total, 'model_total.pkl')
-    joblib.dump(available_features_spread, 'features_spread.pkl')
-    joblib.dump(available_features_total, 'features_total.pkl')
-    
-    # 新增：儲存窗口設定
-    joblib.dump(ROLLING_WINDOWS, 'rolling_config.pkl') 
+    # 底層 Booster 連同特徵列表 / 窗口設定寫入單一模型包
+    manifest = save_bundle(
+        ensembles,
+        {'spread': available_features_spread, 'total': available_features_total},
+        ROLLING_WINDOWS,
+        extra={
+            'train_mode': 'full',
+            'full_refit_at': datetime.utcnow().isoformat(),
+            'incremental_updates': 0,
+            'baseline_metrics': metrics,
+            'full_refit_trees': {name: [b.num_boosted_rounds() for b in ens.boosters] for name, ens in ensembles.items()},
+            'metrics': metrics,
+            'early_stopping_rounds': EARLY_STOPPING_ROUNDS,
+        },
+    )
+    print(f"   📦 已寫入模型包: {BUNDLE_PATH} (schema: {manifest['schema_hash'][:12]})")
     
     print("\n💾 V8.0 (Ensemble) 模型訓練完成！所有系統已就緒。")
 
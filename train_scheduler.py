@@ -0,0 +1,177 @@
+import os
+import time
+import shutil
+import tempfile
+import multiprocessing as mp
+import numpy as np
+import xgboost as xgb
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from ensemble_predictor import BoosterEnsemble
+from feature_matrix import get_matrix, fit_booster
+
+# ==========================================
+# 平行訓練排程器
+# 3 個目標 × 5 個種子 = 15 個 Booster 當作獨立任務丟進 process pool，
+# 特徵矩陣只寫一次到磁碟 (memmap)，各 worker 唯讀共用，不需 pickle 複製
+# ==========================================
+ENSEMBLE_SIZE = 5
+
+# worker 內的 memmap 快取 (每個 process 各自只開一次)
+_worker_arrays = {}
+
+
+def seed_for(i):
+    """與舊版 create_ensemble_model 相同的種子序列：42, 52, 62..."""
+    return 42 + (i * 10)
+
+
+def shared_dir():
+    # Linux 上優先放 /dev/shm (tmpfs)，memmap 等同共享記憶體
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else None
+    return tempfile.mkdtemp(prefix='nba_train_', dir=base)
+
+
+def _load_shared(path):
+    if path not in _worker_arrays:
+        _worker_arrays[path] = np.load(path, mmap_mode='r')
+    return _worker_arrays[path]
+
+
+def _fit_booster(task):
+    """
+    worker：訓練單一種子的 XGBoost，回傳原生 UBJSON bytes。
+    同一個 worker 內，相同特徵集合的 QuantileDMatrix 只建立一次 (跨種子 / 目標共用)。
+    """
+    start = time.perf_counter()
+    X = _load_shared(task['X_path'])
+    y = _load_shared(task['y_path'])
+
+    dtrain = get_matrix(task['feature_set'], 'train', X)
+    params = dict(task['params'], random_state=task['seed'], n_jobs=task['n_jobs'])
+
+    rounds = task.get('early_stopping_rounds')
+    if rounds:
+        # 早停：用訓練區段尾端 (時間序) 當驗證，只保留到最佳輪數的樹
+        params.setdefault('eval_metric', 'logloss' if task['kind'] == 'classifier' else 'mae')
+        dholdout = get_matrix(task['feature_set'], 'holdout', _load_shared(task['X_holdout_path']), ref=dtrain)
+        dholdout.set_label(np.asarray(_load_shared(task['y_holdout_path']), dtype=np.float32))
+        booster = fit_booster(params, task['kind'], dtrain, y, evals=[(dholdout, 'holdout')],
+                              early_stopping_rounds=rounds, verbose_eval=False)
+        best = booster.best_iteration
+        booster = booster[:best + 1]
+        booster.set_attr(best_iteration=str(best))
+    else:
+        booster = fit_booster(params, task['kind'], dtrain, y)
+
+    raw = bytes(booster.save_raw('ubj'))
+    return task['target'], task['index'], raw, start, time.perf_counter()
+
+
+def train_ensembles(feature_sets, jobs, n_seeds=ENSEMBLE_SIZE, max_workers=None,
+                    holdout=None, early_stopping_rounds=0):
+    """
+    feature_sets: {'spread': (X, feature_names), 'total': (X, feature_names)}
+    jobs:         {'win': dict(feature_set='spread', y=..., params=..., kind='classifier'), ...}
+    holdout:      早停用 {'spread': X_holdout, ...}，jobs 內需附 y_holdout
+    回傳 {'win': BoosterEnsemble, ...}，並印出各目標的實際耗時 (wall time)。
+    """
+    early_stopping_rounds = early_stopping_rounds if holdout else 0
+    n_tasks = len(jobs) * n_seeds
+    cpus = os.cpu_count() or 1
+    max_workers = max_workers or min(cpus, n_tasks)
+    threads_per_task = max(1, cpus // max_workers)
+
+    shared = shared_dir()
+    try:
+        # 1. 特徵矩陣 / 標籤只寫一次 (float32 連續記憶體)
+        X_paths = {}
+        for set_name, (X, _) in feature_sets.items():
+            X_paths[set_name] = os.path.join(shared, f'X_{set_name}.npy')
+            np.save(X_paths[set_name], np.ascontiguousarray(X, dtype=np.float32))
+            if early_stopping_rounds:
+                np.save(os.path.join(shared, f'X_{set_name}_holdout.npy'),
+                        np.ascontiguousarray(holdout[set_name], dtype=np.float32))
+
+        tasks = []
+        for target, job in jobs.items():
+            y_path = os.path.join(shared, f'y_{target}.npy')
+            np.save(y_path, np.asarray(job['y']))
+            extra = {}
+            if early_stopping_rounds:
+                extra = {
+                    'early_stopping_rounds': early_stopping_rounds,
+                    'X_holdout_path': os.path.join(shared, f"X_{job['feature_set']}_holdout.npy"),
+                    'y_holdout_path': os.path.join(shared, f'y_{target}_holdout.npy'),
+                }
+                np.save(extra['y_holdout_path'], np.asarray(job['y_holdout']))
+            for i in range(n_seeds):
+                tasks.append({
+                    'target': target, 'index': i, 'seed': seed_for(i), 'kind': job['kind'],
+                    'params': job['params'], 'n_jobs': threads_per_task, 'feature_set': job['feature_set'],
+                    'X_path': X_paths[job['feature_set']], 'y_path': y_path, **extra,
+                })
+
+        print(f"   🧬 平行訓練 {n_tasks} 個 Booster ({len(jobs)} 目標 × {n_seeds} 種子) | "
+              f"workers={max_workers}, 每任務 threads={threads_per_task}")
+
+        # 2. 平行訓練
+        raws = {target: [None] * n_seeds for target in jobs}
+        spans = {target: [] for target in jobs}
+        wall_start = time.perf_counter()
+        # spawn：主程序可能已跑過 xgboost (增量訓練失敗退回完整重訓時)，
+        # fork 已啟動的 OpenMP 執行緒池可能卡死；worker 只讀 memmap，不需要繼承任何狀態
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp.get_context('spawn')) as pool:
+            futures = [pool.submit(_fit_booster, t) for t in tasks]
+            for future in as_completed(futures):
+                target, i, raw, start, end = future.result()
+                raws[target][i] = raw
+                spans[target].append((start, end))
+        print(f"   ⏱️ 全部完成: {time.perf_counter() - wall_start:.1f}s")
+    finally:
+        shutil.rmtree(shared, ignore_errors=True)
+
+    # 3. 組回集成模型
+    ensembles = {}
+    for target, job in jobs.items():
+        feature_names = feature_sets[job['feature_set']][1]
+        boosters = []
+        for raw in raws[target]:
+            booster = xgb.Booster()
+            booster.load_model(bytearray(raw))
+            booster.feature_names = list(feature_names)
+            boosters.append(booster)
+
+        classes = np.unique(job['y']) if job['kind'] == 'classifier' else None
+        ensembles[target] = BoosterEnsemble(boosters, kind=job['kind'], classes=classes, feature_names=feature_names)
+
+        wall = max(e for _, e in spans[target]) - min(s for s, _ in spans[target])
+        print(f"   ⏱️ [{target}] wall time: {wall:.1f}s")
+        if early_stopping_rounds:
+            trees = [b.num_boosted_rounds() for b in boosters]
+            print(f"   ✂️ [{target}] 早停後樹數: {trees} (原設定 {job['params'].get('n_estimators', 100)})")
+
+    return ensembles
+
+
+def extend_ensembles(ensembles, feature_sets, jobs, extra_rounds):
+    """
+    Warm start：在既有集成模型的每個 Booster 上再追加 extra_rounds 棵樹 (同一組種子)。
+    feature_sets / jobs 格式同 train_ensembles，通常只放最近一段時間的資料。
+    舊的 Booster 不會被修改，回傳新的 {'win': BoosterEnsemble, ...}。
+    """
+    start = time.perf_counter()
+    extended = {}
+    for target, job in jobs.items():
+        X, feature_names = feature_sets[job['feature_set']]
+        dtrain = get_matrix(job['feature_set'], 'recent', X, feature_names=list(feature_names))
+        old = ensembles[target]
+        boosters = []
+        for i, booster in enumerate(old.boosters):
+            params = dict(job['params'], n_estimators=extra_rounds, random_state=seed_for(i), n_jobs=os.cpu_count() or 1)
+            new = fit_booster(params, job['kind'], dtrain, job['y'], xgb_model=booster)
+            new.set_attr(best_iteration=None)  # 追加後舊的早停輪數已不適用
+            new.feature_names = list(feature_names)
+            boosters.append(new)
+        extended[target] = BoosterEnsemble(boosters, kind=old.kind, classes=old.classes_, feature_names=feature_names)
+    print(f"   ♻️ Warm start: 每個 Booster 追加 {extra_rounds} 棵樹 ({len(X)} 場近期資料): {time.perf_counter() - start:.1f}s")
+    return extended
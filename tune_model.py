@@ -1,10 +1,24 @@
+import os
+import time
+import functools
+import multiprocessing as mp
 import optuna
-import xgboost as xgb
 import numpy as np
 import pandas as pd
+import xgboost as xgb
 from sklearn.metrics import accuracy_score, mean_absolute_error
 # 確保這裡 import 的是 train_model，且 train_model.py 內容已經是 V8.0 版本
 from train_model import load_and_clean_data, prepare_training_data, TRAIN_FEATURES_SPREAD, TRAIN_FEATURES_TOTAL
+from feature_matrix import get_matrix, fit_booster, data_fingerprint
+
+# ==========================================
+# 調優設定 (可用環境變數覆寫)
+# 研究結果存放在本地 SQLite，中斷後重跑會接續既有的 trial
+# ==========================================
+N_TRIALS = int(os.environ.get("TUNE_TRIALS", 50))              # 每個研究的總 trial 數 (含已剪枝)
+N_WORKERS = int(os.environ.get("TUNE_WORKERS", os.cpu_count() or 1))
+STORAGE = os.environ.get("TUNE_STORAGE", "sqlite:///optuna_studies.db")
+STUDY_PREFIX = os.environ.get("TUNE_STUDY_PREFIX", "nba")
 
 # 讀取一次資料即可，不用重複讀取
 print("📂 [Tuning] 讀取資料中...")
@@ -29,13 +43,55 @@ test_data = data.iloc[split_idx:]
 
 print(f"📊 訓練集: {len(train_data)}, 驗證集: {len(test_data)}")
 
+# 特徵集合名稱 -> 特徵列表 (同一集合的量化矩陣在所有 trial / 目標間共用)
+FEATURE_SETS = {'spread': FEATURES_SPREAD, 'total': FEATURES_TOTAL}
+# 資料指紋只算一次，之後每個 trial 不用再切 DataFrame 就能確認快取的矩陣可沿用
+FINGERPRINTS = {
+    (name, split): data_fingerprint(part[features])
+    for name, features in FEATURE_SETS.items()
+    for split, part in (('train', train_data), ('valid', test_data))
+}
+
+def get_train_valid(feature_set):
+    """
+    取得共用的 (訓練, 驗證) QuantileDMatrix 與這次取得所花的時間。
+    只有第一個 trial 需要真正建立，之後的 trial 幾乎是 0 秒。
+    """
+    start = time.perf_counter()
+    features = FEATURE_SETS[feature_set]
+    dtrain = get_matrix(feature_set, 'train', lambda: train_data[features],
+                        fingerprint=FINGERPRINTS[(feature_set, 'train')])
+    dvalid = get_matrix(feature_set, 'valid', lambda: test_data[features], ref=dtrain,
+                        fingerprint=FINGERPRINTS[(feature_set, 'valid')])
+    return dtrain, dvalid, time.perf_counter() - start
+
+class PruningCallback(xgb.callback.TrainingCallback):
+    """
+    每一輪 boosting 後把驗證分數回報給 Optuna，
+    表現明顯落後中位數的 trial 直接剪枝，不用把 1000 棵樹跑完。
+    """
+
+    def __init__(self, trial, metric, transform=None):
+        self.trial = trial
+        self.metric = metric
+        self.transform = transform
+
+    def after_iteration(self, model, epoch, evals_log):
+        score = evals_log['valid'][self.metric][-1]
+        if self.transform is not None:
+            score = self.transform(score)
+        self.trial.report(score, epoch)
+        if self.trial.should_prune():
+            raise optuna.TrialPruned(f"第 {epoch} 輪剪枝 ({self.metric}={score:.4f})")
+        return False
+
 # ==========================================
 # 1. 調優目標：勝負預測 (Maximize Accuracy)
 # ==========================================
 def objective_win(trial):
     # 定義參數搜尋空間
     param = {
-        'eval_metric': 'logloss',
+        'eval_metric': ['logloss', 'error'],  # error 只用來逐輪回報準確率 (剪枝用)
         'booster': 'gbtree',
         # 移除 'use_label_encoder': False 以消除警告
         # 關鍵參數
@@ -48,16 +104,19 @@ def objective_win(trial):
         'reg_alpha': trial.suggest_float('reg_alpha', 0, 10),
         'reg_lambda': trial.suggest_float('reg_lambda', 0, 10),
         'missing': np.nan,
-        'n_jobs': -1 # 加速訓練
+        'n_jobs': _threads_per_trial() # 多個 worker 平分 CPU
     }
 
-    model = xgb.XGBClassifier(**param)
-    
-    # 訓練 (使用過濾後的特徵列表 FEATURES_SPREAD)
-    model.fit(train_data[FEATURES_SPREAD], train_data['target_win'])
+    # 訓練 (使用共用的 FEATURES_SPREAD 量化矩陣，不再每個 trial 重建)
+    dtrain, dvalid, setup_s = get_train_valid('spread')
+    trial.set_user_attr('matrix_setup_s', setup_s)
+    dvalid.set_label(test_data['target_win'].to_numpy(dtype=np.float32))
+    pruning = PruningCallback(trial, 'error', transform=lambda err: 1 - err)
+    booster = fit_booster(param, 'classifier', dtrain, train_data['target_win'],
+                          evals=[(dvalid, 'valid')], verbose_eval=False, callbacks=[pruning])
     
-    # 預測
-    preds = model.predict(test_data[FEATURES_SPREAD])
+    # 預測 (機率 > 0.5 視為主隊勝，與 XGBClassifier.predict 相同)
+    preds = (booster.predict(dvalid) > 0.5).astype(int)
     accuracy = accuracy_score(test_data['target_win'], preds)
     
     return accuracy
@@ -65,9 +124,10 @@ def objective_win(trial):
 # ==========================================
 # 2. 調優目標：讓分/大小 (Minimize MAE)
 # ==========================================
-def objective_reg(trial, target_col, features):
+def objective_reg(trial, target_col, feature_set):
     param = {
         'objective': 'reg:squarederror',
+        'eval_metric': 'mae',  # 只用來逐輪回報 (剪枝用)，不影響訓練
         'booster': 'gbtree',
         'n_estimators': trial.suggest_int('n_estimators', 100, 1000),
         'max_depth': trial.suggest_int('max_depth', 3, 10),
@@ -78,44 +138,107 @@ def objective_reg(trial, target_col, features):
         'reg_alpha': trial.suggest_float('reg_alpha', 0, 10),
         'reg_lambda': trial.suggest_float('reg_lambda', 0, 10),
         'missing': np.nan,
-        'n_jobs': -1 # 加速訓練
+        'n_jobs': _threads_per_trial() # 多個 worker 平分 CPU
     }
     
-    model = xgb.XGBRegressor(**param)
-    # 訓練
-    model.fit(train_data[features], train_data[target_col])
+    # 訓練 (共用量化矩陣，只換標籤)
+    dtrain, dvalid, setup_s = get_train_valid(feature_set)
+    trial.set_user_attr('matrix_setup_s', setup_s)
+    dvalid.set_label(test_data[target_col].to_numpy(dtype=np.float32))
+    pruning = PruningCallback(trial, 'mae')
+    booster = fit_booster(param, 'regressor', dtrain, train_data[target_col],
+                          evals=[(dvalid, 'valid')], verbose_eval=False, callbacks=[pruning])
     
     # 預測
-    preds = model.predict(test_data[features])
+    preds = booster.predict(dvalid)
     mae = mean_absolute_error(test_data[target_col], preds)
     
     return mae
 
+# ==========================================
+# 3. 平行 + 可續跑的研究執行
+# ==========================================
+def _threads_per_trial():
+    return max(1, (os.cpu_count() or 1) // max(1, N_WORKERS))
+
+def load_study(name, direction):
+    """從 SQLite 載入 (或建立) 研究；已完成的 trial 會保留，重跑時接續。"""
+    # heartbeat：被中斷而卡在 RUNNING 的 trial，下次啟動時會被標記為 FAIL，不會佔用名額
+    storage = optuna.storages.RDBStorage(STORAGE, heartbeat_interval=60, grace_period=180)
+    return optuna.create_study(
+        study_name=f"{STUDY_PREFIX}_{name}", storage=storage, direction=direction, load_if_exists=True,
+        pruner=optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=50),
+    )
+
+def _optimize_worker(name, direction, objective, n_trials):
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    study = load_study(name, direction)
+    # 每個 worker 只跑分配到的 n_trials 個，加總剛好補滿 N_TRIALS
+    # (MaxTrialsCallback 只在 trial 結束後檢查，多個 worker 同時跑會多出最多 workers-1 個，這裡只當保險)
+    stop = optuna.study.MaxTrialsCallback(
+        N_TRIALS, states=(optuna.trial.TrialState.COMPLETE, optuna.trial.TrialState.PRUNED)
+    )
+    study.optimize(objective, n_trials=n_trials, callbacks=[stop])
+
+def run_study(name, direction, objective, feature_set):
+    study = load_study(name, direction)
+    done = len(study.get_trials(deepcopy=False, states=(optuna.trial.TrialState.COMPLETE, optuna.trial.TrialState.PRUNED)))
+    if done >= N_TRIALS:
+        print(f"   ⏭️ 已有 {done} 個 trial，直接沿用結果")
+        return study
+
+    # 主程序已開過 SQLite 連線 (SQLAlchemy engine)，xgboost 的 OpenMP 執行緒也可能已啟動，
+    # fork 之後共用會卡死 / 弄壞連線：worker 一律用 spawn 重新啟動，
+    # 各自讀資料、建量化矩陣 (只在第一個 trial 建一次) 與開自己的 storage 連線
+    workers = max(1, min(N_WORKERS, N_TRIALS - done))
+    print(f"   🧵 {workers} 個 worker 平行執行 (已完成 {done}/{N_TRIALS}，儲存於 {STORAGE})")
+    ctx = mp.get_context('spawn')
+    base, extra = divmod(N_TRIALS - done, workers)
+    procs = [ctx.Process(target=_optimize_worker, args=(name, direction, objective, base + (i < extra)))
+             for i in range(workers)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+    failed = [p.exitcode for p in procs if p.exitcode != 0]
+    if failed:
+        raise RuntimeError(f"❌ [{name}] {len(failed)}/{workers} 個 worker 異常結束 (exit code: {failed})，"
+                           f"已完成的 trial 仍保存在 {STORAGE}，修正後重跑即可接續")
+
+    study = load_study(name, direction)
+    pruned = len(study.get_trials(deepcopy=False, states=(optuna.trial.TrialState.PRUNED,)))
+    print(f"   ✂️ 剪枝 {pruned}/{len(study.trials)} 個 trial")
+    return study
+
 if __name__ == "__main__":
     # 設定 Optuna 顯示層級
     optuna.logging.set_verbosity(optuna.logging.WARNING)
 
     print("\n🔍 開始尋找 [勝負預測] 的黃金參數...")
-    study_win = optuna.create_study(direction='maximize')
-    study_win.optimize(objective_win, n_trials=50) 
+    study_win = run_study('win', 'maximize', objective_win, 'spread')
     print(f"   👉 Best Accuracy: {study_win.best_value:.4f}")
     
     print("\n🔍 開始尋找 [讓分預測] 的黃金參數...")
-    study_spread = optuna.create_study(direction='minimize')
     # 使用過濾後的特徵 FEATURES_SPREAD
-    study_spread.optimize(lambda trial: objective_reg(trial, 'target_margin', FEATURES_SPREAD), n_trials=50)
+    study_spread = run_study('spread', 'minimize', functools.partial(objective_reg, target_col='target_margin', feature_set='spread'), 'spread')
     print(f"   👉 Best MAE: {study_spread.best_value:.4f}")
 
     print("\n🔍 開始尋找 [大小分預測] 的黃金參數...")
-    study_total = optuna.create_study(direction='minimize')
     # 使用過濾後的特徵 FEATURES_TOTAL
-    study_total.optimize(lambda trial: objective_reg(trial, 'target_total', FEATURES_TOTAL), n_trials=50)
+    study_total = run_study('total', 'minimize', functools.partial(objective_reg, target_col='target_total', feature_set='total'), 'total')
     print(f"   👉 Best MAE: {study_total.best_value:.4f}")
     
     print("\n" + "="*50)
     print("🏆 調優結果報告 (請將這些參數填回 train_model.py)")
     print("="*50)
     
+    for name, study in (('Win', study_win), ('Spread', study_spread), ('Total', study_total)):
+        setups = [t.user_attrs.get('matrix_setup_s', 0) for t in study.trials if 'matrix_setup_s' in t.user_attrs]
+        if not setups:
+            continue
+        print(f"🧱 [{name}] 矩陣準備時間: 第一個 trial {setups[0]:.2f}s，之後平均 {np.mean(setups[1:] or [0]):.4f}s / trial")
+    
     print("\n🤖 [Win Model] Best Accuracy:", study_win.best_value)
     print("Best Params:", study_win.best_params)
     